@@ -2,6 +2,13 @@
 Methods for generating mask matrices, with 1 entries indicating observed and 0
 indicating unobserved.
 Provide methods for single mask matrices, and cross-validation folds.
+
+The cross-validation folds, and the splits of generate_M_rows() and
+generate_M_columns(), are returned as IndexMask objects, which store the
+row and column indices of the 1 entries rather than a dense I by J matrix.
+They can be passed to the models and cross-validation classes instead of a
+mask matrix: numpy.nonzero(M), M.shape, M.sum(axis) and M.T work directly on
+the indices, and numpy.array(M) materialises the dense mask.
 """
 
 import numpy
@@ -16,6 +23,42 @@ def nonzero_indices(M):
     return zip(indices_row, indices_column)
     
 
+def shuffled_indices(M):
+    ''' Return two arrays, with the row and column indices of the nonzero 
+        entries in M, in a random order. '''
+    indices_row, indices_column = numpy.nonzero(M)
+    permutation = numpy.random.permutation(len(indices_row))
+    return indices_row[permutation], indices_column[permutation]
+
+def masks_from_folds(M, indices_row, indices_column, folds):
+    ''' Given the fold number (or -1 if in no test fold) of each entry, return
+        a tuple (Ms_train, Ms_test) of lists of IndexMask objects. '''
+    Ms_train, Ms_test = [], []
+    for fold in range(folds.max()+1):
+        M_train, M_test = masks_from_fold(M.shape, indices_row, indices_column, folds, fold)
+        Ms_train.append(M_train), Ms_test.append(M_test)
+    return (Ms_train, Ms_test)
+
+def masks_from_fold(shape, indices_row, indices_column, folds, fold):
+    ''' Return the IndexMask objects (M_train, M_test) of fold number :fold. 
+        Entries with a fold number below -1 are in neither mask. '''
+    in_fold, in_train = (folds == fold), (folds != fold) & (folds >= -1)
+    M_test = IndexMask(shape, indices_row[in_fold], indices_column[in_fold])
+    M_train = IndexMask(shape, indices_row[in_train], indices_column[in_train])
+    return (M_train, M_test)
+
+def folds_from_masks(M, Ms_test):
+    ''' Inverse of masks_from_folds(): return the fold number of each entry of
+        M, in the order of numpy.nonzero(M), or -1 if it is in no test mask. '''
+    indices_row, indices_column = numpy.nonzero(M)
+    J = M.shape[1]
+    flat = indices_row.astype(numpy.int64) * J + indices_column
+    folds = -numpy.ones(len(flat), dtype=numpy.int16)
+    for fold, M_test in enumerate(Ms_test):
+        indices_row_test, indices_column_test = numpy.nonzero(M_test)
+        folds[numpy.searchsorted(flat, indices_row_test.astype(numpy.int64) * J + indices_column_test)] = fold
+    return folds
+
 def check_empty_rows_columns(M):
     ''' Return True if all rows and columns have at least one observation. '''
     sums_columns = M.sum(axis=0)
@@ -31,6 +74,49 @@ def check_empty_rows_columns(M):
     return True
     
     
+''' Index masks. '''
+class IndexMask(object):
+    ''' Mask matrix of the given shape, with 1 entries at (indices_row[n],
+        indices_column[n]). The indices are stored in row-major order, the
+        same order as numpy.nonzero of the dense mask. If :is_sorted, the
+        indices are already in that order, and we keep the arrays as they are
+        (e.g. memory-mapped arrays) rather than copying them. '''
+    def __init__(self, shape, indices_row, indices_column, is_sorted=False):
+        self.shape = tuple(shape)
+        if is_sorted:
+            self.indices_row, self.indices_column = indices_row, indices_column
+            return
+        flat = numpy.sort(numpy.asarray(indices_row, dtype=numpy.int64) * self.shape[1] + indices_column)
+        self.indices_row = (flat // self.shape[1]).astype(numpy.int32)
+        self.indices_column = (flat % self.shape[1]).astype(numpy.int32)
+
+    def nonzero(self):
+        ''' Return the row and column indices of the 1 entries. '''
+        return (self.indices_row, self.indices_column)
+
+    def sum(self, axis=None):
+        ''' Return the number of 1 entries, or per column (axis=0) or row (axis=1). '''
+        if axis is None:
+            return float(len(self.indices_row))
+        indices, length = (self.indices_column, self.shape[1]) if axis == 0 else (self.indices_row, self.shape[0])
+        return numpy.bincount(indices, minlength=length).astype(float)
+
+    @property
+    def T(self):
+        ''' Return the transposed mask. '''
+        return IndexMask((self.shape[1], self.shape[0]), self.indices_column, self.indices_row)
+
+    def toarray(self):
+        ''' Return the dense mask matrix. '''
+        M = numpy.zeros(self.shape)
+        M[self.indices_row, self.indices_column] = 1.
+        return M
+
+    def __array__(self, dtype=None):
+        M = self.toarray()
+        return M if dtype is None else M.astype(dtype)
+
+
 ''' Generating methods. '''
 def generate_M(I,J,fraction,M=None):
     ''' Generate a mask matrix M_train with :fraction missing entries. 
@@ -73,23 +159,11 @@ def compute_folds(I,J,no_folds,M=None):
     if M is None:
         M = numpy.ones((I,J))
         
-    no_elements = M.sum()
-    indices = nonzero_indices(M)
-    
-    random.shuffle(indices)
-    split_places = [int(i*no_elements/no_folds) for i in range(0,no_folds+1)] #find the indices where the next fold start
-    split_indices = [indices[split_places[i]:split_places[i+1]] for i in range(0,no_folds)] #split the indices list into the folds
-    
-    Ms_train, Ms_test = [], [] # list of the M's for the different folds
-    for indices in split_indices:
-        M_test = numpy.zeros(M.shape)
-        for i,j in indices:
-            M_test[i,j] = 1
-        M_train = M - M_test
-        Ms_train.append(M_train)
-        Ms_test.append(M_test)
-        
-    return (Ms_train, Ms_test)
+    # Shuffle the entries, and split them in order (fold n starts at entry int(n*no_elements/no_folds))
+    indices_row, indices_column = shuffled_indices(M)
+    no_elements = len(indices_row)
+    folds = numpy.arange(no_elements) * no_folds // no_elements
+    return masks_from_folds(M, indices_row, indices_column, folds)
     
 
 def compute_folds_attempts(I,J,no_folds,attempts,M=None):
@@ -116,18 +190,12 @@ def compute_folds_stratify_rows(I,J,no_folds,M=None):
         M = numpy.ones((I,J))
 
     # Use skikit-learn stratified folds, using the row index as the labels
-    indices = nonzero_indices(M)
-    labels = [ind[0] for ind in indices]
-    skf = StratifiedKFold(labels, no_folds, shuffle=True)
-    Ms_train, Ms_test = [], []
-    for _, test in skf:
-        M_test = numpy.zeros(M.shape)
-        for label_index in test:
-            i,j = indices[label_index]
-            M_test[i,j] = 1.
-        M_train = M - M_test
-        Ms_train.append(M_train), Ms_test.append(M_test)
-    return Ms_train, Ms_test
+    indices_row, indices_column = numpy.nonzero(M)
+    folds = -numpy.ones(len(indices_row), dtype=int)
+    skf = StratifiedKFold(indices_row, no_folds, shuffle=True)
+    for fold, (_, test) in enumerate(skf):
+        folds[test] = fold
+    return masks_from_folds(M, indices_row, indices_column, folds)
     
 
 def compute_folds_stratify_rows_attempts(I,J,no_folds,attempts,M=None):
@@ -165,6 +233,71 @@ def compute_folds_stratify_columns_attempts(I,J,no_folds,attempts,M=None):
     assert False, "Failed to generate folds for training and test data, %s attempts." % attempts
 
 
+''' Methods for computing folds constructively, guaranteeing that each row and
+    column of M_train has at least one observed entry, without retrying. 
+    We shuffle the observed entries, reserve one entry per row and one per 
+    column (at most I+J entries) for training in all folds, and split the rest
+    into the folds. This takes a single pass, O(|Omega|).
+    The reserved entries are never in a test fold. We need at least :no_folds
+    remaining entries, so that no test fold is empty. '''
+def reserve_rows(I, indices_row):
+    ''' Return a boolean vector, marking one of the given entries for each row.
+        numpy keeps one of the positions assigned to each row - which one does
+        not matter, as the entries are shuffled. '''
+    reserved_row = -numpy.ones(I, dtype=int)
+    reserved_row[indices_row] = numpy.arange(len(indices_row))
+    assert (reserved_row >= 0).all(), "M has a row or column without any observed entries."
+    reserved = numpy.zeros(len(indices_row), dtype=bool)
+    reserved[reserved_row] = True
+    return reserved
+
+def reserve_rows_columns(I, J, indices_row, indices_column):
+    ''' Return a boolean vector, marking one of the given entries for each row
+        and one for each column. '''
+    return reserve_rows(I, indices_row) | reserve_rows(J, indices_column)
+
+def compute_folds_constructive(I,J,no_folds,M=None):
+    ''' Like compute_folds(), but guaranteeing that each row and column of 
+        M_train has at least one observed entry (see above). '''
+    if M is None:
+        M = numpy.ones((I,J))
+    indices_row, indices_column = shuffled_indices(M)
+    reserved = reserve_rows_columns(I, J, indices_row, indices_column)
+    
+    # The remaining entries are already shuffled, so split them in order
+    no_remaining = (~reserved).sum()
+    assert no_remaining >= no_folds, "Only %s entries of M are left after reserving one per row and column, " \
+        "fewer than the %s folds." % (no_remaining, no_folds)
+    folds = -numpy.ones(len(indices_row), dtype=int)
+    folds[~reserved] = numpy.arange(no_remaining) * no_folds // no_remaining
+    return masks_from_folds(M, indices_row, indices_column, folds)
+
+def compute_folds_stratify_rows_constructive(I,J,no_folds,M=None):
+    ''' Like compute_folds_stratify_rows(), but guaranteeing that each row and
+        column of M_train has at least one observed entry (see above). '''
+    if M is None:
+        M = numpy.ones((I,J))
+    indices_row, indices_column = shuffled_indices(M)
+    reserved = reserve_rows_columns(I, J, indices_row, indices_column)
+    
+    # Use skikit-learn stratified folds on the remaining entries, using the row index as the labels
+    remaining = numpy.flatnonzero(~reserved)
+    assert len(remaining) >= no_folds, "Only %s entries of M are left after reserving one per row and column, " \
+        "fewer than the %s folds." % (len(remaining), no_folds)
+    folds = -numpy.ones(len(indices_row), dtype=int)
+    skf = StratifiedKFold(indices_row[remaining], no_folds, shuffle=True)
+    for fold, (_, test) in enumerate(skf):
+        folds[remaining[test]] = fold
+    return masks_from_folds(M, indices_row, indices_column, folds)
+
+def compute_folds_stratify_columns_constructive(I,J,no_folds,M=None):
+    ''' Same as compute_folds_stratify_rows_constructive() but now stratify by column. '''
+    Ms_train_T, Ms_test_T = compute_folds_stratify_rows_constructive(
+        I=J, J=I, no_folds=no_folds, M=M.T if M is not None else None)
+    Ms_train, Ms_test = [M_train.T for M_train in Ms_train_T], [M_test.T for M_test in Ms_test_T]
+    return (Ms_train, Ms_test)
+
+
 ''' Methods for computing stratified folds, that also check whether a nested 
     fold generation is possible. '''
 def compute_folds_stratify_rows_nested(I, J, no_folds, attempts, attempts_nested, M=None):
@@ -201,36 +334,26 @@ def compute_folds_stratify_columns_nested(I, J, no_folds, attempts, attempts_nes
 def generate_M_rows(I, J, fraction, M=None):
     ''' Generate a mask matrix M_train with :fraction missing entries, and at
         least one entry in each row.
-        If :M is defined, use only those 1-entries. '''
+        If :M is defined, use only those 1-entries. 
+        Return a tuple (M_train, M_test) of IndexMask objects. '''
     if M is None:
         M = numpy.ones((I,J))
-    indices = nonzero_indices(M)
-    no_elements = len(indices)
+    indices_row, indices_column = shuffled_indices(M)
+    no_elements = len(indices_row)
     no_missing_total = I*J - no_elements
     assert no_missing_total < I*J*fraction, "Specified %s fraction missing, so %s entries missing, but there are already %s missing by default!" % \
         (fraction,I*J*fraction,no_missing_total)
         
-    # First mark one entry of each row as observed, and take them out of indices
-    M_train, M_test = numpy.zeros((I,J)), numpy.zeros((I,J))
-    random.shuffle(indices)
-    for i in range(I):
-        # Use first (ip,j) in indices where ip=i
-        for ip,jp in indices:
-            if ip == i:
-                j = jp
-                break
-        M_train[i,j] = 1.
-        indices.remove((i,j))
+    # First mark one entry of each row as observed, and take them out of the indices
+    reserved = reserve_rows(I, indices_row)
+    remaining = numpy.flatnonzero(~reserved)
     
-    # Shuffle the observed entries, take the first (I*J)*(1-fraction) and mark those as observed
-    random.shuffle(indices)
+    # The remaining entries are still shuffled, take the first (I*J)*(1-fraction) and mark those as observed
     index_last_observed = int(I*J*(1-fraction))
-    
-    for i,j in indices[:index_last_observed]:
-        M_train[i,j] = 1
-    for i,j in indices[index_last_observed:]:
-        M_test[i,j] = 1
-    assert numpy.array_equal(M, M_train+M_test), "Tried splitting M into M_test and M_train but something went wrong."    
+    train = numpy.append(numpy.flatnonzero(reserved), remaining[:index_last_observed])
+    test = remaining[index_last_observed:]
+    M_train = IndexMask((I,J), indices_row[train], indices_column[train])
+    M_test = IndexMask((I,J), indices_row[test], indices_column[test])
     return M_train, M_test
     
 
@@ -16,6 +16,8 @@ We expect the following arguments:
        {'MSE','R2','Rp'} (Mean Square Error, R^2, Pearson correlation coefficient)
 - R, the data matrix.
 - M, a mask matrix with 1 values where entries in X are known, and 0 where they are not.
+  (or an IndexMask - the folds are IndexMasks, so the nested cross-validation
+  passes them on without materialising them).
 - K, the number of folds for cross-validation.
 - parameter_search, a list of dictionaries from parameter names to values, 
     defining the space of our parameter search.
@@ -26,40 +28,52 @@ We expect the following arguments:
     (e.g. burn_in and thinning). This should be a dictionary mapping parameter 
     names to values.
 - file_performance, the location and name of the file in which we store the performances.
+- cache, optionally a ResultCache (see result_cache.py), in which case we skip
+    the folds that were already run with the same parameters and configurations.
 
-For each of the parameter configurations in :parameter_search, we split the
-dataset :R into :K folds (considering only 1 entries in :M), and thus form
-our :K training and test sets. Then for each we train the model using the 
-parameters and training configuration :train_config. The performances are 
+We split the dataset :R into :K folds (considering only 1 entries in :M), and
+thus form our :K training and test sets, which we use for all parameter 
+configurations. For each of the parameter configurations in :parameter_search,
+we train the model on each fold using the parameters and training 
+configuration :train_config. The performances are 
 stored in :file_performance.
 We stratify the folds using the row (if stratify_folds) or column indices.
 
 Methods:
 - Constructor - simply takes in the arguments requires
 - run - no arguments, runs the cross validation and stores the results in the file
+- run_successive_halving - same as run, but drops the worst parameters after a
+    few iterations, and only continues the best ones (keeping one model in 
+    memory at a time)
 - find_best_parameters - takes in the name of the evaluation criterion (e.g. 
     'MSE'), and True if low is better (False if high is better), and returns 
     the best parameters based on that, in a tuple with all the performances.
     Also logs these findings to the file.
 """
 
-from mask import compute_folds_stratify_rows_attempts
-from mask import compute_folds_stratify_columns_attempts
+from mask import compute_folds_stratify_rows_constructive
+from mask import compute_folds_stratify_columns_constructive
+from mask import IndexMask
+from result_cache import run_model_cached
 
+import cPickle
 import numpy
 import json
-
-attempts_generate_M = 100
+import math
+import os
+import shutil
+import tempfile
 
 class MatrixCrossValidation:
-    def __init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance):
+    def __init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance,cache=None):
         self.method = method
         self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M)
+        self.M = M if isinstance(M, IndexMask) else numpy.array(M)
         self.K = K
         self.train_config = train_config
         self.predict_config = predict_config
         self.parameter_search = parameter_search
+        self.cache = cache
         
         self.fout = open(file_performance,'w')
         (self.I,self.J) = self.R.shape
@@ -67,18 +81,19 @@ class MatrixCrossValidation:
         
         self.all_performances = {}      # Performances across all folds - mapping JSON of parameters to a dictionary from evaluation criteria to a list of performances
         self.average_performances = {}  # Average performances across folds - mapping JSON of parameters to a dictionary from evaluation criteria to average performance
-        self.performances = {}          # Average performances per criterion - mapping evaluation criterion to a list of average performances (same size as parameter_search)
+        self.performances = {}          # Average performances per criterion - mapping evaluation criterion to a list of average performances (same size as logged_parameters)
+        self.logged_parameters = []     # The parameters that we logged performances for, in order
         
         
     def run(self, stratify_rows=False):
-        ''' Run the cross-validation. '''
+        ''' Run the cross-validation. We use the same folds for all parameters. '''
+        folds_method = compute_folds_stratify_rows_constructive if stratify_rows else compute_folds_stratify_columns_constructive
+        folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, M=self.M)
+        
         for parameters in self.parameter_search:
             print "Trying parameters %s." % (parameters)
             
             try:
-                folds_method = compute_folds_stratify_rows_attempts if stratify_rows else compute_folds_stratify_columns_attempts
-                folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
-                
                 # We need to put the parameter dict into json to hash it
                 self.all_performances[self.JSON(parameters)] = {}
                 for i,(train,test) in enumerate(zip(folds_training,folds_test)):
@@ -93,11 +108,105 @@ class MatrixCrossValidation:
                 self.fout.flush()
             
             
+    def run_successive_halving(self,stratify_rows=False,min_iterations=10,eta=2,evaluation_criterion='MSE',low_better=True):
+        ''' Run the cross-validation as a successive halving search. We run all
+            parameters for :min_iterations iterations on each fold, keep the 
+            best 1/:eta of them (by the average :evaluation_criterion on the 
+            test folds), run those for :eta times as many iterations in total 
+            (continuing the samplers from their current state), and so on, 
+            until we reach train_config['iterations']. Only the parameters that
+            survive until then are logged and used by find_best_parameters().
+            While the chains are shorter than that, we use a burn-in of at most
+            half of the iterations so far. 
+            We only keep one model in memory at a time: between rounds, we 
+            store the state that continue_run() needs (the attributes set by 
+            initialise() and run(), not R, M, or the cache) in a temporary 
+            folder. The performance of each fold in each round is stored in 
+            the ResultCache, if given; if a model was not stored because the
+            previous round came from the cache, we run it from the start. '''
+        folds_method = compute_folds_stratify_rows_constructive if stratify_rows else compute_folds_stratify_columns_constructive
+        folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, M=self.M)
+        max_iterations = self.train_config['iterations']
+        
+        folder_states = tempfile.mkdtemp(suffix='.halving')
+        try:
+            remaining = range(len(self.parameter_search))
+            iterations_done, iterations = 0, min(min_iterations, max_iterations)
+            while True:
+                predict_config = self.predict_config if iterations == max_iterations else \
+                    dict(self.predict_config, burn_in=min(self.predict_config.get('burn_in',0), iterations/2))
+                train_config = dict(self.train_config, iterations=iterations, successive_halving={'min_iterations':min_iterations,'eta':eta})
+                average_performances = {}
+                for index in list(remaining):
+                    parameters = self.parameter_search[index]
+                    print "Running parameters %s for %s iterations." % (parameters,iterations)
+                    try:
+                        performance_dicts = []
+                        for fold,(train,test) in enumerate(zip(folds_training,folds_test)):
+                            performance_dicts.append(self.run_model_halving(
+                                folder_states,index,fold,train,test,parameters,train_config,predict_config,
+                                iterations_done,keep_state=(iterations < max_iterations)))
+                    except Exception as e:
+                        self.fout.write("Tried parameters %s but got exception: %s. \n" % (parameters,e))
+                        remaining.remove(index)
+                        continue
+                    average_performances[index] = numpy.mean([performance_dict[evaluation_criterion] for performance_dict in performance_dicts])
+                    if iterations == max_iterations:
+                        self.store_outputs(parameters,[(performance_dict,None) for performance_dict in performance_dicts])
+                iterations_done = iterations
+                if iterations == max_iterations:
+                    break
+                    
+                # Keep the best 1/eta of the parameters (those with a NaN performance last)
+                no_keep = int(math.ceil(len(remaining) / float(eta)))
+                ranked = sorted(remaining, key=lambda index: (
+                    numpy.isnan(average_performances[index]), average_performances[index] if low_better else -average_performances[index]))
+                for index in ranked[no_keep:]:
+                    self.fout.write("Stopped parameters %s after %s iterations. Average %s: %s. \n" % (
+                        self.parameter_search[index],iterations,evaluation_criterion,average_performances[index]))
+                    remaining.remove(index)
+                self.fout.flush()
+                iterations = min(iterations * eta, max_iterations)
+        finally:
+            shutil.rmtree(folder_states, ignore_errors=True)
+            
+    def run_model_halving(self,folder_states,index,fold,train,test,parameters,train_config,predict_config,iterations_done,keep_state):
+        ''' Run the model of parameters :index on :fold for train_config['iterations'] 
+            iterations in total - continuing from its stored state after 
+            :iterations_done, if there is one - and return its performance on
+            the test set, or return the cached performance. If :keep_state, 
+            store the new state of the model for the next round. '''
+        fname_state = os.path.join(folder_states, "%s_%s.pkl" % (index,fold))
+        if self.cache is not None:
+            key = self.cache.key(self.method,self.R,train,test,parameters,train_config,predict_config)
+            performance_dict = self.cache.get(key)
+            if performance_dict is not None:
+                # The stored state (if any) is now out of date
+                if os.path.exists(fname_state):
+                    os.remove(fname_state)
+                return performance_dict
+        
+        model = self.method(self.R,train,**parameters)
+        names_constructor = set(model.__dict__)
+        if os.path.exists(fname_state):
+            model.__dict__.update(cPickle.load(open(fname_state,'rb')))
+            model.continue_run(train_config['iterations']-iterations_done)
+        else:
+            model.initialise(train_config['init'])
+            model.run(train_config['iterations'])
+        performance_dict = model.predict(test,**predict_config)
+        
+        if self.cache is not None:
+            self.cache.put(key,performance_dict)
+        if keep_state:
+            # Store only the attributes that were not set by the constructor
+            state = { name:value for (name,value) in model.__dict__.iteritems() if name not in names_constructor }
+            cPickle.dump(state, open(fname_state,'wb'), cPickle.HIGHEST_PROTOCOL)
+        return performance_dict
+        
     def run_model(self,train,test,parameters):
         ''' Initialises and runs the model, and returns the performance on the test set. '''
-        model = self.method(self.R,train,**parameters)
-        model.train(**self.train_config)
-        return model.predict(test,**self.predict_config)
+        return run_model_cached(self.cache,self.method,self.R,train,test,parameters,self.train_config,self.predict_config)
         
     def JSON(self,d):
         ''' Returns the sorted json of the dictionary given. '''
@@ -108,6 +217,22 @@ class MatrixCrossValidation:
                 d_copy[key] = val.tolist()
         return json.dumps(d_copy,sort_keys=True)            
       
+    def store_outputs(self,parameters,outputs):
+        ''' Store and log the outputs of running the folds for the given parameters
+            in parallel, a list of tuples (performance_dict,None), or 
+            (None,message) if the fold raised an Exception. '''
+        exceptions = [exception for (_,exception) in outputs if exception is not None]
+        if exceptions:
+            self.fout.write("Tried parameters %s but got exception: %s. \n" % (parameters,exceptions[0]))
+            self.fout.flush()
+            return
+        
+        # We need to put the parameter dict into json to hash it
+        self.all_performances[self.JSON(parameters)] = {}
+        for performance_dict,_ in outputs:
+            self.store_performances(performance_dict,parameters)
+        self.log(parameters)
+      
     def store_performances(self,performance_dict,parameters):
         ''' Store the performances we get back in a dictionary from criterion name to a list of performances. '''
         for name in performance_dict:
@@ -121,6 +246,7 @@ class MatrixCrossValidation:
         performances = self.all_performances[self.JSON(parameters)]     
         average_performances = { name:(sum(values)/float(len(values))) for (name,values) in performances.iteritems() }
         self.average_performances[self.JSON(parameters)] = average_performances
+        self.logged_parameters.append(parameters)
         
         # Also store a dictionary from evaluation criterion to a list of average performances
         for (name,avr_perf) in average_performances.iteritems():
@@ -135,7 +261,7 @@ class MatrixCrossValidation:
         self.best_performance = min_or_max(self.performances[evaluation_criterion])
         index_best = self.performances[evaluation_criterion].index(self.best_performance)
         
-        self.best_parameters = self.parameter_search[index_best]
+        self.best_parameters = self.logged_parameters[index_best]
         self.best_performances_all = self.average_performances[self.JSON(self.best_parameters)]
         
         self.log_best(index_best)
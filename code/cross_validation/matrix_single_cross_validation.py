@@ -42,19 +42,19 @@ Methods:
     Also logs these findings to the file.
 """
 
-from mask import compute_folds_stratify_rows_attempts
-from mask import compute_folds_stratify_columns_attempts
+from mask import compute_folds_stratify_rows_constructive
+from mask import compute_folds_stratify_columns_constructive
+from mask import IndexMask
 
 import numpy
 
-ATTEMPTS_GENERATE_M = 1000
 METRICS = ['MSE', 'R^2', 'Rp']
 
 class MatrixSingleCrossValidation:
     def __init__(self,method,R,M,K,parameters,train_config,predict_config,file_performance):
         self.method = method
         self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M)
+        self.M = M if isinstance(M, IndexMask) else numpy.array(M)
         self.K = K
         self.parameters = parameters
         self.train_config = train_config
@@ -73,8 +73,8 @@ class MatrixSingleCrossValidation:
         print "Running cross-validation framework."
         
         # Compute the mask matrices
-        folds_method = compute_folds_stratify_rows_attempts if self.I < self.J else compute_folds_stratify_columns_attempts
-        folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=ATTEMPTS_GENERATE_M, M=self.M)
+        folds_method = compute_folds_stratify_rows_constructive if self.I < self.J else compute_folds_stratify_columns_constructive
+        folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, M=self.M)
         
         # Run each fold and store the performances.
         for i,(train,test) in enumerate(zip(folds_training,folds_test)):
@@ -28,6 +28,8 @@ We expect the following arguments:
     overall performances of the nested cross-validations.
 - files_nested_performances, a list of K locations+names of the files in which
     we store the performances of the parameter search cross-validation.
+- cache, optionally a ResultCache (see result_cache.py), in which case we skip
+    the models that were already run with the same parameters and folds.
 
 We split the dataset :R up into :K folds (considering only 1 entries in :M),
 thus forming our :K training and test sets. Then for each we run the regular
@@ -37,7 +39,8 @@ The performances are stored in :file_performance.
 We use the row or column numbers to stratify the splitting of the entries into
 masks. If we have more rows, we use column numbers; and vice versa.
 
-We use the parallel matrix cross-validation module if parallel is True.
+If parallel is True, we run the inner cross-validations of all folds and the
+final models as one graph of tasks on a pool of P workers (see run_parallel).
 We stratify the folds using the row (if stratify_folds) or column indices.
 
 Methods:
@@ -51,27 +54,29 @@ Methods:
 """
 
 from matrix_cross_validation import MatrixCrossValidation
-from parallel_matrix_cross_validation import ParallelMatrixCrossValidation
-from mask import compute_folds_stratify_rows_attempts
-from mask import compute_folds_stratify_columns_attempts
-from mask import compute_folds_stratify_rows_nested
-from mask import compute_folds_stratify_columns_nested
+from parallel_matrix_cross_validation import initialise_worker, train_and_predict
+from mask import compute_folds_stratify_rows_constructive
+from mask import compute_folds_stratify_columns_constructive
+from mask import folds_from_masks
+from mask import IndexMask
+from shared_data import publish_arrays, remove_arrays
+from task_scheduler import TaskScheduler
+from result_cache import run_model_cached
 
 import numpy
 
-attempts_generate_M = 1000
-
 class MatrixNestedCrossValidation:
-    def __init__(self,method,R,M,K,P,parameter_search,train_config,predict_config,file_performance,files_nested_performances):
+    def __init__(self,method,R,M,K,P,parameter_search,train_config,predict_config,file_performance,files_nested_performances,cache=None):
         self.method = method
         self.R = numpy.array(R,dtype=float)
-        self.M = numpy.array(M)
+        self.M = M if isinstance(M, IndexMask) else numpy.array(M)
         self.K = K
         self.P = P
         self.train_config = train_config
         self.predict_config = predict_config
         self.parameter_search = parameter_search
         self.files_nested_performances = files_nested_performances        
+        self.cache = cache
         
         self.fout = open(file_performance,'w')
         (self.I,self.J) = self.R.shape
@@ -83,45 +88,21 @@ class MatrixNestedCrossValidation:
         
     def run(self, parallel=True, stratify_rows=False):
         ''' Run the cross-validation. '''
-        #folds_method = compute_folds_stratify_rows_attempts if stratify_rows else compute_folds_stratify_columns_attempts
-        #folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
-        folds_method = compute_folds_stratify_rows_nested if stratify_rows else compute_folds_stratify_columns_nested
-        folds_training, folds_test = folds_method(
-            I=self.I, J=self.J, no_folds=self.K, M=self.M, 
-            attempts=attempts_generate_M, attempts_nested=attempts_generate_M)
+        # The constructive folds guarantee that each M_train has an entry in each
+        # row and column, so the nested folds can always be generated as well
+        folds_method = compute_folds_stratify_rows_constructive if stratify_rows else compute_folds_stratify_columns_constructive
+        folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, M=self.M)
+        if parallel:
+            self.run_parallel(folds_training, folds_test, folds_method)
+            return
                
         for i,(train,test) in enumerate(zip(folds_training,folds_test)):
             print "Fold %s of nested cross-validation." % (i+1)            
             
             # Run the cross-validation
-            crossval = ParallelMatrixCrossValidation(
-                method=self.method,
-                R=self.R,
-                M=train,
-                K=self.K,
-                parameter_search=self.parameter_search,
-                train_config=self.train_config,
-                predict_config=self.predict_config,
-                file_performance=self.files_nested_performances[i],
-                P=self.P,
-            ) if parallel else MatrixCrossValidation(
-                method=self.method,
-                R=self.R,
-                M=train,
-                K=self.K,
-                parameter_search=self.parameter_search,
-                train_config=self.train_config,
-                predict_config=self.predict_config,
-                file_performance=self.files_nested_performances[i],
-            )
+            crossval = self.inner_cross_validation(i, train)
             crossval.run(stratify_rows=stratify_rows)
-            
-            try:
-                (best_parameters,_) = crossval.find_best_parameters(evaluation_criterion='MSE',low_better=True)
-                print "Best parameters for fold %s were %s." % (i+1,best_parameters)
-            except KeyError:
-                best_parameters = self.parameter_search[0]
-                print "Found no performances, dataset too sparse? Use first values instead for fold %s, %s." % (i+1,best_parameters)
+            best_parameters = self.find_best_parameters(i, crossval)
             
             # Train the model and test the performance on the test set
             performance_dict = self.run_model(train,test,best_parameters)
@@ -129,13 +110,100 @@ class MatrixNestedCrossValidation:
             print "Finished fold %s, with performances %s." % (i+1,performance_dict)            
             
         self.log()
+        
+        
+    def run_parallel(self,folds_training,folds_test,folds_method):
+        ''' Run the inner cross-validations of all outer folds, and the final 
+            models, as one graph of tasks on a pool of P workers (see 
+            task_scheduler.py). The final model of an outer fold is trained 
+            as soon as the tasks of its inner cross-validation have finished. 
+            We publish R and the folds once, as in ParallelMatrixCrossValidation:
+            row 0 of the folds gives the outer fold of each entry, and row 1+i
+            the inner folds of outer fold i, used for all parameters (with the
+            entries of outer test fold i marked -2). '''
+        folds_outer = folds_from_masks(self.M, folds_test)
+        all_folds = [folds_outer]
+        for i,train in enumerate(folds_training):
+            _, folds_test_inner = folds_method(I=self.I, J=self.J, no_folds=self.K, M=train)
+            folds_inner = folds_from_masks(self.M, folds_test_inner)
+            folds_inner[folds_outer == i] = -2
+            all_folds.append(folds_inner)
+        rows, columns = numpy.nonzero(self.M)
+        folder = publish_arrays({'R': self.R, 'rows': rows, 'columns': columns, 'folds': numpy.array(all_folds)})
+        
+        # Add the tasks for the inner folds, and for the final model of each outer fold
+        crossvals = [self.inner_cross_validation(i, train) for i,train in enumerate(folds_training)]
+        scheduler = TaskScheduler(self.P, initializer=initialise_worker, initargs=(folder,))
+        for i in range(self.K):
+            names_inner = []
+            for p,parameters in enumerate(self.parameter_search):
+                for fold in range(self.K):
+                    names_inner.append(('inner',i,p,fold))
+                    scheduler.add_task(
+                        name=names_inner[-1], function=train_and_predict, 
+                        arguments=self.task_arguments(parameters,1+i,fold))
+            scheduler.add_task(
+                name=('outer',i), function=train_and_predict, dependencies=names_inner,
+                prepare=lambda results, i=i: self.task_arguments(self.select_parameters(i,crossvals[i],results),0,i))
+        try:
+            results = scheduler.run()
+        finally:
+            remove_arrays(folder)
+        
+        for i in range(self.K):
+            performance_dict, exception = results[('outer',i)]
+            assert exception is None, "Got exception for fold %s of nested cross-validation: %s." % (i+1,exception)
+            self.store_performances(performance_dict)
+            print "Finished fold %s, with performances %s." % (i+1,performance_dict)  
+        self.log()
+        
+    def select_parameters(self,i,crossval,results):
+        ''' Store the results of the inner cross-validation of outer fold i in
+            :crossval, and return the best parameters. '''
+        for p,parameters in enumerate(self.parameter_search):
+            crossval.store_outputs(parameters,[results[('inner',i,p,fold)] for fold in range(self.K)])
+        return self.find_best_parameters(i, crossval)
+        
+    def task_arguments(self,parameters,index_folds,fold):
+        ''' Return the arguments for train_and_predict. '''
+        return {
+            'parameters' : parameters,
+            'index_folds' : index_folds,
+            'fold' : fold,
+            'method' : self.method,
+            'train_config' : self.train_config,
+            'predict_config' : self.predict_config,
+            'cache' : self.cache,
+        }
+        
+    def inner_cross_validation(self,i,train):
+        ''' Return the cross-validation for the parameter search of outer fold i. '''
+        return MatrixCrossValidation(
+            method=self.method,
+            R=self.R,
+            M=train,
+            K=self.K,
+            parameter_search=self.parameter_search,
+            train_config=self.train_config,
+            predict_config=self.predict_config,
+            file_performance=self.files_nested_performances[i],
+            cache=self.cache,
+        )
+        
+    def find_best_parameters(self,i,crossval):
+        ''' Return the best parameters found by the inner cross-validation of outer fold i. '''
+        try:
+            (best_parameters,_) = crossval.find_best_parameters(evaluation_criterion='MSE',low_better=True)
+            print "Best parameters for fold %s were %s." % (i+1,best_parameters)
+        except KeyError:
+            best_parameters = self.parameter_search[0]
+            print "Found no performances, dataset too sparse? Use first values instead for fold %s, %s." % (i+1,best_parameters)
+        return best_parameters
             
       
     def run_model(self,train,test,parameters):  
         ''' Initialises and runs the model, and returns the performance on the test set. '''
-        model = self.method(self.R,train,**parameters)
-        model.train(**self.train_config)
-        return model.predict(test,**self.predict_config)
+        return run_model_cached(self.cache,self.method,self.R,train,test,parameters,self.train_config,self.predict_config)
         
     
     def store_performances(self,performance_dict):
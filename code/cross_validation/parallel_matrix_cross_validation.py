@@ -4,76 +4,100 @@ the K-fold cross-validation for each parameter.
 We now have an extra parameter P for the initialisation, defining the number
 of parallel threads we should run.
 We stratify the folds using the row (if stratify_folds) or column indices.
+
+We generate the folds once (the same for all parameters), and publish R, the
+observed entries, and the fold of each entry once, as memory-mapped files 
+(see shared_data.py). A single pool of P workers then runs the flattened list of
+(parameter, fold) tasks, so that all workers stay busy until the last task, 
+and each task only pickles the parameters and the fold number.
 """
 
 from matrix_cross_validation import MatrixCrossValidation
-from mask import compute_folds_stratify_rows_attempts
-from mask import compute_folds_stratify_columns_attempts
+from mask import compute_folds_stratify_rows_constructive
+from mask import compute_folds_stratify_columns_constructive
+from mask import folds_from_masks
+from mask import masks_from_fold
+from shared_data import publish_arrays, load_arrays, remove_arrays
+from result_cache import run_model_cached
 
 from multiprocessing import Pool
 import numpy
 
-attempts_generate_M = 100
+
+# The arrays published by ParallelMatrixCrossValidation.run, loaded once by 
+# each worker process when the pool starts
+worker_data = {}
+
+def initialise_worker(folder):
+    worker_data.update(load_arrays(folder))
+    # The forked workers inherit the random state of the parent, so reseed them
+    numpy.random.seed()
 
 
-# We try the parameters in parallel. This function either raises an Exception,
-# or returns a tuple (parameters,all_performances,average_performances)
+# We try the parameters and folds in parallel. This function returns a tuple
+# (performance_dict,None), or (None,message) if the model raised an Exception.
 def run_fold(params):
-    (parameters,R,train,test,method,train_config,predict_config) = \
-        (params['parameters'],params['R'],params['train'],params['test'],params['method'],params['train_config'],params['predict_config'])    
-    performance_dict = run_model(method,R,train,test,parameters,train_config,predict_config)
-    return performance_dict           
+    try:
+        return (train_and_predict(params), None)
+    except Exception as e:
+        return (None, "%s" % e)
     
+# Run the model on fold number params['fold'] of row params['index_folds'] of 
+# the published folds, and return the performance dict
+def train_and_predict(params):
+    (parameters,index_folds,fold,method,train_config,predict_config,cache) = \
+        (params['parameters'],params['index_folds'],params['fold'],params['method'],params['train_config'],params['predict_config'],params['cache'])
+    R = worker_data['R']
+    train, test = masks_from_fold(
+        R.shape, worker_data['rows'], worker_data['columns'], worker_data['folds'][index_folds], fold)
+    return run_model(method,R,train,test,parameters,train_config,predict_config,cache)
     
-# Method for running the model with the given parameters
-def run_model(method,X,train,test,parameters,train_config,predict_config):
-    model = method(X,train,**parameters)
-    model.train(**train_config)
-    return model.predict(test)
+    
+# Method for running the model with the given parameters (unless the cache has the performances)
+def run_model(method,X,train,test,parameters,train_config,predict_config,cache=None):
+    return run_model_cached(cache,method,X,train,test,parameters,train_config,predict_config)
 
 
 # Class, redefining the run function
 class ParallelMatrixCrossValidation(MatrixCrossValidation):
-    def __init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance,P):
-        MatrixCrossValidation.__init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance)
+    def __init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance,P,cache=None):
+        MatrixCrossValidation.__init__(self,method,R,M,K,parameter_search,train_config,predict_config,file_performance,cache)
         self.P = P        
         
     # Run the cross-validation
     def run(self, stratify_rows=False):
-        for parameters in self.parameter_search:
-            print "Trying parameters %s." % (parameters)
-            
-            try:
-                folds_method = compute_folds_stratify_rows_attempts if stratify_rows else compute_folds_stratify_columns_attempts
-                folds_training, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, attempts=attempts_generate_M, M=self.M)
-                
-                # We need to put the parameter dict into json to hash it
-                self.all_performances[self.JSON(parameters)] = {}
-                
-                # Create the threads for the folds, and run them
-                pool = Pool(self.P)
-                all_parameters = [
-                    {
-                        'parameters' : parameters,
-                        'R' : numpy.copy(self.R),
-                        'train' : train,
-                        'test' : test,
-                        'method' : self.method,
-                        'train_config' : self.train_config,
-                        'predict_config' : self.predict_config,
-                    }
-                    for (train,test) in zip(folds_training,folds_test)
-                ]
-                outputs = pool.map(run_fold,all_parameters)
-                pool.close()
-                
-                for performance_dict in outputs:
-                    self.store_performances(performance_dict,parameters)
-                    
-                self.log(parameters)
-                
-            except Exception as e:
-                self.fout.write("Tried parameters %s but got exception: %s. \n" % (parameters,e))
+        # Generate the folds once, as the fold of each observed entry
+        folds_method = compute_folds_stratify_rows_constructive if stratify_rows else compute_folds_stratify_columns_constructive
+        _, folds_test = folds_method(I=self.I, J=self.J, no_folds=self.K, M=self.M)
+        folds = folds_from_masks(self.M, folds_test)
+        rows, columns = numpy.nonzero(self.M)
+        folder = publish_arrays({'R': self.R, 'rows': rows, 'columns': columns, 'folds': folds[numpy.newaxis,:]})
+        
+        # Run all (parameter, fold) tasks on one pool
+        all_parameters = [
+            {
+                'parameters' : parameters,
+                'index_folds' : 0,
+                'fold' : fold,
+                'method' : self.method,
+                'train_config' : self.train_config,
+                'predict_config' : self.predict_config,
+                'cache' : self.cache,
+            }
+            for parameters in self.parameter_search
+            for fold in range(self.K)
+        ]
+        pool = Pool(self.P, initializer=initialise_worker, initargs=(folder,))
+        try:
+            outputs = pool.map(run_fold,all_parameters,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            remove_arrays(folder)
+        
+        for index_parameters, parameters in enumerate(self.parameter_search):
+            print "Tried parameters %s." % (parameters)
+            self.store_outputs(parameters,outputs[index_parameters*self.K:(index_parameters+1)*self.K])
                 
     # Undo the function run_model:
     def run_model(self,train,test,parameters):
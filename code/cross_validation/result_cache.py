@@ -0,0 +1,105 @@
+"""
+Content-addressed cache of the performances of cross-validation and
+experiment tasks, so that re-running a script (e.g. with an extended
+parameter grid, or after a crash) only runs the tasks that are new.
+
+A task is identified by the SHA-1 hash of:
+- the model class (module and name),
+- the data R,
+- the parameters (including K and the hyperparameters),
+- the indices of the training and test entries,
+- train_config and predict_config,
+- the random seed (if any).
+We store the performance dict of each task as <hash>.json in the cache folder,
+and optionally the approximate posterior means of U and V as <hash>.npz.
+Files are written to a temporary name first and then renamed, so that
+parallel workers and crashed runs never leave half-written results.
+
+USAGE
+    cache = ResultCache(folder, store_posterior=False)
+    performance = run_model_cached(cache,method,R,train,test,parameters,train_config,predict_config)
+run_model_cached can also be given cache=None, in which case it simply runs
+the model.
+"""
+
+import hashlib
+import json
+import numpy
+import os
+import tempfile
+
+
+class ResultCache(object):
+    def __init__(self,folder,store_posterior=False):
+        self.folder = folder
+        self.store_posterior = store_posterior
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    def key(self,method,R,train,test,parameters,train_config,predict_config,seed=None):
+        ''' Return the hash identifying this task. '''
+        sha = hashlib.sha1()
+        sha.update("%s.%s" % (method.__module__, method.__name__))
+        sha.update(numpy.ascontiguousarray(R, dtype=float).tostring())
+        for d in [parameters, train_config, predict_config, {'seed': seed}]:
+            sha.update(self.JSON(d))
+        for M in [train, test]:
+            indices_row, indices_column = numpy.nonzero(M)
+            sha.update("%s" % (M.shape,))
+            sha.update(numpy.asarray(indices_row, dtype=numpy.int64).tostring())
+            sha.update(numpy.asarray(indices_column, dtype=numpy.int64).tostring())
+        return sha.hexdigest()
+
+    def JSON(self,d):
+        ''' Returns the sorted json of the dictionary given, with numpy arrays as lists. '''
+        return json.dumps(d, sort_keys=True, default=lambda val: val.tolist())
+
+    def get(self,key):
+        ''' Return the performance dict of the task, or None if it is not cached. '''
+        fname = os.path.join(self.folder, key+'.json')
+        if not os.path.exists(fname):
+            return None
+        return json.load(open(fname,'r'))
+
+    def get_posterior(self,key):
+        ''' Return the stored (U,V) of the task, or None if they were not stored. '''
+        fname = os.path.join(self.folder, key+'.npz')
+        if not os.path.exists(fname):
+            return None
+        posterior = numpy.load(fname)
+        return (posterior['U'], posterior['V'])
+
+    def put(self,key,performance_dict,U=None,V=None):
+        ''' Store the performance dict, and (U,V) if given. '''
+        if U is not None and V is not None:
+            self.write(key+'.npz', lambda f: numpy.savez(f, U=U, V=V))
+        self.write(key+'.json', lambda f: json.dump(performance_dict, f))
+
+    def write(self,fname,write_function):
+        ''' Write to a temporary file in the folder, and rename it to :fname. '''
+        fd, fname_temporary = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            write_function(f)
+        os.rename(fname_temporary, os.path.join(self.folder, fname))
+
+
+def run_model_cached(cache,method,R,train,test,parameters,train_config,predict_config,seed=None):
+    ''' Initialise and train the model, and return the performance on the test
+        set - or return the cached performance if the task was run before.
+        If :seed is given, we seed numpy's random number generator first. '''
+    if cache is not None:
+        key = cache.key(method,R,train,test,parameters,train_config,predict_config,seed)
+        performance_dict = cache.get(key)
+        if performance_dict is not None:
+            return performance_dict
+
+    if seed is not None:
+        numpy.random.seed(seed)
+    model = method(R,train,**parameters)
+    model.train(**train_config)
+    performance_dict = model.predict(test,**predict_config)
+
+    if cache is not None:
+        (U,V) = model.approx_expectation_UV(**predict_config) if cache.store_posterior else (None,None)
+        cache.put(key,performance_dict,U=U,V=V)
+    return performance_dict
@@ -0,0 +1,41 @@
+"""
+Methods for sharing read-only numpy arrays with the worker processes of a
+multiprocessing.Pool, without pickling them into every task.
+
+We store the arrays as .npy files in a temporary folder, and the workers load
+them as read-only memory-mapped arrays (numpy.load with mmap_mode='r'). So the
+data is written once, and the processes share the pages of the files rather
+than each holding its own copy.
+
+USAGE
+    folder = publish_arrays({'R': R, ...})
+    pool = Pool(P, initializer=..., initargs=(folder,))  # workers call load_arrays(folder)
+    ...
+    remove_arrays(folder)
+"""
+
+import numpy
+import os
+import shutil
+import tempfile
+
+
+def publish_arrays(arrays, folder=None):
+    ''' Store the dictionary :arrays from names to numpy arrays in :folder (a
+        new temporary folder if None), and return the folder. '''
+    folder = tempfile.mkdtemp(prefix='bmf_shared_') if folder is None else folder
+    for name, array in arrays.iteritems():
+        numpy.save(os.path.join(folder, name+'.npy'), numpy.ascontiguousarray(array))
+    return folder
+
+def load_arrays(folder):
+    ''' Return a dictionary from names to read-only memory-mapped arrays, for
+        all arrays stored in :folder by publish_arrays(). '''
+    return {
+        filename[:-len('.npy')]: numpy.load(os.path.join(folder, filename), mmap_mode='r')
+        for filename in os.listdir(folder) if filename.endswith('.npy')
+    }
+
+def remove_arrays(folder):
+    ''' Remove the folder created by publish_arrays(). '''
+    shutil.rmtree(folder, ignore_errors=True)
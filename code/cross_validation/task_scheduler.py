@@ -0,0 +1,123 @@
+"""
+Scheduler for running a graph of tasks with dependencies on a single pool of
+P worker processes.
+
+Each task has a name, a (picklable, module-level) function that is run in a
+worker on the task's arguments, and a list of names of the tasks it depends
+on. If a task has a prepare function, it is called in the parent process once
+its dependencies have finished, with a dictionary from their names to their
+results, and returns the arguments for the task. This allows the arguments
+of a task to depend on the results of others (e.g. refitting a model with the
+best parameters found by the tasks of an inner cross-validation).
+
+A task is submitted to the pool as soon as all its dependencies have
+finished, so the workers are never idle while there is a task that can run.
+The result of each task is a tuple (result,None), or (None,message) if the
+function raised an Exception. The same goes for the other ways a task can
+fail: if its prepare function raises an Exception, if its result cannot be
+sent back from the worker, or if the scheduler has not heard back from any 
+task for :timeout seconds (e.g. because a worker died), after which all tasks
+still running are failed. We poll the submitted tasks every :poll_interval 
+seconds, so that the wait can be interrupted.
+
+USAGE
+    scheduler = TaskScheduler(P, initializer, initargs, timeout)
+    scheduler.add_task(name, function, arguments, dependencies, prepare)
+    ...
+    results = scheduler.run()
+"""
+
+from multiprocessing import Pool
+import time
+
+
+# Run a task in a worker, catching exceptions so that the scheduler always
+# hears back from it
+def call_task((function,arguments)):
+    try:
+        return (function(arguments), None)
+    except Exception as e:
+        return (None, "%s" % e)
+
+
+class TaskScheduler(object):
+    def __init__(self,P,initializer=None,initargs=(),timeout=None,poll_interval=0.1):
+        self.P = P
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.names = []             # Names of the tasks, in the order they were added
+        self.tasks = {}             # Mapping from names to (function,arguments,dependencies,prepare)
+
+    def add_task(self,name,function,arguments=None,dependencies=[],prepare=None):
+        ''' Add a task. The dependencies need to be added first, so that the
+            tasks cannot form a cycle. '''
+        assert name not in self.tasks, "Task %s was already added." % (name,)
+        for dependency in dependencies:
+            assert dependency in self.tasks, "Dependency %s of task %s has not been added yet." % (dependency,name)
+        self.names.append(name)
+        self.tasks[name] = (function,arguments,list(dependencies),prepare)
+
+    def run(self):
+        ''' Run all tasks, and return a dictionary from names to results. '''
+        results = {}
+        finished = []               # List of (name,result) of finished tasks whose dependants are not released yet
+        pending = {}                # Mapping from names of submitted tasks to their AsyncResult
+        waiting = { name:set(self.tasks[name][2]) for name in self.names }
+        dependants = { name:[] for name in self.names }
+        for name in self.names:
+            for dependency in self.tasks[name][2]:
+                dependants[dependency].append(name)
+
+        pool = Pool(self.P, initializer=self.initializer, initargs=self.initargs)
+        def submit(name):
+            (function,arguments,dependencies,prepare) = self.tasks[name]
+            try:
+                if prepare is not None:
+                    arguments = prepare({ dependency:results[dependency] for dependency in dependencies })
+                pending[name] = pool.apply_async(call_task, ((function,arguments),))
+            except Exception as e:
+                finished.append((name, (None, "Could not submit task %s: %s" % (name,e))))
+
+        timed_out = False
+        try:
+            for name in self.names:
+                if not waiting[name]:
+                    submit(name)
+            time_heard = time.time()
+            while len(results) < len(self.names):
+                for name in [name for name in pending if pending[name].ready()]:
+                    try:
+                        result = pending.pop(name).get()
+                    except Exception as e:
+                        result = (None, "%s" % e)
+                    finished.append((name,result))
+                if finished:
+                    time_heard = time.time()
+                elif self.timeout is not None and time.time() - time_heard > self.timeout:
+                    timed_out, time_heard = True, time.time()
+                    for name in pending.keys():
+                        del pending[name]
+                        finished.append((name, (None, "No task finished in the last %s seconds." % self.timeout)))
+                else:
+                    time.sleep(self.poll_interval)
+                    continue
+                    
+                name, result = finished.pop(0)
+                results[name] = result
+                for dependant in dependants[name]:
+                    waiting[dependant].discard(name)
+                    if not waiting[dependant]:
+                        submit(dependant)
+            # Workers that timed out may never return
+            if timed_out:
+                pool.terminate()
+            else:
+                pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return results
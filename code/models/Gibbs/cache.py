@@ -0,0 +1,66 @@
+'''
+This file contains methods for precomputing the invariants of the data (R, M)
+that the updates use, so that they are computed once per model rather than
+once per iteration (and once per row).
+
+We compute them both for the rows (used by the updates of U) and the columns
+(used by the updates of V). The column version uses contiguous copies of R.T
+and M.T, rather than the strided views that are slow in the row loops. These 
+are the only copies of the data we make: the row version uses R and M 
+themselves (if contiguous), and MR is R itself if R is already zero at the 
+unobserved entries (as for all our datasets).
+
+For each orientation, the cache is a dictionary with:
+- R, M: the (transposed) data and mask matrices, contiguous.
+- MR: M*R.
+- observed: list of vectors, giving the column indices of the observed
+  entries in each row.
+- R_observed: list of vectors, giving the values of the observed entries in
+  each row.
+- M_observed: list of vectors of ones, of the same length as R_observed.
+  Passing (R_observed[i], M_observed[i], V[observed[i]]) to the row updates
+  instead of (R[i], M[i], V) gives the same values, but only costs O(|Omega_i|).
+'''
+
+import numpy
+
+
+def compute_cache(R, M):
+    ''' Return a dictionary {'rows', 'columns', 'Omega_rows', 'Omega_columns', 
+        'size_Omega'}, with the caches for the rows and columns (see 
+        compute_cache_orientation), the row and column indices of the observed
+        entries, and their number. '''
+    assert R.shape == M.shape
+    Omega_rows, Omega_columns = numpy.nonzero(M)
+    return {
+        'rows': compute_cache_orientation(R=R, M=M),
+        'columns': compute_cache_orientation(R=R.T, M=M.T),
+        'Omega_rows': Omega_rows,
+        'Omega_columns': Omega_columns,
+        'size_Omega': M.sum(),
+    }
+
+def compute_cache_orientation(R, M):
+    ''' Return the cache for the rows of R and M (see above). '''
+    R, M = numpy.ascontiguousarray(R), numpy.ascontiguousarray(M)
+    MR = M * R
+    if numpy.array_equal(MR, R):
+        MR = R
+    observed = [numpy.flatnonzero(Mi) for Mi in M]
+    R_observed = [R[i,observed_i] for i,observed_i in enumerate(observed)]
+    M_observed = [numpy.ones(len(observed_i)) for observed_i in observed]
+    return {
+        'R': R,
+        'M': M,
+        'MR': MR,
+        'observed': observed,
+        'R_observed': R_observed,
+        'M_observed': M_observed,
+    }
+
+def observed_row(i, R, M, V, cache=None):
+    ''' Return (Ri, Mi, V) for the row updates of Ui. If the cache is given,
+        restrict them to the observed entries of row i. '''
+    if cache is None:
+        return (R[i], M[i], V)
+    return (cache['R_observed'][i], cache['M_observed'][i], V[cache['observed'][i]])
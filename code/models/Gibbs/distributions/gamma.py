@@ -2,7 +2,7 @@
 Class representing a gamma distribution, allowing us to sample from it, 
 and compute the expectation and the expectation of the log.
 """
-import math
+import math, numpy
 from scipy.special import psi as digamma
 from numpy.random import gamma
 
@@ -12,6 +12,12 @@ def gamma_draw(alpha,beta):
     shape = float(alpha)
     scale = 1.0 / float(beta)
     return gamma(shape=shape,scale=scale,size=None)
+
+# Gamma draws for all entries at once (arrays, or scalars to broadcast)
+def gamma_vector_draw(alphas,betas):
+    shapes = numpy.asarray(alphas,dtype=float)
+    scales = 1.0 / numpy.asarray(betas,dtype=float)
+    return gamma(shape=shapes,scale=scales,size=numpy.broadcast(shapes,scales).shape)
         
 # Gamma expectation
 def gamma_mean(alpha,beta): 
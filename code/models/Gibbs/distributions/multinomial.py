@@ -1,11 +1,17 @@
 """
 Class representing a Multinomial distribution, allowing us to sample from it.
 """
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.profiling import count
 from numpy.random import multinomial
 import numpy
 
 # Multinomial draws
 def multinomial_draw(n,p):
+    count('multinomial_draws')
     return multinomial(n=n,pvals=p)
         
 def multinomial_mean(n,p):
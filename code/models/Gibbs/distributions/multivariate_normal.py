@@ -1,14 +1,60 @@
 """
 Class representing a multivariate normal distribution, allowing us to sample from it.
+
+All draws use a Cholesky decomposition and triangular solves, rather than
+inverting the precision and letting numpy.random.multivariate_normal do an SVD
+of the covariance. With z ~ N(0,I):
+- If sigma = L L^T, then mu + L z ~ N(mu,sigma).
+- If precision = L L^T, then mu + L^-T z ~ N(mu,precision^-1).
+The posterior parameters of the multivariate updates are in information form,
+with mean precision^-1 h; multivariate_normal_information_draw computes both
+the mean and the draw from a single Cholesky decomposition of the precision.
 """
-from numpy.random import multivariate_normal
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.profiling import count
+from scipy.linalg import solve_triangular
 import numpy
 
+# Draw a value for x ~ N(mu,sigma), or x ~ N(mu,precision^-1)
 def multivariate_normal_draw(mu,precision=None,sigma=None):
     assert precision is not None or sigma is not None, "Need either Sigma or Precision."
+    z = numpy.random.standard_normal(len(mu))
+    count('cholesky_factorisations')
     if sigma is None:
-        sigma = numpy.linalg.inv(precision)
-    return multivariate_normal(mean=mu,cov=sigma,size=None)
+        L = numpy.linalg.cholesky(precision)
+        return mu + solve_triangular(L, z, lower=True, trans='T')
+    L = numpy.linalg.cholesky(sigma)
+    return mu + numpy.dot(L, z)
+
+# Draw a value for x ~ N(precision^-1 h, precision^-1)
+def multivariate_normal_information_draw(h,precision):
+    count('cholesky_factorisations')
+    L = numpy.linalg.cholesky(precision)
+    y = solve_triangular(L, h, lower=True)
+    z = numpy.random.standard_normal(len(h))
+    return solve_triangular(L, y + z, lower=True, trans='T')
+
+# Draw N values, xn ~ N(mus[n],sigma[n]) or N(mus[n],precision[n]^-1).
+# mus is a NxK matrix; precision or sigma is either a NxKxK array (one matrix
+# per draw), or a KxK matrix shared by all draws (so decomposed only once).
+def multivariate_normal_vector_draw(mus,precision=None,sigma=None):
+    assert precision is not None or sigma is not None, "Need either Sigma or Precision."
+    N, K = mus.shape
+    Z = numpy.random.standard_normal((N,K))
+    L = numpy.linalg.cholesky(sigma if precision is None else precision)
+    count('cholesky_factorisations', 1 if L.ndim == 2 else N)
+    if precision is None:
+        return mus + (numpy.dot(Z, L.T) if L.ndim == 2 else numpy.einsum('nkl,nl->nk', L, Z))
+    if L.ndim == 2:
+        return mus + solve_triangular(L, Z.T, lower=True, trans='T').T
+    # numpy has no batched triangular solve, so use its batched general solve
+    return mus + numpy.linalg.solve(L.transpose(0,2,1), Z[:,:,numpy.newaxis])[:,:,0]
 
 def multivariate_normal_mean(mu,precision=None,sigma=None):
-    return mu
\ No newline at end of file
+    return mu
+
+def multivariate_normal_vector_mean(mus,precision=None,sigma=None):
+    return mus
@@ -8,6 +8,11 @@ import numpy, math
 def normal_draw(mu,tau):
     sigma = numpy.float64(1.0) / math.sqrt(tau)
     return normal(loc=mu,scale=sigma,size=None)
+
+# Draw values for all entries at once, Uik ~ N(mus_ik,taus_ik^-1) (arrays, or scalars to broadcast)
+def normal_vector_draw(mus,taus):
+    sigmas = numpy.float64(1.0) / numpy.sqrt(taus)
+    return normal(loc=mus,scale=sigmas,size=numpy.broadcast(mus,sigmas).shape)
     
 def normal_mean(mu,tau):
     return 0.    
@@ -4,29 +4,58 @@ Class representing a Normal-Inverse Wishart distribution, allowing us to sample
 Say mu, Sigma ~ NIW(mu0,beta0,v0,W0).
 To sample:
 - Sample Sigma ~ IW(v0, W0)
-- Sample mu ~ N(mu0, 1/beta0 * W0)
+- Sample mu ~ N(mu0, 1/beta0 * Sigma)
 
 https://en.wikipedia.org/wiki/Normal-inverse-Wishart_distribution#Generating_normal-inverse-Wishart_random_variates
+
+We sample Sigma using the Bartlett decomposition, rather than scipy's invwishart
+(whose frozen distribution and argument checking dominate the cost for small K).
+Sigma ~ IW(v0, W0) iff Sigma^-1 ~ W(v0, W0^-1), and if W0^-1 = C C^T, then
+Sigma^-1 = (C A) (C A)^T ~ W(v0, W0^-1), where A is lower triangular with
+A_ii ~ sqrt(Chi^2(v0-i)) (i=0..K-1), and A_ij ~ N(0,1) for i > j.
+So L = C A is the Cholesky factor of Sigma^-1, which gives Sigma and the draw of
+mu = mu0 + L^-T z / sqrt(beta0) using triangular solves only.
+
+https://en.wikipedia.org/wiki/Wishart_distribution#Bartlett_decomposition
 """
-from scipy.stats import invwishart
-from multivariate_normal import multivariate_normal_draw
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.profiling import count
+from scipy.linalg import solve_triangular
 import numpy
 
 # Draw a value for mu, Sigma ~ NIW(mu0,beta0,v0,W0)
 def normal_inverse_wishart_draw(mu0,beta0,v0,W0):
-    sigma = invwishart.rvs(df=v0, scale=W0)
-    sigma = sigma if sigma.shape != () else numpy.array([[sigma]])
-    mu = multivariate_normal_draw(mu=mu0,sigma=sigma/beta0)
+    mu, sigma, _, _ = normal_inverse_wishart_bartlett_draw(mu0=mu0,beta0=beta0,v0=v0,W0=W0)
     return (mu,sigma)
-    
+
+# Draw a value for mu, Sigma ~ NIW(mu0,beta0,v0,W0), and also return Sigma^-1
+# and its Cholesky factor L (Sigma^-1 = L L^T), from the same decomposition.
+def normal_inverse_wishart_bartlett_draw(mu0,beta0,v0,W0):
+    K = mu0.shape[0]
+    assert W0.shape == (K,K) and v0 > K - 1, "Need v0 > K - 1 for the Inverse Wishart."
+    C = numpy.linalg.cholesky(numpy.linalg.inv(W0))
+    count('matrix_inversions'), count('cholesky_factorisations')
+    A = numpy.tril(numpy.random.standard_normal((K,K)), -1)
+    A[numpy.diag_indices(K)] = numpy.sqrt(numpy.random.chisquare(v0 - numpy.arange(K)))
+    L = numpy.dot(C, A)
+    sigma_inv = numpy.dot(L, L.T)
+    L_inv = solve_triangular(L, numpy.eye(K), lower=True)
+    sigma = numpy.dot(L_inv.T, L_inv)
+    z = numpy.random.standard_normal(K)
+    mu = mu0 + solve_triangular(L, z, lower=True, trans='T') / numpy.sqrt(beta0)
+    return (mu,sigma,sigma_inv,L)
+
 def normal_inverse_wishart_mean(mu0,beta0,v0,W0):
     # Mean of InverseWishart is W0 / ( v0 - K - 1 ). Mean of Normal is mu0.
     K = mu0.shape[0]
     return (mu0, W0 / (v0 - K - 1))
-       
+
 '''
 # Example draw
 I = 5
 mu0, beta0, v0, W0 = numpy.zeros(I), 1., I, numpy.eye(I)
 print normal_inverse_wishart_draw(mu0,beta0,v0,W0)
-'''
\ No newline at end of file
+'''
@@ -9,6 +9,11 @@ Created on Mon Aug 12 13:48:22 2013
 
 @author: Christoph Lassner
 """
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.profiling import count
 from scipy.special import erf
 from numpy.random import uniform as rand, normal as randn, randint as randi
 from numpy import sqrt, pi, exp, log, floor, array
@@ -116,6 +121,8 @@ def rtstdnorm(a, b):
             z = log(1 + rand(low=1E-15)*expab)
             e = -log(rand(low=1E-15))
             stop = (twoasq*e > z ** 2)
+            if not stop:
+                count('rtnorm_rejections')
         r = a - z/a
     # If a in the left tail (a < xmin), use rejection algorithm with
     # a Gaussian proposal
@@ -124,6 +131,8 @@ def rtstdnorm(a, b):
         while not stop:
             r = randn()
             stop = (r>=a) and (r<=b)
+            if not stop:
+                count('rtnorm_rejections')
     # In other cases (xmin < a < xmax), use Chopin's algorithm
     else:    
         # Design variables
@@ -154,6 +163,8 @@ def rtstdnorm(a, b):
                 z = log( 1 + rand()*expab )
                 e = -log(rand())
                 stop = (twoasq*e > z**2)
+                if not stop:
+                    count('rtnorm_rejections')
             r = a - z/a
             return r
         while True:
@@ -215,6 +226,8 @@ def rtstdnorm(a, b):
                 if sim**2 + 2*log(simy) + ALPHA < 0:
                     r = sim
                     return r
+            # The proposal was rejected
+            count('rtnorm_rejections')
     return r
 
 
@@ -4,9 +4,9 @@ We either use the expectation or random draws of the prior distributions.
 '''
 
 from updates import update_tau_gaussian
-from distributions.gamma import gamma_draw, gamma_mean
-from distributions.normal import normal_draw, normal_mean
-from distributions.multivariate_normal import multivariate_normal_draw, multivariate_normal_mean
+from distributions.gamma import gamma_draw, gamma_vector_draw, gamma_mean
+from distributions.normal import normal_draw, normal_vector_draw, normal_mean
+from distributions.multivariate_normal import multivariate_normal_vector_draw, multivariate_normal_vector_mean
 from distributions.exponential import exponential_draw, exponential_mean
 from distributions.laplace import laplace_draw, laplace_mean
 from distributions.inverse_gaussian import inverse_gaussian_draw, inverse_gaussian_mean
@@ -42,11 +42,11 @@ def initialise_U_gaussian(init, I, K, lamb):
     return U
 
 def initialise_U_gaussian_wishart(init, I, K, muU, sigmaU):
-    """ Initialise U, with prior Ui ~ N(muU,sigmaU). """
-    initialise = multivariate_normal_draw if init == 'random' else multivariate_normal_mean
-    U = numpy.zeros((I,K))
-    for i in range(I):
-        U[i,:] = initialise(mu=muU, sigma=sigmaU)
+    """ Initialise U, with prior Ui ~ N(muU,sigmaU). We draw all rows at once,
+        so that sigmaU is decomposed only once. """
+    initialise = multivariate_normal_vector_draw if init == 'random' else multivariate_normal_vector_mean
+    U = initialise(mus=numpy.tile(muU, (I,1)), sigma=sigmaU)
+    assert U.shape == (I,K)
     return U
     
 def initialise_muU_sigmaU_wishart(init, mu0, beta0, v0, W0):
@@ -111,12 +111,12 @@ def initialise_muU_tauU_hierarchical(init, I, K, mu_mu, tau_mu, a, b):
     """ Initialise muU and tauU (matrices), with hierarchical prior proportional
         to N(muU_ik|mu_mu,tau_mu^-1) * Gamma(tauU_ik|a,b) * ...
         For simplicity we generate muU from N, and tauU from Gamma. """
-    initialise_normal, initialise_gamma = ( (normal_draw, gamma_draw) if init == 'random'
-                                            else (normal_mean, gamma_mean) )
-    muU, tauU = numpy.zeros((I,K)), numpy.zeros((I,K))
-    for i,k in itertools.product(range(I),range(K)):
-        muU[i,k] = initialise_normal(mu=mu_mu, tau=tau_mu)
-        tauU[i,k] = initialise_gamma(alpha=a, beta=b)
+    if init == 'random':
+        muU = normal_vector_draw(mus=mu_mu * numpy.ones((I,K)), taus=tau_mu)
+        tauU = gamma_vector_draw(alphas=a * numpy.ones((I,K)), betas=b)
+    else:
+        muU = normal_mean(mu=mu_mu, tau=tau_mu) * numpy.ones((I,K))
+        tauU = gamma_mean(alpha=a, beta=b) * numpy.ones((I,K))
     return (muU, tauU)
 
 def initialise_U_halfnormal(init, I, K, sigma):
@@ -0,0 +1,112 @@
+"""
+Opt-in memory accounting of the Gibbs samplers. We record:
+- the footprint of each persistent structure of the model (its attributes,
+  e.g. R, M, cache, Z, all_U, all_V, all_sigmaU), at the stages we are told to
+  (BMF.train() records them after 'initialise' and after 'run');
+- the resident set size (RSS) of the process at those stages, and its peak
+  while accounting is enabled, by sampling it every :interval seconds in a
+  background thread.
+
+The footprint of a structure is the size of the numpy arrays (that own their
+data), scipy sparse matrices, and Python containers and numbers it holds,
+following lists, tuples, dictionaries and objects (e.g. IndexMask). Each array
+is only counted once, for the first structure (in alphabetical order) that
+holds it. The RSS is read from /proc/self/statm, so on systems without it we
+only have the peak RSS of the whole process (resource.getrusage).
+
+USAGE
+    BMF.enable_memory_accounting(interval=0.01)
+    BMF.train(init, iterations)      (or BMF.record_memory(stage) yourself)
+    report = BMF.disable_memory_accounting()
+where report is a dictionary {'stages', 'peak_rss_mb'}, with stages a list of
+dictionaries {'stage', 'rss_mb', 'structures_mb'} in the order they were
+recorded, and structures_mb mapping the attributes to their footprint in MB.
+"""
+
+import numpy
+import resource
+import sys
+import threading
+import time
+
+MB = 1024. * 1024.
+
+
+def footprint(value, counted):
+    ''' Return the number of bytes held by :value, skipping the objects whose
+        id is in the set :counted (and adding those we count to it). '''
+    if id(value) in counted:
+        return 0
+    counted.add(id(value))
+    if isinstance(value, numpy.ndarray):
+        return value.nbytes if value.flags.owndata else 0
+    if hasattr(value, 'tocsr') and hasattr(value, 'nnz'):
+        # scipy sparse matrices
+        return sum(footprint(part, counted) for name in ['data','indices','indptr','row','col']
+                   for part in [getattr(value, name, None)] if part is not None)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(footprint(item, counted) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(footprint(item, counted) for item in value.itervalues())
+    if hasattr(value, '__dict__') and not callable(value):
+        return sum(footprint(item, counted) for item in vars(value).itervalues())
+    return sys.getsizeof(value)
+
+def structure_footprints(model):
+    ''' Return a dictionary from the attributes of the model to their footprint in MB. '''
+    counted = set()
+    footprints = { name:footprint(value, counted) / MB for (name,value) in sorted(vars(model).items())
+                   if not isinstance(value, MemoryTracker) }
+    return { name:size for (name,size) in footprints.iteritems() if size > 0 }
+
+def current_rss_mb():
+    ''' Return the current RSS of this process in MB, or None if unavailable. '''
+    try:
+        pages = int(open('/proc/self/statm','r').read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize() / MB
+
+def peak_rss_mb():
+    ''' Return the peak RSS of this process so far in MB. '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+class MemoryTracker(object):
+    def __init__(self,interval=0.01):
+        self.interval = interval
+        self.stages = []            # One row per recorded stage, in order
+        self.peak = current_rss_mb()
+        self.running = False
+
+    def start(self):
+        ''' Start sampling the RSS in a background thread. '''
+        if self.peak is None or self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, current_rss_mb())
+            time.sleep(self.interval)
+
+    def stop(self):
+        ''' Stop sampling the RSS. '''
+        if self.running:
+            self.running = False
+            self.thread.join()
+
+    def record(self,stage,model):
+        ''' Record the RSS and the footprints of the model's structures at :stage. '''
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+        self.stages.append({ 'stage':stage, 'rss_mb':rss, 'structures_mb':structure_footprints(model) })
+
+    def report(self):
+        ''' Return the recorded stages, and the peak RSS while accounting (or
+            of the whole process, if we cannot read the current RSS). '''
+        return { 'stages':list(self.stages), 'peak_rss_mb':self.peak if self.peak is not None else peak_rss_mb() }
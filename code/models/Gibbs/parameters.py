@@ -29,15 +29,18 @@ Other parameters for:
 - hi from hierarchical Gamma [model: Gamma + hierarchical]
 '''
 
+from profiling import count
 
 import numpy
 import math 
 
 
 ''' General Gaussian and Poisson models '''
-def gaussian_tau_alpha_beta(alpha, beta, R, M, U, V):
-    """ alpha_s and beta_s for tau (noise) in Gaussian models. """
-    alpha_s = alpha + M.sum() / 2.
+def gaussian_tau_alpha_beta(alpha, beta, R, M, U, V, size_Omega=None):
+    """ alpha_s and beta_s for tau (noise) in Gaussian models. 
+        size_Omega is M.sum(), if precomputed. """
+    size_Omega = M.sum() if size_Omega is None else size_Omega
+    alpha_s = alpha + size_Omega / 2.
     squared_error = (M*(R-numpy.dot(U,V.T))**2).sum()
     beta_s = beta + squared_error / 2.
     return (alpha_s, beta_s)
@@ -60,10 +63,11 @@ def poisson_Zij_n_p(Rij, Ui, Vj):
 #    p /= p_sum
 #    return (n, p)
     
-def poisson_Z_n_p(R, U, V, Omega):
-    """ n (|Omega|) and p (|Omega|xK) for all Zij with Mult(Rij,(Ui0Vj0,..,UiKVjK)) prior. """
+def poisson_Z_n_p(R, U, V, indices):
+    """ n (|Omega|) and p (|Omega|xK) for all Zij with Mult(Rij,(Ui0Vj0,..,UiKVjK)) prior. 
+        indices is the tuple of row and column indices of Omega. """
     K = U.shape[1]
-    indices_i, indices_j = zip(*Omega)
+    indices_i, indices_j = indices
     U_list, V_list = U[indices_i,:], V[indices_j,:]
     n_list = R[indices_i, indices_j]
     p_list = U_list * V_list
@@ -73,33 +77,35 @@ def poisson_Z_n_p(R, U, V, Omega):
 
 
 ''' (Gaussian) Gaussian (univariate posterior). '''
-def gaussian_gaussian_mu_tau(k, lamb, R, M, U, V, tau):
-    """ muUk and tauUk (vectors) for Uk with N(0,I/lamb) prior (I=identity matrix). """
+def gaussian_gaussian_mu_tau(k, lamb, R, M, U, V, tau, MR=None):
+    """ muUk and tauUk (vectors) for Uk with N(0,I/lamb) prior (I=identity matrix). 
+        MR is M*R, if precomputed (same for the other column-wise updates). """
     I, J, K = R.shape[0], R.shape[1], U.shape[1]
     assert R.shape == M.shape and V.shape == (J,K) and U.shape[0] == I
+    MR = M*R if MR is None else MR
     tauUk = lamb + tau * ( M * V[:,k]**2 ).sum(axis=1)   
     #muUk = 1. / tauUk * ( tau * ( 
     #    M * ( ( R - numpy.dot(U,V.T) + numpy.outer(U[:,k],V[:,k])) * V[:,k] ) ).sum(axis=1) )
     V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
     U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
     muUk = 1. / tauUk * ( tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+        numpy.dot(MR, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
     assert muUk.shape == (I,) and tauUk.shape == (I,)
     return (muUk, tauUk)
 
 
 ''' (Gaussian) Gaussian (multivariate posterior). '''
-def gaussian_gaussian_mu_sigma(lamb, Ri, Mi, V, tau):
-    """ mu and sigma for Ui with N(0,I/lamb) prior (I=identity matrix). """
+def gaussian_gaussian_h_precision(lamb, Ri, Mi, V, tau):
+    """ h and precision for Ui with N(0,I/lamb) prior (I=identity matrix). 
+        The posterior is N(precision^-1 h, precision^-1). """
     assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0]
     K = V.shape[1]
     V_masked = (Mi * V.T).T # zero rows when j not in Mi
     precision = lamb * numpy.eye(K) + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
     Ri_masked = Mi * Ri # zero entries when j not in Mi
-    mu = numpy.dot(sigma, tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and sigma.shape == (V.shape[1], V.shape[1])
-    return (mu, sigma)
+    h = tau * numpy.dot(Ri_masked, V)
+    assert h.shape[0] == V.shape[1] and precision.shape == (V.shape[1], V.shape[1])
+    return (h, precision)
     
 #def gaussian_gaussian_mu_sigma(lamb, R, M, V, tau):
 #    """ mu (IxKxK) and sigma (IxKxK) for all Ui with N(0,I/lamb) prior (I=identity matrix). """
@@ -118,16 +124,16 @@ def gaussian_gaussian_mu_sigma(lamb, Ri, Mi, V, tau):
 
 
 ''' (Gaussian) Gaussian + Wishart '''
-def gaussian_gaussian_wishart_mu_sigma(muU, sigmaU_inv, Ri, Mi, V, tau):
-    """ mu and sigma for Ui with N(muU,sigmaU) prior. """
+def gaussian_gaussian_wishart_h_precision(muU, sigmaU_inv, Ri, Mi, V, tau):
+    """ h and precision for Ui with N(muU,sigmaU) prior. 
+        The posterior is N(precision^-1 h, precision^-1). """
     assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0]
     V_masked = (Mi * V.T).T # zero rows when j not in Mi
     precision = sigmaU_inv + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
     Ri_masked = Mi * Ri # zero entries when j not in Mi
-    mu = numpy.dot(sigma, numpy.dot(sigmaU_inv, muU) + tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and sigma.shape == (V.shape[1], V.shape[1])
-    return (mu, sigma)
+    h = numpy.dot(sigmaU_inv, muU) + tau * numpy.dot(Ri_masked, V)
+    assert h.shape[0] == V.shape[1] and precision.shape == (V.shape[1], V.shape[1])
+    return (h, precision)
 
 def gaussian_wishart_beta0_v0_mu0_W0(beta0, v0, mu0, W0, U):
     """ beta0_s, v0_s, mu0_s, W0_s for muU, sigmaU with NIW(beta0,v0,mu0,W0) prior. """
@@ -144,16 +150,16 @@ def gaussian_wishart_beta0_v0_mu0_W0(beta0, v0, mu0, W0, U):
 
 
 ''' (Gaussian) Gaussian + Automatic Relevance Determination '''
-def gaussian_gaussian_ard_mu_sigma(lamb, Ri, Mi, V, tau):
-    """ mu and sigma for Ui with N(0,diag(1/lamb)) prior. lamb is a vector. """
+def gaussian_gaussian_ard_h_precision(lamb, Ri, Mi, V, tau):
+    """ h and precision for Ui with N(0,diag(1/lamb)) prior. lamb is a vector. 
+        The posterior is N(precision^-1 h, precision^-1). """
     assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0] and lamb.shape[0] == V.shape[1]
     V_masked = (Mi * V.T).T # zero rows when j not in Mi
     precision = numpy.diag(lamb) + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
     Ri_masked = Mi * Ri # zero entries when j not in Mi
-    mu = numpy.dot(sigma, tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and sigma.shape == (V.shape[1], V.shape[1])
-    return (mu, sigma)
+    h = tau * numpy.dot(Ri_masked, V)
+    assert h.shape[0] == V.shape[1] and precision.shape == (V.shape[1], V.shape[1])
+    return (h, precision)
 
 def gaussian_ard_alpha_beta(alpha0, beta0, Uk, Vk):
     """ alpha_s and beta_s for lambdak with Gamma(alpha0,beta0) prior. """
@@ -164,16 +170,16 @@ def gaussian_ard_alpha_beta(alpha0, beta0, Uk, Vk):
 
 
 ''' (Gaussian) Laplace. '''
-def gaussian_laplace_mu_precision(Ri, Mi, V, lambdaUi, tau):
-    """ mu and precision for Ui with L(0,lambdaUi) prior. """
+def gaussian_laplace_h_precision(Ri, Mi, V, lambdaUi, tau):
+    """ h and precision for Ui with L(0,lambdaUi) prior. 
+        The posterior is N(precision^-1 h, precision^-1). """
     assert Ri.shape == Mi.shape and Ri.shape[0] == V.shape[0] and lambdaUi.shape[0] == V.shape[1]
     V_masked = (Mi * V.T).T # zero rows when j not in Mi
     Ri_masked = Mi * Ri # zero entries when j not in Mi
     precision = numpy.diag(1./lambdaUi) + tau * ( numpy.dot(V_masked.T,V_masked) )
-    sigma = numpy.linalg.inv(precision)
-    mu = numpy.dot(sigma, tau * numpy.dot(Ri_masked, V))
-    assert mu.shape[0] == V.shape[1] and precision.shape == (V.shape[1], V.shape[1])
-    return (mu, precision)
+    h = tau * numpy.dot(Ri_masked, V)
+    assert h.shape[0] == V.shape[1] and precision.shape == (V.shape[1], V.shape[1])
+    return (h, precision)
 
 def laplace_lambdaU_mu_tau(Uik, etaUik):
     """ mu and tau for lambdaUik with Exp(etaUik) prior. """
@@ -187,17 +193,18 @@ def laplace_etaU_mu_tau(lambdaUik, a, b):
 
 
 ''' (Gaussian) Gaussian + L^2_1 Prior '''
-def gaussian_l21_mu_tau(k, lamb, R, M, U, V, tau):
+def gaussian_l21_mu_tau(k, lamb, R, M, U, V, tau, MR=None):
     """ muUik and tauUik for Uik with L21(lamb) prior. 
         We do updates per column of U (so Uk). """
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
     assert U.shape[1] == V.shape[1]
+    MR = M*R if MR is None else MR
     tauUk = lamb + tau * ( M * V[:,k]**2 ).sum(axis=1)
     #muUk = 1. / tauUk * ( -lamb + tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
     V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
     U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
     muUk = 1. / tauUk * ( -lamb * U_ktilde.sum(axis=1) + tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+        numpy.dot(MR, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
     assert tauUk.shape == muUk.shape
     return (muUk, tauUk)
 
@@ -205,6 +212,7 @@ def gaussian_l21_mu_tau(k, lamb, R, M, U, V, tau):
 ''' (Gaussian) Gaussian + Volume Prior '''
 def adjugate_matrix(matrix):
     """ adj(matrix) = det(matrix) matrix^-1 """
+    count('matrix_inversions')
     return numpy.linalg.det(matrix) * numpy.linalg.inv(matrix)
 
 def gaussian_gaussian_volumeprior_mu_sigma(i, k, gamma, Ri, Mi, U, V, tau):
@@ -243,26 +251,27 @@ def gaussian_gaussian_volumeprior_mu_sigma(i, k, gamma, Ri, Mi, U, V, tau):
 
 
 ''' (Gausian) Exponential '''
-def gaussian_exponential_mu_tau(k, lamb, R, M, U, V, tau):
+def gaussian_exponential_mu_tau(k, lamb, R, M, U, V, tau, MR=None):
     """ muUik and tauUik for Uik with Exp(lamb) prior. 
         We do updates per column of U (so Uk). """
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
     assert U.shape[1] == V.shape[1]
+    MR = M*R if MR is None else MR
     tauUk = tau * ( M * V[:,k]**2 ).sum(axis=1)
     #muUk = 1. / tauUk * ( -lamb + tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
     V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
     U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
     muUk = 1. / tauUk * ( -lamb + tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+        numpy.dot(MR, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
     assert tauUk.shape == muUk.shape
     return (muUk, tauUk)
 
 
 ''' (Gausian) Exponential + Automatic Relevance Determination '''
-def gaussian_exponential_ard_mu_tau(k, lambdak, R, M, U, V, tau):
+def gaussian_exponential_ard_mu_tau(k, lambdak, R, M, U, V, tau, MR=None):
     """ mu and tau for Uik with Exp(lambda_k) prior.
         We do updates per column of U (so Uk). """
-    return gaussian_exponential_mu_tau(k=k, lamb=lambdak, R=R, M=M, U=U, V=V, tau=tau)
+    return gaussian_exponential_mu_tau(k=k, lamb=lambdak, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
 
 def exponential_ard_alpha_beta(alpha0, beta0, Uk, Vk):
     """ alpha_s and beta_s for lambdak with Gamma(alpha0,beta0) prior. """
@@ -273,26 +282,27 @@ def exponential_ard_alpha_beta(alpha0, beta0, Uk, Vk):
 
 
 ''' (Gausian) Truncated Normal '''
-def gaussian_tn_mu_tau(k, muU, tauU, R, M, U, V, tau):
+def gaussian_tn_mu_tau(k, muU, tauU, R, M, U, V, tau, MR=None):
     """ mu and tau for Uik with TN(muU,tauU) prior. 
         We do updates per column of U (so Uk). """
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
     assert U.shape[1] == V.shape[1]
+    MR = M*R if MR is None else MR
     tauUk = tauU + tau * ( M * V[:,k]**2 ).sum(axis=1)
     #muUk = 1. / tauUk * ( muU * tauU + tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
     V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
     U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
     muUk = 1. / tauUk * ( muU * tauU + tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+        numpy.dot(MR, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
     assert tauUk.shape == muUk.shape    
     return (muUk, tauUk)
 
 
 ''' (Gausian) Truncated Normal + hierarchical '''
-def gaussian_tn_hierarchical_mu_tau(k, muUk, tauUk, R, M, U, V, tau):
+def gaussian_tn_hierarchical_mu_tau(k, muUk, tauUk, R, M, U, V, tau, MR=None):
     """ mu and tau for Uik with TN(muUik,tauUik) prior, with hierarchical prior 
         for muUik, tauUik. We do updates per column of U (so Uk). """
-    return gaussian_tn_mu_tau(k=k, muU=muUk, tauU=tauUk, R=R, M=M, U=U, V=V, tau=tau)
+    return gaussian_tn_mu_tau(k=k, muU=muUk, tauU=tauUk, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
 
 def tn_hierarchical_mu_m_t(mu_mu, tau_mu, U, tauU):
     """ m and t for mu^U_ik with hierarchical prior (hyperparams mu_mu, tau_mu).
@@ -313,17 +323,18 @@ def tn_hierarchical_tau_a_b(a, b, U, muU):
 
 
 ''' (Gausian) Half Normal '''
-def gaussian_hn_mu_tau(k, sigma, R, M, U, V, tau):
+def gaussian_hn_mu_tau(k, sigma, R, M, U, V, tau, MR=None):
     """ mu and tau for Uik with HN(sigma) prior. 
         We do updates per column of U (so Uk). """
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
     assert U.shape[1] == V.shape[1]
+    MR = M*R if MR is None else MR
     tauUk = 1. / sigma**2 + tau * ( M * V[:,k]**2 ).sum(axis=1)
     #muUk = 1. / tauUk * ( tau * (M * ( (R-numpy.dot(U,V.T)+numpy.outer(U[:,k],V[:,k]))*V[:,k] )).sum(axis=1))
     V_ktilde = numpy.append(V[:,:k],V[:,k+1:],axis=1)
     U_ktilde = numpy.append(U[:,:k],U[:,k+1:],axis=1)
     muUk = 1. / tauUk * ( tau * (
-        numpy.dot(M*R, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
+        numpy.dot(MR, V[:,k]) - numpy.dot(M*numpy.dot(U_ktilde, V_ktilde.T), V[:,k])) )
     assert tauUk.shape == muUk.shape   
     return (muUk, tauUk)
 
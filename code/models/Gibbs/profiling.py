@@ -0,0 +1,116 @@
+"""
+Opt-in profiling of the Gibbs samplers. For each iteration, we record the wall
+time and number of calls of each update step, and the counts of the inner
+primitives used in that step:
+- 'matrix_inversions' -- calls to numpy.linalg.inv;
+- 'cholesky_factorisations' -- Cholesky decompositions, which the multivariate
+  draws use instead of inverting the precision (one per matrix decomposed);
+- 'rtnorm_rejections' -- proposals rejected by the truncated normal sampler rtnorm;
+- 'multinomial_draws' -- draws from a multinomial (one per observed entry, in Z).
+
+The models call self.profiler.start_iteration() at the start of each iteration,
+self.profiler.mark(step) after each step (attributing the time and primitive
+counts since the previous mark to that step), and end_iteration(step) after
+the last step. The profiler is disabled by default, in which case these calls
+return immediately. While an iteration of an enabled profiler is running, it is
+the :active profiler, and the primitives add their counts to it; otherwise they
+only check that there is no active profiler. So profiling one model does not
+make the primitives count for the other models in the process.
+
+USAGE
+    BMF.enable_profiling(fout=None)
+    BMF.run(iterations)
+    table = BMF.profiler.table()
+    summary = BMF.profiler.summary()
+where table is a list of dictionaries {'iteration', 'step', 'time', 'calls',
+and the primitive counts}, one per iteration and step, and summary maps each
+step to the same counts summed over the iterations. If :fout is given, the
+rows are also written to it as JSON lines, at the end of each iteration, and
+the file is closed by BMF.disable_profiling().
+"""
+
+import json
+import time
+
+PRIMITIVES = ['matrix_inversions', 'cholesky_factorisations', 'rtnorm_rejections', 'multinomial_draws']
+
+# The profiler whose iteration is running, if any
+active = None
+
+def count(primitive, n=1):
+    ''' Add :n to the count of the primitive of the active profiler, if any. '''
+    if active is not None:
+        active.counts[primitive] += n
+
+
+class Profiler(object):
+    def __init__(self,enabled=False,fout=None):
+        self.enabled = enabled
+        self.fout = open(fout,'w') if fout else None
+        self.rows = []              # One row per iteration and step, in order
+        self.iteration = 0          # Number of iterations started
+        self.counts = { primitive:0 for primitive in PRIMITIVES }
+
+    def start_iteration(self):
+        ''' Start timing a new iteration, and counting the primitives. '''
+        global active
+        if not self.enabled:
+            return
+        active = self
+        self.iteration += 1
+        self.rows_iteration = {}    # Mapping from the steps to their rows in this iteration
+        self.time_last, self.counts_last = time.time(), dict(self.counts)
+
+    def mark(self,step):
+        ''' Attribute the time and primitive counts since the last mark to :step. '''
+        if not self.enabled:
+            return
+        time_now = time.time()
+        if step not in self.rows_iteration:
+            row = { 'iteration':self.iteration, 'step':step, 'time':0., 'calls':0 }
+            row.update({ primitive:0 for primitive in PRIMITIVES })
+            self.rows_iteration[step] = row
+            self.rows.append(row)
+        row = self.rows_iteration[step]
+        row['time'] += time_now - self.time_last
+        row['calls'] += 1
+        for primitive in PRIMITIVES:
+            row[primitive] += self.counts[primitive] - self.counts_last[primitive]
+        self.time_last, self.counts_last = time_now, dict(self.counts)
+
+    def end_iteration(self,step):
+        ''' Mark the last step of the iteration, write its rows to fout, and
+            stop counting the primitives. '''
+        global active
+        if not self.enabled:
+            return
+        self.mark(step)
+        if active is self:
+            active = None
+        if self.fout:
+            for row in self.rows[-len(self.rows_iteration):]:
+                self.fout.write(json.dumps(row, sort_keys=True) + "\n")
+            self.fout.flush()
+
+    def close(self):
+        ''' Stop counting the primitives, and close fout. '''
+        global active
+        if active is self:
+            active = None
+        if self.fout:
+            self.fout.close()
+            self.fout = None
+
+    def table(self):
+        ''' Return the list of rows, one per iteration and step. '''
+        return list(self.rows)
+
+    def summary(self):
+        ''' Return a dictionary from the steps to their time, calls, and
+            primitive counts, summed over all iterations. '''
+        summary = {}
+        for row in self.rows:
+            totals = summary.setdefault(row['step'], { name:0 for name in ['time','calls']+PRIMITIVES })
+            for name in totals:
+                totals[name] += row[name]
+        return summary
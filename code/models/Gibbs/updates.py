@@ -32,13 +32,13 @@ Other updates:
 
 from parameters import gaussian_tau_alpha_beta
 from parameters import gaussian_gaussian_mu_tau
-from parameters import gaussian_gaussian_mu_sigma
-from parameters import gaussian_gaussian_wishart_mu_sigma
+from parameters import gaussian_gaussian_h_precision
+from parameters import gaussian_gaussian_wishart_h_precision
 from parameters import gaussian_wishart_beta0_v0_mu0_W0
-from parameters import gaussian_gaussian_ard_mu_sigma
+from parameters import gaussian_gaussian_ard_h_precision
 from parameters import gaussian_ard_alpha_beta
 from parameters import gaussian_l21_mu_tau
-from parameters import gaussian_laplace_mu_precision
+from parameters import gaussian_laplace_h_precision
 from parameters import laplace_lambdaU_mu_tau
 from parameters import laplace_etaU_mu_tau
 from parameters import gaussian_gaussian_volumeprior_mu_sigma
@@ -56,24 +56,28 @@ from parameters import poisson_gamma_hierarchical_a_b
 from parameters import gamma_hierarchical_hUi_a_b
 from parameters import poisson_dirichlet_alpha
 
-from distributions.gamma import gamma_draw
-from distributions.multivariate_normal import multivariate_normal_draw
-from distributions.normal_inverse_wishart import normal_inverse_wishart_draw
-from distributions.normal import normal_draw
+from distributions.gamma import gamma_draw, gamma_vector_draw
+from distributions.multivariate_normal import multivariate_normal_information_draw
+from distributions.normal_inverse_wishart import normal_inverse_wishart_bartlett_draw
+from distributions.normal import normal_draw, normal_vector_draw
 from distributions.truncated_normal import truncated_normal_draw
 from distributions.truncated_normal_vector import truncated_normal_vector_draw
 from distributions.multinomial import multinomial_draw
 from distributions.dirichlet import dirichlet_draw
 from distributions.inverse_gaussian import inverse_gaussian_draw
 
+from cache import observed_row
+from profiling import count
+
 import itertools
 import numpy
 
 
 ''' General Gaussian and Poisson models '''
-def update_tau_gaussian(alpha, beta, R, M, U, V):
-    """ Update tau (noise) in Gaussian models. """
-    alpha_s, beta_s = gaussian_tau_alpha_beta(alpha, beta, R, M, U, V)
+def update_tau_gaussian(alpha, beta, R, M, U, V, cache=None):
+    """ Update tau (noise) in Gaussian models. cache is from compute_cache. """
+    size_Omega = None if cache is None else cache['size_Omega']
+    alpha_s, beta_s = gaussian_tau_alpha_beta(alpha, beta, R, M, U, V, size_Omega=size_Omega)
     new_tau = gamma_draw(alpha=alpha_s, beta=beta_s)
     return new_tau
 
@@ -85,40 +89,44 @@ def update_tau_gaussian(alpha, beta, R, M, U, V):
 #        Z[i,j,:] = multinomial_draw(n=n[i,j], p=p[i,j])
 #    return Z
     
-def update_Z_poisson(R, M, Omega, Z, U, V):
-    """ Update Z in Poisson models. """
+def update_Z_poisson(R, M, Z, U, V, cache=None):
+    """ Update Z in Poisson models. cache is from compute_cache. """
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    n_list, p_list = poisson_Z_n_p(R=R, U=U, V=V, Omega=Omega)
-    for index,(i,j) in enumerate(Omega):
-        Z[i,j,:] = multinomial_draw(n=n_list[index], p=p_list[index])
+    rows, columns = numpy.nonzero(M) if cache is None else (cache['Omega_rows'], cache['Omega_columns'])
+    n_list, p_list = poisson_Z_n_p(R=R, U=U, V=V, indices=(rows, columns))
+    for index in range(len(rows)):
+        Z[rows[index],columns[index],:] = multinomial_draw(n=n_list[index], p=p_list[index])
     return Z    
     
     
 ''' (Gausian) Gaussian (univariate posterior) '''
-def update_U_gaussian_gaussian_univariate(lamb, R, M, U, V, tau):
+def update_U_gaussian_gaussian_univariate(lamb, R, M, U, V, tau, cache=None):
     """ Update U for All Gaussian model (univariate posterior). """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = R.shape[0], V.shape[1]
     assert R.shape == M.shape and R.shape[1] == V.shape[0]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
-        muUk, tauUk = gaussian_gaussian_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau)
+        muUk, tauUk = gaussian_gaussian_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         for i in range(I):
             U[i,k] = normal_draw(mu=muUk[i], tau=tauUk[i])
     return U
 
-def update_V_gaussian_gaussian_univariate(lamb, R, M, U, V, tau):  
+def update_V_gaussian_gaussian_univariate(lamb, R, M, U, V, tau, cache=None):  
     """ Update V for All Gaussian model (univariate posterior). """
-    return update_U_gaussian_gaussian_univariate(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_gaussian_univariate(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
 
 
 ''' (Gaussian) Gaussian (multivariate posterior) '''
-def update_U_gaussian_gaussian_multivariate(lamb, R, M, V, tau):
+def update_U_gaussian_gaussian_multivariate(lamb, R, M, V, tau, cache=None):
     """ Update U for All Gaussian model (multivariate posterior). """
     I, K = R.shape[0], V.shape[1]
     assert R.shape == M.shape and R.shape[1] == V.shape[0]
     U = numpy.zeros((I,K))
     for i in range(I):
-        muUi, sigmaUi = gaussian_gaussian_mu_sigma(lamb=lamb, Ri=R[i], Mi=M[i], V=V, tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, sigma=sigmaUi)
+        Ri, Mi, Vi = observed_row(i=i, R=R, M=M, V=V, cache=cache)
+        hUi, precisionUi = gaussian_gaussian_h_precision(lamb=lamb, Ri=Ri, Mi=Mi, V=Vi, tau=tau)
+        U[i,:] = multivariate_normal_information_draw(h=hUi, precision=precisionUi)
     return U
     
 #def update_U_gaussian_gaussian_multivariate(lamb, R, M, V, tau):
@@ -133,58 +141,65 @@ def update_U_gaussian_gaussian_multivariate(lamb, R, M, V, tau):
 #        U[i,:] = multivariate_normal_draw(mu=muU[i], sigma=sigmaU[i])
 #    return U
 
-def update_V_gaussian_gaussian_multivariate(lamb, R, M, U, tau):  
+def update_V_gaussian_gaussian_multivariate(lamb, R, M, U, tau, cache=None):  
     """ Update V for All Gaussian model (multivariate posterior). """
-    return update_U_gaussian_gaussian_multivariate(lamb=lamb, R=R.T, M=M.T, V=U, tau=tau)
+    return update_U_gaussian_gaussian_multivariate(lamb=lamb, R=R.T, M=M.T, V=U, tau=tau, cache=cache)
 
 
 ''' (Gaussian) Gaussian + Wishart '''
-def update_U_gaussian_gaussian_wishart(muU, sigmaU, R, M, V, tau):
-    """ Update U for All Gaussian + Wishart model. """
+def update_U_gaussian_gaussian_wishart(muU, sigmaU, R, M, V, tau, cache=None, sigmaU_inv=None):
+    """ Update U for All Gaussian + Wishart model. sigmaU_inv is the inverse 
+        of sigmaU, if already computed (by update_muU_sigmaU). """
     I, K = R.shape[0], V.shape[1]
     assert R.shape == M.shape and R.shape[1] == V.shape[0]
     assert muU.shape == (K,) and sigmaU.shape == (K,K)
-    sigmaU_inv = numpy.linalg.inv(sigmaU)
+    if sigmaU_inv is None:
+        sigmaU_inv = numpy.linalg.inv(sigmaU)
+        count('matrix_inversions')
     U = numpy.zeros((I,K))
     for i in range(I):
-        muUi, sigmaUi = gaussian_gaussian_wishart_mu_sigma(
-            muU=muU, sigmaU_inv=sigmaU_inv, Ri=R[i], Mi=M[i], V=V, tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, sigma=sigmaUi)
+        Ri, Mi, Vi = observed_row(i=i, R=R, M=M, V=V, cache=cache)
+        hUi, precisionUi = gaussian_gaussian_wishart_h_precision(
+            muU=muU, sigmaU_inv=sigmaU_inv, Ri=Ri, Mi=Mi, V=Vi, tau=tau)
+        U[i,:] = multivariate_normal_information_draw(h=hUi, precision=precisionUi)
     return U
 
-def update_V_gaussian_gaussian_wishart(muV, sigmaV, R, M, U, tau):  
+def update_V_gaussian_gaussian_wishart(muV, sigmaV, R, M, U, tau, cache=None, sigmaV_inv=None):  
     """ Update V for All Gaussian + Wishart model. """
     return update_U_gaussian_gaussian_wishart(
-        muU=muV, sigmaU=sigmaV, R=R.T, M=M.T, V=U, tau=tau)
+        muU=muV, sigmaU=sigmaV, R=R.T, M=M.T, V=U, tau=tau, cache=cache, sigmaU_inv=sigmaV_inv)
 
 def update_muU_sigmaU_gaussian_gaussian_wishart(mu0, beta0, v0, W0, U):
-    """ Update muU and sigmaU for All Gaussian + Wishart model. """
+    """ Update muU and sigmaU for All Gaussian + Wishart model. Also return
+        the inverse of sigmaU, for the updates of U. """
     beta0_s, v0_s, mu0_s, W0_s = gaussian_wishart_beta0_v0_mu0_W0(
         beta0=beta0, v0=v0, mu0=mu0, W0=W0, U=U)
-    new_muU, new_sigmaU = normal_inverse_wishart_draw(mu0=mu0_s,beta0=beta0_s,v0=v0_s,W0=W0_s)
-    return (new_muU, new_sigmaU)
+    new_muU, new_sigmaU, new_sigmaU_inv, _ = normal_inverse_wishart_bartlett_draw(
+        mu0=mu0_s,beta0=beta0_s,v0=v0_s,W0=W0_s)
+    return (new_muU, new_sigmaU, new_sigmaU_inv)
 
 def update_muV_sigmaV_gaussian_gaussian_wishart(mu0, beta0, v0, W0, V):
-    """ Update muV and sigmaV for All Gaussian + Wishart model. """
+    """ Update muV and sigmaV (and the inverse of sigmaV) for All Gaussian + Wishart model. """
     return update_muU_sigmaU_gaussian_gaussian_wishart(
         mu0=mu0, beta0=beta0, v0=v0, W0=W0, U=V)
     
 
 ''' (Gaussian) Gaussian + Automatic Relevance Determination '''
-def update_U_gaussian_gaussian_multivariate_ard(lamb, R, M, V, tau):
+def update_U_gaussian_gaussian_multivariate_ard(lamb, R, M, V, tau, cache=None):
     """ Update U for All Gaussian + ARD model. """
     I, K = R.shape[0], V.shape[1]
     assert R.shape == M.shape and R.shape[1] == V.shape[0]
     U = numpy.zeros((I,K))
     for i in range(I):
-        muUi, sigmaUi = gaussian_gaussian_ard_mu_sigma(
-            lamb=lamb, Ri=R[i], Mi=M[i], V=V, tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, sigma=sigmaUi)
+        Ri, Mi, Vi = observed_row(i=i, R=R, M=M, V=V, cache=cache)
+        hUi, precisionUi = gaussian_gaussian_ard_h_precision(
+            lamb=lamb, Ri=Ri, Mi=Mi, V=Vi, tau=tau)
+        U[i,:] = multivariate_normal_information_draw(h=hUi, precision=precisionUi)
     return U
     
-def update_V_gaussian_gaussian_multivariate_ard(lamb, R, M, U, tau):
+def update_V_gaussian_gaussian_multivariate_ard(lamb, R, M, U, tau, cache=None):
     """ Update V for All Gaussian + ARD model. """
-    return update_U_gaussian_gaussian_multivariate_ard(lamb=lamb, R=R.T, M=M.T, V=U, tau=tau)
+    return update_U_gaussian_gaussian_multivariate_ard(lamb=lamb, R=R.T, M=M.T, V=U, tau=tau, cache=cache)
 
 def update_lambda_gaussian_gaussian_ard(alpha0, beta0, U, V):
     """ Update lambda (vector) for All Gaussian + ARD model. """
@@ -198,35 +213,38 @@ def update_lambda_gaussian_gaussian_ard(alpha0, beta0, U, V):
 
 
 ''' (Gaussian) L^2_1 '''
-def update_U_gaussian_l21(lamb, R, M, U, V, tau):
+def update_U_gaussian_l21(lamb, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + L^2_1 Prior model. """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
-        muUk, tauUk = gaussian_l21_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau)
+        muUk, tauUk = gaussian_l21_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         U[:,k] = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
     return U
     
-def update_V_gaussian_l21(lamb, R, M, U, V, tau):
+def update_V_gaussian_l21(lamb, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Exponential model. """
-    return update_U_gaussian_l21(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_l21(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
 
 
 ''' (Gaussian) Laplace '''
-def update_U_gaussian_laplace(lambdaU, R, M, V, tau):
+def update_U_gaussian_laplace(lambdaU, R, M, V, tau, cache=None):
     """ Update U for Gaussian + Laplace model. """
     I, K = R.shape[0], V.shape[1]
     assert R.shape == M.shape and R.shape[1] == V.shape[0]
     U = numpy.zeros((I,K))
     for i in range(I):
-        muUi, precisionUi = gaussian_laplace_mu_precision(
-            Ri=R[i], Mi=M[i], V=V, lambdaUi=lambdaU[i,:], tau=tau)
-        U[i,:] = multivariate_normal_draw(mu=muUi, precision=precisionUi)
+        Ri, Mi, Vi = observed_row(i=i, R=R, M=M, V=V, cache=cache)
+        hUi, precisionUi = gaussian_laplace_h_precision(
+            Ri=Ri, Mi=Mi, V=Vi, lambdaUi=lambdaU[i,:], tau=tau)
+        U[i,:] = multivariate_normal_information_draw(h=hUi, precision=precisionUi)
     return U
 
-def update_V_gaussian_laplace(lambdaV, R, M, U, tau):
+def update_V_gaussian_laplace(lambdaV, R, M, U, tau, cache=None):
     """ Update V for Gaussian + Laplace model. """
-    return update_U_gaussian_laplace(lambdaU=lambdaV, R=R.T, M=M.T, V=U, tau=tau)
+    return update_U_gaussian_laplace(lambdaU=lambdaV, R=R.T, M=M.T, V=U, tau=tau, cache=cache)
 
 def update_lambdaU_gaussian_laplace(U, etaU):
     """ Update lambdaU for Gaussian + Laplace model. """
@@ -258,66 +276,74 @@ def update_etaV_gaussian_laplace(lambdaV, a, b):
 
 
 ''' (Gaussian) Volume Prior '''
-def update_U_gaussian_volumeprior(gamma, R, M, U, V, tau):
+def update_U_gaussian_volumeprior(gamma, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + Volume Prior model. """
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    for i,k in itertools.product(range(I),range(K)):
-        muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
-            i=i, k=k, gamma=gamma, Ri=R[i,:], Mi=M[i,:], U=U, V=V, tau=tau)
-        U[i,k] = normal_draw(mu=muUik, tau=tauUik)
+    for i in range(I):
+        Ri, Mi, Vi = observed_row(i=i, R=R, M=M, V=V, cache=cache)
+        for k in range(K):
+            muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
+                i=i, k=k, gamma=gamma, Ri=Ri, Mi=Mi, U=U, V=Vi, tau=tau)
+            U[i,k] = normal_draw(mu=muUik, tau=tauUik)
     return U
     
-def update_V_gaussian_volumeprior(gamma, R, M, U, V, tau):
+def update_V_gaussian_volumeprior(gamma, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Volume Prior model. """
-    return update_U_gaussian_volumeprior(gamma=gamma, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_volumeprior(gamma=gamma, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
 
 
 ''' (Gausian) Gaussian + Volume Prior '''
-def update_U_gaussian_volumeprior_nonnegative(gamma, R, M, U, V, tau):
+def update_U_gaussian_volumeprior_nonnegative(gamma, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + nonnegative Volume Prior model. """
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
-    for i,k in itertools.product(range(I),range(K)):
-        muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
-            i=i, k=k, gamma=gamma, Ri=R[i,:], Mi=M[i,:], U=U, V=V, tau=tau)
-        U[i,k] = truncated_normal_draw(mu=muUik, tau=tauUik)
+    for i in range(I):
+        Ri, Mi, Vi = observed_row(i=i, R=R, M=M, V=V, cache=cache)
+        for k in range(K):
+            muUik, tauUik = gaussian_gaussian_volumeprior_mu_sigma(
+                i=i, k=k, gamma=gamma, Ri=Ri, Mi=Mi, U=U, V=Vi, tau=tau)
+            U[i,k] = truncated_normal_draw(mu=muUik, tau=tauUik)
     return U
     
-def update_V_gaussian_volumeprior_nonnegative(gamma, R, M, U, V, tau):
+def update_V_gaussian_volumeprior_nonnegative(gamma, R, M, U, V, tau, cache=None):
     """ Update V for All Gaussian + nonnegative Volume Prior model. """
     return update_U_gaussian_volumeprior_nonnegative(
-        gamma=gamma, R=R.T, M=M.T, U=V, V=U, tau=tau)
+        gamma=gamma, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
 
 
 ''' (Gaussian) Exponential '''
-def update_U_gaussian_exponential(lamb, R, M, U, V, tau):
+def update_U_gaussian_exponential(lamb, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + Exponential model. """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
-        muUk, tauUk = gaussian_exponential_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau)
+        muUk, tauUk = gaussian_exponential_mu_tau(k=k, lamb=lamb, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         U[:,k] = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
     return U
     
-def update_V_gaussian_exponential(lamb, R, M, U, V, tau):
+def update_V_gaussian_exponential(lamb, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Exponential model. """
-    return update_U_gaussian_exponential(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_exponential(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
     
 
 ''' (Gaussian) Exponential + Automatic Relevance Determination '''
-def update_U_gaussian_exponential_ard(lamb, R, M, U, V, tau):
+def update_U_gaussian_exponential_ard(lamb, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + Exponential + ARD model. """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
-        muUk, tauUk = gaussian_exponential_ard_mu_tau(k=k, lambdak=lamb[k], R=R, M=M, U=U, V=V, tau=tau)
+        muUk, tauUk = gaussian_exponential_ard_mu_tau(k=k, lambdak=lamb[k], R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         U[:,k] = truncated_normal_vector_draw(mus=muUk, taus=tauUk)
     return U
     
-def update_V_gaussian_exponential_ard(lamb, R, M, U, V, tau):
+def update_V_gaussian_exponential_ard(lamb, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Exponential + ARD model. """
-    return update_U_gaussian_exponential_ard(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_exponential_ard(lamb=lamb, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
     
 def update_lambda_gaussian_exponential_ard(alpha0, beta0, U, V):
     """ Update lambda (vector) for Gaussian + Exponential + ARD model. """
@@ -331,46 +357,47 @@ def update_lambda_gaussian_exponential_ard(alpha0, beta0, U, V):
     
 
 ''' (Gaussian) Truncated Normal '''
-def update_U_gaussian_truncatednormal(muU, tauU, R, M, U, V, tau):
+def update_U_gaussian_truncatednormal(muU, tauU, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + Truncated Normal model. """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
         muUk_s, tauUk_s = gaussian_tn_mu_tau(
-            k=k, muU=muU, tauU=tauU, R=R, M=M, U=U, V=V, tau=tau)
+            k=k, muU=muU, tauU=tauU, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         U[:,k] = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
     return U
     
-def update_V_gaussian_truncatednormal(muV, tauV, R, M, U, V, tau):
+def update_V_gaussian_truncatednormal(muV, tauV, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Truncated Normal model. """
     return update_U_gaussian_truncatednormal(
-        muU=muV, tauU=tauV, R=R.T, M=M.T, U=V, V=U, tau=tau)
+        muU=muV, tauU=tauV, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
 
 
 ''' (Gaussian) Truncated Normal + hierarchical '''
-def update_U_gaussian_truncatednormal_hierarchical(muU, tauU, R, M, U, V, tau):
+def update_U_gaussian_truncatednormal_hierarchical(muU, tauU, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + Truncated Normal + hierarchical model. """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = U.shape
     assert R.shape == M.shape and R.shape[0] == U.shape[0] and R.shape[1] == V.shape[0]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
         muUk_s, tauUk_s = gaussian_tn_hierarchical_mu_tau(
-            k=k, muUk=muU[:,k], tauUk=tauU[:,k], R=R, M=M, U=U, V=V, tau=tau)
+            k=k, muUk=muU[:,k], tauUk=tauU[:,k], R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         U[:,k] = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
     return U
     
-def update_V_gaussian_truncatednormal_hierarchical(muV, tauV, R, M, U, V, tau):
+def update_V_gaussian_truncatednormal_hierarchical(muV, tauV, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Truncated Normal + hierarchical model. """
     return update_U_gaussian_truncatednormal_hierarchical(
-        muU=muV, tauU=tauV, R=R.T, M=M.T, U=V, V=U, tau=tau)
+        muU=muV, tauU=tauV, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
     
 def update_muU_gaussian_truncatednormal_hierarchical(mu_mu, tau_mu, U, tauU):
     """ Update muU (matrix) for Gaussian + Truncated Normal + hierarchical model. """
-    I, K = U.shape
     assert U.shape == tauU.shape
     (m_mu, t_mu) = tn_hierarchical_mu_m_t(mu_mu=mu_mu, tau_mu=tau_mu, U=U, tauU=tauU)
-    new_muU = numpy.zeros((I,K))
-    for i,k in itertools.product(range(I),range(K)):
-        new_muU[i,k] = normal_draw(mu=m_mu[i,k], tau=t_mu[i,k])
+    new_muU = normal_vector_draw(mus=m_mu, taus=t_mu)
     return new_muU
 
 def update_muV_gaussian_truncatednormal_hierarchical(mu_mu, tau_mu, V, tauV):
@@ -380,12 +407,9 @@ def update_muV_gaussian_truncatednormal_hierarchical(mu_mu, tau_mu, V, tauV):
     
 def update_tauU_gaussian_truncatednormal_hierarchical(a, b, U, muU):
     """ Update tauU (matrix) for Gaussian + Truncated Normal + hierarchical model. """
-    I, K = U.shape
     assert U.shape == muU.shape
     (a_s, b_s) = tn_hierarchical_tau_a_b(a=a, b=b, U=U, muU=muU)
-    new_tauU = numpy.zeros((I,K))
-    for i,k in itertools.product(range(I),range(K)):
-        new_tauU[i,k] = gamma_draw(alpha=a_s[i,k], beta=b_s[i,k])
+    new_tauU = gamma_vector_draw(alphas=a_s, betas=b_s)
     return new_tauU
 
 def update_tauV_gaussian_truncatednormal_hierarchical(a, b, V, muV):
@@ -394,25 +418,28 @@ def update_tauV_gaussian_truncatednormal_hierarchical(a, b, V, muV):
 
 
 ''' (Gaussian) Half Normal '''
-def update_U_gaussian_halfnormal(sigma, R, M, U, V, tau):
+def update_U_gaussian_halfnormal(sigma, R, M, U, V, tau, cache=None):
     """ Update U for Gaussian + Half Normal model. """
+    R, M = (R, M) if cache is None else (cache['R'], cache['M'])
     I, K = U.shape
     assert R.shape == M.shape and U.shape[0] == R.shape[0] and V.shape[0] == R.shape[1]
+    MR = M*R if cache is None else cache['MR']
     for k in range(K):
         muUk_s, tauUk_s = gaussian_hn_mu_tau(
-            k=k, sigma=sigma, R=R, M=M, U=U, V=V, tau=tau)
+            k=k, sigma=sigma, R=R, M=M, U=U, V=V, tau=tau, MR=MR)
         U[:,k] = truncated_normal_vector_draw(mus=muUk_s, taus=tauUk_s)
     return U
     
-def update_V_gaussian_halfnormal(sigma, R, M, U, V, tau):
+def update_V_gaussian_halfnormal(sigma, R, M, U, V, tau, cache=None):
     """ Update V for Gaussian + Half Normal model. """
-    return update_U_gaussian_halfnormal(sigma=sigma, R=R.T, M=M.T, U=V, V=U, tau=tau)
+    return update_U_gaussian_halfnormal(sigma=sigma, R=R.T, M=M.T, U=V, V=U, tau=tau, cache=cache)
 
 
 
 ''' (Poisson) Gamma '''
-def update_U_poisson_gamma(a, b, M, V, Z):
+def update_U_poisson_gamma(a, b, M, V, Z, cache=None):
     """ Update U for Poisson + Gamma model. """
+    M = M if cache is None else cache['M']
     I, J, K = Z.shape
     assert V.shape == (J,K) and M.shape == (I,J)
     U = numpy.zeros((I,K))
@@ -431,14 +458,15 @@ def update_U_poisson_gamma(a, b, M, V, Z):
 #        U[i,k] = gamma_draw(alpha=a_s[i,k], beta=b_s[i,k])
 #    return U
     
-def update_V_poisson_gamma(a, b, M, U, Z):
+def update_V_poisson_gamma(a, b, M, U, Z, cache=None):
     """ Update V for Poisson + Gamma model. """
-    return update_U_poisson_gamma(a=a, b=b, M=M.T, V=U, Z=Z.transpose(1,0,2))
+    return update_U_poisson_gamma(a=a, b=b, M=M.T, V=U, Z=Z.transpose(1,0,2), cache=cache)
     
     
 ''' (Poisson) Gamma + hierarchical '''
-def update_U_poisson_gamma_hierarchical(a, hU, M, V, Z):
+def update_U_poisson_gamma_hierarchical(a, hU, M, V, Z, cache=None):
     """ Update U for Poisson + Gamma + hierarchical model. """
+    M = M if cache is None else cache['M']
     I, J, K = Z.shape
     assert hU.shape == (I,) and V.shape == (J,K)
     U = numpy.zeros((I,K))
@@ -448,9 +476,9 @@ def update_U_poisson_gamma_hierarchical(a, hU, M, V, Z):
         U[i,k] = gamma_draw(alpha=a_s, beta=b_s)
     return U
 
-def update_V_poisson_gamma_hierarchical(a, hV, M, U, Z):
+def update_V_poisson_gamma_hierarchical(a, hV, M, U, Z, cache=None):
     """ Update V for Poisson + Gamma + hierarchical model. """
-    return update_U_poisson_gamma_hierarchical(a=a, hU=hV, M=M.T, V=U, Z=Z.transpose(1,0,2))
+    return update_U_poisson_gamma_hierarchical(a=a, hU=hV, M=M.T, V=U, Z=Z.transpose(1,0,2), cache=cache)
     
 def update_hU_poisson_gamma_hierarchical(ap, bp, a, U):
     """ Update hU (vector) for Poisson + Gamma + hierarchical model. """
@@ -467,8 +495,9 @@ def update_hV_poisson_gamma_hierarchical(ap, bp, a, V):
     
 
 ''' (Poisson) Dirichlet '''
-def update_U_poisson_dirichlet(alpha, M, Z):
+def update_U_poisson_dirichlet(alpha, M, Z, cache=None):
     """ Update U for Poisson + Dirichlet model. """
+    M = M if cache is None else cache['M']
     I, J, K = Z.shape
     assert M.shape == (I,J) and alpha.shape == (K,)
     U = numpy.zeros((I,K))
@@ -477,6 +506,6 @@ def update_U_poisson_dirichlet(alpha, M, Z):
         U[i,:] = dirichlet_draw(alpha=alpha_s)
     return U
         
-def update_V_poisson_dirichlet(alpha, M, Z):
+def update_V_poisson_dirichlet(alpha, M, Z, cache=None):
     """ Update V for Poisson + Dirichlet model. """
-    return update_U_poisson_dirichlet(alpha=alpha, M=M.T, Z=Z.transpose(1,0,2))
\ No newline at end of file
+    return update_U_poisson_dirichlet(alpha=alpha, M=M.T, Z=Z.transpose(1,0,2), cache=cache)
\ No newline at end of file
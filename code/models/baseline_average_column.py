@@ -18,7 +18,7 @@ class ColumnAverage(BMF):
         return
     
         
-    def run(self,iterations):
+    def run(self,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
         """ Compute the row averages of R. """
         column_averages = []
         for j in range(self.J):
@@ -27,12 +27,18 @@ class ColumnAverage(BMF):
             column_averages.append(average)
         self.column_averages = numpy.array(column_averages)
         
+        # The predictions are deterministic, so accumulate them just once
+        self.initialise_predictive(M_test=M_test, burn_in=0, thinning=1)
+        self.update_predictive(0)
+        
+    def predict_entries(self,rows,columns):
+        """ Return the column averages for the entries (rows[n],columns[n]). """
+        return self.column_averages[columns]
+        
             
     """ Override the predict() method to use the row averages. """
     def predict(self,M_pred,burn_in,thinning):
         """ Use the row averages predict missing values. """
-        R_pred = numpy.reshape(numpy.repeat(self.column_averages, self.I), (self.J, self.I)).T
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
\ No newline at end of file
+        rows, columns = numpy.nonzero(M_pred)
+        R_pred = self.predict_entries(rows,columns)
+        return self.predict_performances(rows,columns,R_pred)
\ No newline at end of file
@@ -14,12 +14,33 @@ Or more efficiently using matrix operations:
 And realising that elements in each column in U and V are independent:
 - U.k <- U.k * sum(M * [V.k * (R / (U dot V.T))], axis=1) / sum(M dot V.k, axis=1)
 - V.k <- V.k * sum(M * [U.k * (R / (U dot V.T))], axis=0) / sum(M dot U.k, axis=0)
+We update all K columns at once, using the standard matrix form:
+- U <- U * [Q dot V] / [M dot V]
+- V <- V * [Q.T dot U] / [M.T dot U]
+where Q is the sparse matrix with Qij = Rij / (Ui dot Vj) for (i,j) in Omega
+(the observed entries), and M is stored as a sparse matrix too. So we never
+compute the full U dot V.T, and each update costs O(|Omega|*K). The 
+performance while running is also computed over Omega only.
+
+Unlike the other models, we do not store dense copies of R and M: self.R and
+self.M are scipy.sparse CSR matrices (self.R with the entries of R that are
+stored or nonzero, including the test entries, and self.M with the observed
+entries), and the values of R for Omega are stored as a vector. So the memory
+used is O(|Omega| + nonzeros of R), if R and M are given in sparse form.
+
+The I-divergence of the observed entries,
+    sum_(i,j) in Omega [ Rij log(Rij / (Ui dot Vj)) - Rij + (Ui dot Vj) ],
+is stored per iteration in all_I_div. If the hyperparameter tolerance is set,
+we stop early once it improves by no more than tolerance (relative to its 
+previous value), and then truncate all_U and all_V; so tolerance=0 stops once
+it no longer decreases. By default (tolerance=None) we run all iterations.
 
 We expect the following arguments:
 - R, the matrix
 - M, the mask matrix indicating observed values (1) and unobserved ones (0)
+  (R and M can also be given as scipy.sparse matrices, and M as an IndexMask)
 - K, the number of latent factors
-    
+
 Initialisation can be done by running the initialise(init) function. We initialise as follows:
 - init_UV = 'ones'        -> U[i,k] = V[j,k] = 1
           = 'random'      -> U[i,k] ~ U(0,1), V[j,k] ~ U(0,1), 
@@ -29,40 +50,61 @@ Initialisation can be done by running the initialise(init) function. We initiali
 
 from bmf import BMF
 from Gibbs.distributions.exponential import exponential_draw
+from Gibbs.profiling import Profiler
 
 import itertools
 import numpy
+import scipy.sparse
 import time
 
 METRICS = ['MSE', 'R^2', 'Rp']
 OPTIONS_INIT = ['ones', 'random', 'exponential']
 DEFAULT_HYPERPARAMETERS = {
-    'exponential_prior': 1.
+    'exponential_prior': 1.,
+    'tolerance': None,
 }
 MINIMUM_R = 0.0001
 
 class MF_Nonprobabilistic(BMF):
     def __init__(self,R,M,K,hyperparameters={}):
-        """ Set up the class. """
-        super(MF_Nonprobabilistic, self).__init__(R, M, K)
+        """ Set up the class. We do not call BMF.__init__(), as it makes
+            dense copies of R and M, and computes the cache of the Gibbs updates. """
+        self.K = K
         self.exponential_prior = hyperparameters.get('exponential_prior',  DEFAULT_HYPERPARAMETERS['exponential_prior'])
-                   
-        # Add a tiny amount of each R value, to prevent NaN to come up if an  
+        self.tolerance = hyperparameters.get('tolerance', DEFAULT_HYPERPARAMETERS['tolerance'])
+        self.profiler = Profiler()
+        self.memory = None
+
+        # Sort the indices of a sparse mask, so that the observed entries are 
+        # in row-major order (as from numpy.nonzero of a dense mask or IndexMask)
+        if scipy.sparse.issparse(M):
+            M = scipy.sparse.csr_matrix(M)
+            M.sort_indices()
+        self.R = scipy.sparse.csr_matrix(R, dtype=float)
+        assert len(self.R.shape) == 2, "Input matrix R is not a two-dimensional array, " \
+            "but instead %s-dimensional." % len(self.R.shape)
+        assert self.R.shape == M.shape, "Input matrix R is not of the same size as " \
+            "the indicator matrix M: %s and %s respectively." % (self.R.shape,M.shape)
+        (self.I,self.J) = self.R.shape
+
+        # The observed entries are in row-major order, so we can build the 
+        # sparse matrices in CSR format without sorting them
+        self.Omega_rows, self.Omega_columns = numpy.nonzero(M)
+        self.size_Omega = float(len(self.Omega_rows))
+        self.indptr = numpy.append(0, numpy.cumsum(numpy.bincount(self.Omega_rows, minlength=self.I)))
+        self.M = self.sparse_Omega(numpy.ones(len(self.Omega_rows)))
+        self.check_empty_rows_columns()
+
+        # Add a tiny amount to each R value, to prevent NaN to come up if an  
         # entire row/column in R is just 0.'s
-        self.R += MINIMUM_R
-        
-        # For computing the I-div it is easier if unknown values are 1's, not 0's, to avoid numerical issues
-        self.R_excl_unknown = numpy.empty((self.I,self.J))
-        for i,j in itertools.product(range(0,self.I),range(0,self.J)):
-            self.R_excl_unknown[i,j] = self.R[i,j] if self.M[i,j] else 1.
-                    
-                
-                      
+        self.R_Omega = self.R_entries(self.Omega_rows, self.Omega_columns)
+
+
     def initialise(self,init):
         """ Initialise the values of the random variables in this model. """
         assert init in OPTIONS_INIT, \
             "Unknown initialisation option: %s. Should be one of %s." % (init, OPTIONS_INIT)
-            
+
         if init == 'ones':
             self.U = numpy.ones((self.I,self.K))
             self.V = numpy.ones((self.J,self.K))
@@ -76,27 +118,40 @@ class MF_Nonprobabilistic(BMF):
                 self.U[i,k] = exponential_draw(self.exponential_prior)
             for j,k in itertools.product(range(self.J),range(self.K)):
                 self.V[j,k] = exponential_draw(self.exponential_prior)
-    
-    
-    def run(self,iterations):
-        """ Run the Gibbs sampler for the specified number of iterations. """
+
+
+    def run(self,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
+        """ Run the Gibbs sampler for the specified number of iterations. If 
+            M_test is given, accumulate the posterior predictive for those 
+            entries (after burn_in and thinning) while sampling. """
         assert hasattr(self,'U') and hasattr(self,'V'), "U and V have not been initialised - please run initialise() first."        
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))
+        draws = self.initialise_traces(iterations=iterations, M_test=M_test, store_traces=store_traces)
+        self.all_U = numpy.zeros((draws,self.I,self.K))  
+        self.all_V = numpy.zeros((draws,self.J,self.K))
+        self.all_I_div = []
         self.all_times = []
         self.all_performances = { metric: [] for metric in METRICS } 
-            
+        self.initialise_predictive(M_test=M_test, burn_in=burn_in, thinning=thinning)
+        I_div = self.compute_I_div()
+
         time_start = time.time()
         for it in range(iterations):
+            self.profiler.start_iteration()
             # Update the matrices U, V
-            for k in range(self.K):
-                self.update_U(k)
-            for k in range(self.K):
-                self.update_V(k)
-            
+            self.update_U()
+            self.profiler.mark('U')
+            self.update_V()
+            self.profiler.mark('V')
+
             # Store the values
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            
+            if self.store_traces:
+                self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
+            self.profiler.mark('store')
+
+            # Accumulate the posterior predictive of the test entries
+            self.update_predictive(it)
+            self.profiler.mark('predictive')
+
             # Print the performance, store performance and time
             perf = self.predict_while_running()
             for metric in METRICS:
@@ -104,29 +159,78 @@ class MF_Nonprobabilistic(BMF):
             time_iteration = time.time()
             self.all_times.append(time_iteration-time_start)   
             print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
-            
+            self.profiler.mark('performance')
+
+            # Stop once the I-divergence no longer improves, if a tolerance is set
+            new_I_div = self.compute_I_div()
+            self.all_I_div.append(new_I_div)
+            self.profiler.end_iteration('I_div')
+            if self.tolerance is not None and I_div - new_I_div <= self.tolerance * abs(I_div):
+                print "Converged after %s iterations. I-div: %s." % (it+1,new_I_div)
+                self.all_U, self.all_V = self.all_U[:it+1], self.all_V[:it+1]
+                break
+            I_div = new_I_div
+
 
     ''' Updates for U and V. '''
-    def update_U(self,k):
-        ''' Update values for U. '''
-        self.U[:,k] = self.U[:,k] * (self.M * (self.V[:,k] * ( self.R / numpy.dot(self.U,self.V.T) ) )).sum(axis=1) / (self.M * self.V[:,k]).sum(axis=1)
-        
-    def update_V(self,k):
-        ''' Update values for V. '''
-        self.V[:,k] = self.V[:,k] * ( (self.U[:,k] * ( self.R / numpy.dot(self.U,self.V.T) ).T ).T * self.M ).sum(axis=0) / (self.U[:,k] * self.M.T).T.sum(axis=0)
-        
-        
+    def update_U(self):
+        ''' Update values for U (all columns at once). '''
+        Q = self.sparse_Omega(self.R_Omega / self.predict_Omega())
+        self.U = self.U * Q.dot(self.V) / self.M.dot(self.V)
+
+    def update_V(self):
+        ''' Update values for V (all columns at once). '''
+        Q = self.sparse_Omega(self.R_Omega / self.predict_Omega())
+        self.V = self.V * Q.T.dot(self.U) / self.M.T.dot(self.U)
+
+
+    ''' Computations over the observed entries. '''
+    def predict_Omega(self):
+        ''' Return the vector of predictions Ui dot Vj for (i,j) in Omega. '''
+        return (self.U[self.Omega_rows] * self.V[self.Omega_columns]).sum(axis=1)
+
+    def sparse_Omega(self,values):
+        ''' Return the IxJ sparse matrix with the given values for the entries in Omega. '''
+        return scipy.sparse.csr_matrix(
+            (values, self.Omega_columns, self.indptr), shape=(self.I,self.J))
+
+    def compute_I_div(self):
+        ''' Return the I-divergence of the observed entries. '''
+        R_pred = self.predict_Omega()
+        return (self.R_Omega * numpy.log(self.R_Omega / R_pred) - self.R_Omega + R_pred).sum()
+
+    def R_entries(self,rows,columns):
+        ''' Return the values of R (plus MINIMUM_R) for the entries (rows[n],columns[n]). '''
+        return numpy.asarray(self.R[rows,columns], dtype=float).ravel() + MINIMUM_R
+
+    def check_empty_rows_columns(self):
+        ''' Check if each row and column of M has at least 1 observed entry. '''
+        sums_rows = numpy.bincount(self.Omega_rows, minlength=self.I)
+        sums_columns = numpy.bincount(self.Omega_columns, minlength=self.J)
+        for i,c in enumerate(sums_rows):
+            assert c != 0, "Fully unobserved row in R, row %s." % i
+        for j,c in enumerate(sums_columns):
+            assert c != 0, "Fully unobserved column in R, column %s." % j
+
+    def predict_while_running(self):
+        ''' Return the performance on the observed entries, computing Ui dot Vj
+            for only those entries. '''
+        R_pred, M_Omega = self.predict_Omega(), numpy.ones(len(self.R_Omega))
+        MSE = self.compute_MSE(M_Omega,self.R_Omega,R_pred)
+        R2 = self.compute_R2(M_Omega,self.R_Omega,R_pred)
+        Rp = self.compute_Rp(M_Omega,self.R_Omega,R_pred)
+        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
+
+
     ''' Override the predict() method to simply use U and V directly. '''
     def predict(self,M_pred,burn_in,thinning):
         ''' Use U and V to predict missing values. '''
-        R_pred = numpy.dot(self.U, self.V.T)
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
-        return {'MSE':MSE,'R^2':R2,'Rp':Rp}
-    
-    
+        rows, columns = numpy.nonzero(M_pred)
+        R_pred = self.predict_entries(rows,columns)
+        return self.predict_performances(rows,columns,R_pred)
+
+
     ''' Override the approx_expectation_UV() method to simply return the final U, V. '''
     def approx_expectation_UV(self,burn_in,thinning):
         ''' Simply return U, V. ''' 
-        return (self.U, self.V)
\ No newline at end of file
+        return (self.U, self.V)
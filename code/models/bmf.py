@@ -11,6 +11,12 @@ USAGE
     BMF.run(it)
     performance = BMF.predict(M_pred, burn_in, thinning)
     U, V = BMF.approx_expectation_UV(burn_in, thinning)
+and BMF.continue_run(it) runs the sampler for another :it iterations, from 
+the current values, appending the new draws to the previous ones. Or, if the 
+test entries are known before running the sampler,
+    BMF.run(it, M_test, burn_in, thinning)
+    performance = BMF.predict_posterior_predictive()
+    predictive = BMF.posterior_predictive(credible)
 where
     R is the matrix with observed values
     M is the mask matrix indicating observed values (1) and unobserved (0)
@@ -21,11 +27,45 @@ where
     burn_in is the number of iterations we skip before estimating the expectation
     thinning indicates which iterations we thin out (after burn_in)
     performance is a dictionary { 'MSE', 'R^2', 'Rp' }
+    M_pred, M_test are the mask matrices indicating the entries we want to 
+        predict (these can also be IndexMask objects, see cross_validation/mask.py)
+    credible is the probability mass of the credible intervals (e.g. 0.95)
+    predictive is a dictionary { 'mean', 'variance', 'lower', 'upper' }, giving 
+        the posterior predictive of Ui*Vj for the entries in M_test
     
 The draw values are stored in all_U, all_V, all_tau, etc; performances in
 all_performances; and timestamps in all_times.
+
+When M_test is given to run(), we accumulate the sum and sum of squares of 
+Ui*Vj for only those entries after burn_in and thinning, costing O(|test|*K) 
+per iteration, so that the posterior predictive does not require the stored 
+draws. The credible intervals use a Gaussian approximation of the predictive.
+The draws are then not stored (all_U, all_V, etc are empty, and predict() and
+approx_expectation_UV() cannot be used), unless run(it, M_test, ...) or 
+train(init, it, M_test, ...) is given store_traces=True.
+
+The invariants of R and M that the updates need (M*R, contiguous copies of 
+R.T and M.T, the observed entries per row and column, etc) are computed once 
+in __init__ and stored in self.cache (see Gibbs/cache.py). The models pass 
+self.cache['rows'] to the updates of U, self.cache['columns'] to the updates 
+of V, and self.cache to the updates of tau and Z.
+
+BMF.enable_profiling(fout) makes the following runs record the time and the 
+counts of the inner primitives (matrix inversions, rtnorm rejections, etc) of 
+each update step, per iteration, in BMF.profiler (see Gibbs/profiling.py).
+
+BMF.enable_memory_accounting() makes BMF.train() record the footprint of each 
+structure of the model (R, M, the cache, the draws all_U, etc) and the RSS of 
+the process after initialising and after running, and track the peak RSS; 
+BMF.disable_memory_accounting() returns these (see Gibbs/memory.py).
 """
 
+from Gibbs.cache import compute_cache
+from Gibbs.memory import MemoryTracker
+from Gibbs.profiling import Profiler
+
+from scipy.stats import norm
+
 import numpy, math
 
 class BMF(object):
@@ -43,21 +83,84 @@ class BMF(object):
         (self.I,self.J) = self.R.shape
         self.size_Omega = self.M.sum()
         self.check_empty_rows_columns()      
+        self.cache = compute_cache(R=self.R, M=self.M)
+        self.profiler = Profiler()
+        self.memory = None
         
         
-    def train(self,init,iterations):
+    def train(self,init,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
         """ Initialise and run the model. """
         self.initialise(init=init)
-        return self.run(iterations=iterations)
+        self.record_memory('initialise')
+        output = self.run(iterations=iterations,M_test=M_test,burn_in=burn_in,thinning=thinning,
+                          store_traces=store_traces)
+        self.record_memory('run')
+        return output
 
     def initialise(self,init):
         """ Initialise the values of the random variables in this model. """
         assert False, "Implement this method for your class!"
         
-    def run(self,iterations):
-        """ Run the Gibbs sampler for the specified number of iterations. """
+    def run(self,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
+        """ Run the Gibbs sampler for the specified number of iterations. If 
+            M_test is given, accumulate the posterior predictive for those 
+            entries (after burn_in and thinning) while sampling. Store the 
+            draws if store_traces is True (by default, if M_test is None). """
         assert False, "Implement this method for your class!"
         
+    def initialise_traces(self,iterations,M_test,store_traces):
+        """ Decide whether run() stores the draws (by default, only if M_test
+            is None), and return the number of draws to allocate. """
+        self.store_traces = M_test is None if store_traces is None else store_traces
+        return iterations if self.store_traces else 0
+        
+    def continue_run(self,iterations):
+        """ Run the Gibbs sampler for another :iterations iterations, starting 
+            from the current values of the random variables, and append the 
+            draws, performances and timestamps to those of the previous runs. """
+        previous = { name:value for (name,value) in self.__dict__.items() if name.startswith('all_') }
+        self.run(iterations, store_traces=getattr(self, 'store_traces', True))
+        for (name,value) in previous.iteritems():
+            new = getattr(self, name)
+            if name == 'all_times' and len(value) > 0:
+                new = [timestamp + value[-1] for timestamp in new]
+            if isinstance(value, numpy.ndarray):
+                setattr(self, name, numpy.concatenate((value,new)))
+            elif isinstance(value, dict):
+                setattr(self, name, { key:(value[key] + new[key]) for key in value })
+            else:
+                setattr(self, name, value + new)
+        
+    def enable_profiling(self,fout=None):
+        """ Record the time and primitive counts of each update step in the
+            following runs, and also write them as JSON lines to :fout if given. """
+        self.profiler.close()
+        self.profiler = Profiler(enabled=True, fout=fout)
+        
+    def disable_profiling(self):
+        """ Stop recording the update steps and counting the primitives, and
+            close the file of the profiler. """
+        self.profiler.close()
+        self.profiler = Profiler()
+        
+    def enable_memory_accounting(self,interval=0.01):
+        """ Start tracking the peak RSS (sampled every :interval seconds), and 
+            record the footprints of the structures in record_memory(). """
+        self.memory = MemoryTracker(interval=interval)
+        self.memory.start()
+        
+    def record_memory(self,stage):
+        """ Record the footprints of the structures at :stage, if enabled. """
+        if self.memory is not None:
+            self.memory.record(stage,self)
+        
+    def disable_memory_accounting(self):
+        """ Stop the memory accounting, and return its report. """
+        self.memory.stop()
+        report = self.memory.report()
+        self.memory = None
+        return report
+        
     
     def check_empty_rows_columns(self):
         """ Check if each row and column of M has at least 1 observed entry. """
@@ -72,20 +175,86 @@ class BMF(object):
     def approx_expectation_UV(self,burn_in,thinning):
         """ Approximate the expectation of U and V (after burn_in and thinning), 
             returning a a tuple (U, V). """
+        assert getattr(self, 'store_traces', True), \
+            "The draws were not stored, as M_test was given to run() - use store_traces=True."
         indices = range(burn_in,len(self.all_U),thinning)
         exp_U = numpy.array([self.all_U[i] for i in indices]).sum(axis=0) / float(len(indices))      
         exp_V = numpy.array([self.all_V[i] for i in indices]).sum(axis=0) / float(len(indices))  
         return (exp_U, exp_V)
 
     def predict(self,M_pred,burn_in,thinning):
-        """ Compute the expectation of U and V, and use it to predict missing values. """
+        """ Compute the expectation of U and V, and use it to predict missing values. 
+            We only compute Ui*Vj for the entries in M_pred (a mask matrix or
+            an IndexMask), in O(|M_pred|*K). """
         U, V = self.approx_expectation_UV(burn_in,thinning)
-        R_pred = numpy.dot(U,V.T)
-        MSE = self.compute_MSE(M_pred,self.R,R_pred)
-        R2 = self.compute_R2(M_pred,self.R,R_pred)    
-        Rp = self.compute_Rp(M_pred,self.R,R_pred)        
+        rows, columns = numpy.nonzero(M_pred)
+        R_pred = (U[rows,:] * V[columns,:]).sum(axis=1)
+        return self.predict_performances(rows,columns,R_pred)
+        
+    def predict_performances(self,rows,columns,R_pred):
+        """ Return the performances of the predictions R_pred (a vector) for 
+            the entries (rows[n],columns[n]). """
+        R_test = self.R_entries(rows,columns)
+        M_test = numpy.ones(R_pred.shape)
+        MSE = self.compute_MSE(M_test,R_test,R_pred)
+        R2 = self.compute_R2(M_test,R_test,R_pred)    
+        Rp = self.compute_Rp(M_test,R_test,R_pred)        
         return {'MSE':MSE,'R^2':R2,'Rp':Rp}
         
+    def R_entries(self,rows,columns):
+        """ Return the values of R for the entries (rows[n],columns[n]). """
+        return self.R[rows,columns]
+        
+    def initialise_predictive(self,M_test,burn_in,thinning):
+        """ Set up the accumulators for the posterior predictive of the entries
+            in M_test. If M_test is None, we do not track any entries. """
+        if M_test is None:
+            self.predictive_rows, self.predictive_columns = None, None
+            return
+        assert M_test.shape == (self.I,self.J), "M_test is of shape %s, but R is of shape %s." % (
+            M_test.shape, (self.I,self.J))
+        assert thinning > 0, "thinning should be a positive integer, not %s." % thinning
+        self.predictive_rows, self.predictive_columns = numpy.nonzero(M_test)
+        self.predictive_burn_in, self.predictive_thinning = burn_in, thinning
+        self.predictive_sum = numpy.zeros(len(self.predictive_rows))
+        self.predictive_sum_squares = numpy.zeros(len(self.predictive_rows))
+        self.predictive_draws = 0
+        
+    def update_predictive(self,it):
+        """ Add Ui*Vj for the tracked entries to the accumulators, if iteration
+            :it is after burn_in and not thinned out. """
+        if self.predictive_rows is None or it < self.predictive_burn_in \
+           or (it - self.predictive_burn_in) % self.predictive_thinning != 0:
+            return
+        R_pred = self.predict_entries(self.predictive_rows, self.predictive_columns)
+        self.predictive_sum += R_pred
+        self.predictive_sum_squares += R_pred**2
+        self.predictive_draws += 1
+        
+    def predict_entries(self,rows,columns):
+        """ Return Ui*Vj for the entries (rows[n],columns[n]), in O(n*K). """
+        return (self.U[rows,:] * self.V[columns,:]).sum(axis=1)
+        
+    def posterior_predictive(self,credible=0.95):
+        """ Return the posterior predictive mean, variance, and :credible 
+            interval (lower and upper bounds) of Ui*Vj for the entries in the 
+            M_test given to run(), as vectors in the order of numpy.nonzero(M_test). """
+        assert getattr(self, 'predictive_rows', None) is not None, \
+            "No test entries were given to run(), so we did not accumulate the posterior predictive."
+        assert self.predictive_draws > 0, \
+            "No draws were accumulated, burn_in (%s) is too high." % self.predictive_burn_in
+        mean = self.predictive_sum / float(self.predictive_draws)
+        variance = numpy.maximum(self.predictive_sum_squares / float(self.predictive_draws) - mean**2, 0.)
+        z = norm.ppf(0.5 + credible / 2.)
+        lower, upper = mean - z * numpy.sqrt(variance), mean + z * numpy.sqrt(variance)
+        return {'mean':mean,'variance':variance,'lower':lower,'upper':upper}
+        
+    def predict_posterior_predictive(self):
+        """ Use the posterior predictive mean of the entries in the M_test 
+            given to run() to compute the performance on those entries. """
+        R_pred = self.posterior_predictive()['mean']
+        return self.predict_performances(self.predictive_rows,self.predictive_columns,R_pred)
+        
     def predict_while_running(self):
         R_pred = numpy.dot(self.U,self.V.T)
         MSE = self.compute_MSE(self.M,self.R,R_pred)
@@ -72,39 +72,58 @@ class BMF_Gaussian_Gaussian_Wishart(BMF):
             alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
         
         
-    def run(self,iterations):
-        """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))   
-        self.all_muU = numpy.zeros((iterations,self.K))  
-        self.all_muV = numpy.zeros((iterations,self.K))  
-        self.all_sigmaU = numpy.zeros((iterations,self.K,self.K))  
-        self.all_sigmaV = numpy.zeros((iterations,self.K,self.K))  
-        self.all_tau = numpy.zeros(iterations) 
+    def run(self,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
+        """ Run the Gibbs sampler for the specified number of iterations. If 
+            M_test is given, accumulate the posterior predictive for those 
+            entries (after burn_in and thinning) while sampling. """
+        draws = self.initialise_traces(iterations=iterations, M_test=M_test, store_traces=store_traces)
+        self.all_U = numpy.zeros((draws,self.I,self.K))  
+        self.all_V = numpy.zeros((draws,self.J,self.K))   
+        self.all_muU = numpy.zeros((draws,self.K))  
+        self.all_muV = numpy.zeros((draws,self.K))  
+        self.all_sigmaU = numpy.zeros((draws,self.K,self.K))  
+        self.all_sigmaV = numpy.zeros((draws,self.K,self.K))  
+        self.all_tau = numpy.zeros(draws) 
         self.all_times = []
         self.all_performances = { metric: [] for metric in METRICS } 
+        self.initialise_predictive(M_test=M_test, burn_in=burn_in, thinning=thinning)
         
         time_start = time.time()
         for it in range(iterations):
+            self.profiler.start_iteration()
             # Update the random variables
-            self.muU, self.sigmaU = update_muU_sigmaU_gaussian_gaussian_wishart(
+            self.muU, self.sigmaU, sigmaU_inv = update_muU_sigmaU_gaussian_gaussian_wishart(
                 mu0=self.mu0, beta0=self.beta0, v0=self.v0, W0=self.W0, U=self.U)
+            self.profiler.mark('muU_sigmaU')
             self.U = update_U_gaussian_gaussian_wishart(
-                muU=self.muU, sigmaU=self.sigmaU, R=self.R, M=self.M, V=self.V, tau=self.tau)
+                muU=self.muU, sigmaU=self.sigmaU, R=self.R, M=self.M, V=self.V, tau=self.tau,
+                cache=self.cache['rows'], sigmaU_inv=sigmaU_inv)
+            self.profiler.mark('U')
             
-            self.muV, self.sigmaV = update_muV_sigmaV_gaussian_gaussian_wishart(
+            self.muV, self.sigmaV, sigmaV_inv = update_muV_sigmaV_gaussian_gaussian_wishart(
                 mu0=self.mu0, beta0=self.beta0, v0=self.v0, W0=self.W0, V=self.V)
+            self.profiler.mark('muV_sigmaV')
             self.V = update_V_gaussian_gaussian_wishart(
-                muV=self.muV, sigmaV=self.sigmaV, R=self.R, M=self.M, U=self.U, tau=self.tau)
+                muV=self.muV, sigmaV=self.sigmaV, R=self.R, M=self.M, U=self.U, tau=self.tau,
+                cache=self.cache['columns'], sigmaV_inv=sigmaV_inv)
+            self.profiler.mark('V')
                  
             self.tau = update_tau_gaussian(
-                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V,
+                cache=self.cache)
+            self.profiler.mark('tau')
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_muU[it], self.all_sigmaU[it] = numpy.copy(self.muU), numpy.copy(self.sigmaU)
-            self.all_muV[it], self.all_sigmaV[it] = numpy.copy(self.muV), numpy.copy(self.sigmaV)
-            self.all_tau[it] = self.tau
+            if self.store_traces:
+                self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
+                self.all_muU[it], self.all_sigmaU[it] = numpy.copy(self.muU), numpy.copy(self.sigmaU)
+                self.all_muV[it], self.all_sigmaV[it] = numpy.copy(self.muV), numpy.copy(self.sigmaV)
+                self.all_tau[it] = self.tau
+            self.profiler.mark('store')
+            
+            # Accumulate the posterior predictive of the test entries
+            self.update_predictive(it)
+            self.profiler.mark('predictive')
             
             # Print the performance, store performance and time
             perf = self.predict_while_running()
@@ -113,3 +132,4 @@ class BMF_Gaussian_Gaussian_Wishart(BMF):
             time_iteration = time.time()
             self.all_times.append(time_iteration-time_start)   
             print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.profiler.end_iteration('performance')
@@ -64,44 +64,65 @@ class BMF_Gaussian_TruncatedNormal_Hierarchical(BMF):
             alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
         
         
-    def run(self,iterations):
-        """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))   
-        self.all_muU = numpy.zeros((iterations,self.I,self.K))  
-        self.all_muV = numpy.zeros((iterations,self.J,self.K))  
-        self.all_tauU = numpy.zeros((iterations,self.I,self.K))  
-        self.all_tauV = numpy.zeros((iterations,self.J,self.K))  
-        self.all_tau = numpy.zeros(iterations) 
+    def run(self,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
+        """ Run the Gibbs sampler for the specified number of iterations. If 
+            M_test is given, accumulate the posterior predictive for those 
+            entries (after burn_in and thinning) while sampling. """
+        draws = self.initialise_traces(iterations=iterations, M_test=M_test, store_traces=store_traces)
+        self.all_U = numpy.zeros((draws,self.I,self.K))  
+        self.all_V = numpy.zeros((draws,self.J,self.K))   
+        self.all_muU = numpy.zeros((draws,self.I,self.K))  
+        self.all_muV = numpy.zeros((draws,self.J,self.K))  
+        self.all_tauU = numpy.zeros((draws,self.I,self.K))  
+        self.all_tauV = numpy.zeros((draws,self.J,self.K))  
+        self.all_tau = numpy.zeros(draws) 
         self.all_times = []
         self.all_performances = { metric: [] for metric in METRICS } 
+        self.initialise_predictive(M_test=M_test, burn_in=burn_in, thinning=thinning)
         
         time_start = time.time()
         for it in range(iterations):
+            self.profiler.start_iteration()
             # Update the random variables
             self.muU = update_muU_gaussian_truncatednormal_hierarchical(
                 mu_mu=self.mu_mu, tau_mu=self.tau_mu, U=self.U, tauU=self.tauU)
+            self.profiler.mark('muU')
             self.tauU = update_tauU_gaussian_truncatednormal_hierarchical(
                 a=self.a, b=self.b, U=self.U, muU=self.muU)
+            self.profiler.mark('tauU')
             self.U = update_U_gaussian_truncatednormal_hierarchical(
-                muU=self.muU, tauU=self.tauU, R=self.R, M=self.M, U=self.U, V=self.V, tau=self.tau) 
+                muU=self.muU, tauU=self.tauU, R=self.R, M=self.M, U=self.U, V=self.V, tau=self.tau,
+                cache=self.cache['rows'])
+            self.profiler.mark('U')
             
             self.muV = update_muV_gaussian_truncatednormal_hierarchical(
                 mu_mu=self.mu_mu, tau_mu=self.tau_mu, V=self.V, tauV=self.tauV)
+            self.profiler.mark('muV')
             self.tauV = update_tauV_gaussian_truncatednormal_hierarchical(
                 a=self.a, b=self.b, V=self.V, muV=self.muV)
+            self.profiler.mark('tauV')
             self.V = update_V_gaussian_truncatednormal_hierarchical(
-                muV=self.muV, tauV=self.tauV, R=self.R, M=self.M, U=self.U, V=self.V, tau=self.tau) 
+                muV=self.muV, tauV=self.tauV, R=self.R, M=self.M, U=self.U, V=self.V, tau=self.tau,
+                cache=self.cache['columns'])
+            self.profiler.mark('V')
             
             self.tau = update_tau_gaussian(
-                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V)
+                alpha=self.alpha, beta=self.beta, R=self.R, M=self.M, U=self.U, V=self.V,
+                cache=self.cache)
+            self.profiler.mark('tau')
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_muU[it], self.all_tauU[it] = numpy.copy(self.muU), numpy.copy(self.tauU)
-            self.all_muV[it], self.all_tauV[it] = numpy.copy(self.muV), numpy.copy(self.tauV)
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            self.all_tau[it] = self.tau
+            if self.store_traces:
+                self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
+                self.all_muU[it], self.all_tauU[it] = numpy.copy(self.muU), numpy.copy(self.tauU)
+                self.all_muV[it], self.all_tauV[it] = numpy.copy(self.muV), numpy.copy(self.tauV)
+                self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
+                self.all_tau[it] = self.tau
+            self.profiler.mark('store')
+            
+            # Accumulate the posterior predictive of the test entries
+            self.update_predictive(it)
+            self.profiler.mark('predictive')
             
             # Print the performance, store performance and time
             perf = self.predict_while_running()
@@ -110,3 +131,4 @@ class BMF_Gaussian_TruncatedNormal_Hierarchical(BMF):
             time_iteration = time.time()
             self.all_times.append(time_iteration-time_start)   
             print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.profiler.end_iteration('performance')
@@ -53,27 +53,41 @@ class BMF_Poisson_Gamma_Dirichlet(BMF):
         self.Z = initialise_Z_multinomial(init=init, R=self.R, U=self.U, V=self.V)
         
         
-    def run(self,iterations):
-        """ Run the Gibbs sampler for the specified number of iterations. """
-        self.all_U = numpy.zeros((iterations,self.I,self.K))  
-        self.all_V = numpy.zeros((iterations,self.J,self.K))
-        #self.all_Z = numpy.zeros((iterations,self.I,self.J,self.K))
+    def run(self,iterations,M_test=None,burn_in=0,thinning=1,store_traces=None):
+        """ Run the Gibbs sampler for the specified number of iterations. If 
+            M_test is given, accumulate the posterior predictive for those 
+            entries (after burn_in and thinning) while sampling. """
+        draws = self.initialise_traces(iterations=iterations, M_test=M_test, store_traces=store_traces)
+        self.all_U = numpy.zeros((draws,self.I,self.K))  
+        self.all_V = numpy.zeros((draws,self.J,self.K))
+        #self.all_Z = numpy.zeros((draws,self.I,self.J,self.K))
         self.all_times = []
         self.all_performances = { metric: [] for metric in METRICS } 
+        self.initialise_predictive(M_test=M_test, burn_in=burn_in, thinning=thinning)
         
         time_start = time.time()
         for it in range(iterations):
+            self.profiler.start_iteration()
             # Update the random variables
             self.Z = update_Z_poisson(
-                R=self.R, M=self.M, U=self.U, V=self.V)
+                R=self.R, M=self.M, Z=self.Z, U=self.U, V=self.V, cache=self.cache)
+            self.profiler.mark('Z')
             self.U = update_U_poisson_dirichlet(
-                alpha=self.alpha, M=self.M, Z=self.Z)
+                alpha=self.alpha, M=self.M, Z=self.Z, cache=self.cache['rows'])
+            self.profiler.mark('U')
             self.V = update_V_poisson_gamma(
-                a=self.a, b=self.b, M=self.M, U=self.U, Z=self.Z)
+                a=self.a, b=self.b, M=self.M, U=self.U, Z=self.Z, cache=self.cache['columns'])
+            self.profiler.mark('V')
             
             # Store the draws
-            self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
-            #self.all_Z[it] = numpy.copy(self.Z)
+            if self.store_traces:
+                self.all_U[it], self.all_V[it] = numpy.copy(self.U), numpy.copy(self.V)
+                #self.all_Z[it] = numpy.copy(self.Z)
+            self.profiler.mark('store')
+            
+            # Accumulate the posterior predictive of the test entries
+            self.update_predictive(it)
+            self.profiler.mark('predictive')
             
             # Print the performance, store performance and time
             perf = self.predict_while_running()
@@ -82,3 +96,4 @@ class BMF_Poisson_Gamma_Dirichlet(BMF):
             time_iteration = time.time()
             self.all_times.append(time_iteration-time_start)   
             print "Iteration %s. MSE: %s. R^2: %s. Rp: %s." % (it+1,perf['MSE'],perf['R^2'],perf['Rp'])
+            self.profiler.end_iteration('performance')
@@ -0,0 +1,167 @@
+"""
+Binary cache of the datasets, so that each is only parsed from its source files
+once, and later loads (including those of parallel workers) memory-map it.
+
+Each dataset is identified by its name, the paths of its source files, and any
+parameters of its construction (e.g. the minimum number of entries per row).
+On the first load we construct it, and store it in its own folder in the cache
+(data/cache/, which git ignores, or the folder in the BMF_DATASET_CACHE 
+environment variable) as .npy files:
+- sparse datasets (less than DENSE_FRACTION of the entries observed) as the row
+  indices, column indices and values of the observed entries, in row-major
+  order, and the index pointer of the corresponding csr_matrix;
+- dense datasets as the matrices R and M.
+Alongside them, dataset.json stores the shape, the format, and the signature of
+each source file - its size and modification time, or (hash_contents=True) the
+SHA-1 hash of its contents. If a source file changes, its signature no longer
+matches and we construct and store the dataset again.
+
+The arrays are loaded as copy-on-write memory-mapped arrays (numpy.load with
+mmap_mode='c'), so all processes share the pages of the files, and writing to
+the arrays changes the private copy of that process only. Returning the stored
+form is zero-copy: the dense (R, M) of dense datasets, and the csr_matrix and
+IndexMask of sparse datasets. The other form is constructed from it.
+Files are written to a temporary folder first and then renamed, so that
+parallel workers and crashed runs never leave half-written datasets.
+
+USAGE
+    R, M = load_cached(name, sources, construct, dense=True, parameters={})
+where construct() returns (R, M), either as dense matrices or as a csr_matrix
+and IndexMask, and we return them in the same way (dense=False for the sparse
+form).
+"""
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.mask import IndexMask
+
+from scipy.sparse import csr_matrix
+import hashlib
+import json
+import numpy
+import shutil
+import tempfile
+
+folder_cache = os.environ.get('BMF_DATASET_CACHE', os.path.dirname(__file__)+"/cache/")
+
+DENSE_FRACTION = 0.5
+CACHE_VERSION = 1
+
+
+''' Identifying the datasets. '''
+def file_signature(fname, hash_contents=False):
+    ''' Return the signature of the file: its size and modification time, or
+        the SHA-1 hash of its contents. '''
+    if not hash_contents:
+        stat = os.stat(fname)
+        return "%s %r" % (stat.st_size, stat.st_mtime)
+    sha = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), ''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def dataset_folder(name, sources, parameters={}, folder=None):
+    ''' Return the cache folder of the dataset with this name, source files and parameters. '''
+    sha = hashlib.sha1()
+    sha.update(json.dumps([name, [os.path.abspath(fname) for fname in sources], parameters], sort_keys=True))
+    return os.path.join(folder_cache if folder is None else folder, "%s_%s" % (name, sha.hexdigest()[:16]))
+
+
+''' Storing and reading the datasets. '''
+def sparse_entries(R, M):
+    ''' Return the row indices, column indices, and values of the observed
+        entries of (R, M), in row-major order. '''
+    if hasattr(M, 'indices_row'):
+        rows, columns = M.nonzero()
+    else:
+        rows, columns = numpy.nonzero(M)
+    if hasattr(R, 'tocsr'):
+        values = numpy.asarray(R.tocsr()[rows, columns]).ravel()
+    else:
+        values = numpy.asarray(R)[rows, columns]
+    return rows.astype(numpy.int32), columns.astype(numpy.int32), values
+
+def index_pointer(rows, I):
+    ''' Return the index pointer of the csr_matrix with entries in :rows (sorted). '''
+    return numpy.concatenate([[0], numpy.cumsum(numpy.bincount(rows, minlength=I))]).astype(numpy.int32)
+
+def store_dataset(folder, R, M, signatures):
+    ''' Store (R, M) in :folder, replacing what is there. '''
+    shape = tuple(int(n) for n in M.shape)
+    rows, columns, values = sparse_entries(R, M)
+    if len(values) >= DENSE_FRACTION * shape[0] * shape[1]:
+        arrays = { 'R': numpy.asarray(R.toarray() if hasattr(R, 'tocsr') else R), 'M': numpy.asarray(M, dtype=float) }
+        storage = 'dense'
+    else:
+        arrays = { 'rows': rows, 'columns': columns, 'values': values, 'indptr': index_pointer(rows, shape[0]) }
+        storage = 'sparse'
+
+    parent = os.path.dirname(folder)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    folder_temporary = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+    for name, array in arrays.iteritems():
+        numpy.save(os.path.join(folder_temporary, name+'.npy'), numpy.ascontiguousarray(array))
+    description = { 'shape': shape, 'format': storage, 'signatures': signatures, 'version': CACHE_VERSION }
+    json.dump(description, open(os.path.join(folder_temporary, 'dataset.json'), 'w'))
+
+    # Move the old version out of the way first, as we cannot rename over a folder
+    if os.path.exists(folder):
+        folder_old = tempfile.mkdtemp(dir=parent, suffix='.old')
+        os.rename(folder, os.path.join(folder_old, 'dataset'))
+        shutil.rmtree(folder_old, ignore_errors=True)
+    try:
+        os.rename(folder_temporary, folder)
+    except OSError:
+        # Another process stored it at the same time
+        shutil.rmtree(folder_temporary, ignore_errors=True)
+
+def read_description(folder):
+    ''' Return the description of the dataset stored in :folder, or None. '''
+    try:
+        return json.load(open(os.path.join(folder, 'dataset.json'), 'r'))
+    except (IOError, ValueError):
+        return None
+
+def read_dataset(folder, dense=True):
+    ''' Return (R, M) stored in :folder, as dense matrices or as a csr_matrix
+        and an IndexMask, using copy-on-write memory-mapped arrays. '''
+    description = read_description(folder)
+    shape = tuple(description['shape'])
+    load = lambda name: numpy.load(os.path.join(folder, name+'.npy'), mmap_mode='c')
+    if description['format'] == 'dense':
+        R, M = load('R'), load('M')
+        if dense:
+            return (R, M)
+        rows, columns = numpy.nonzero(M)
+        R = csr_matrix((R[rows, columns], columns, index_pointer(rows, shape[0])), shape=shape)
+        return (R, IndexMask(shape, rows, columns, is_sorted=True))
+
+    rows, columns, values = load('rows'), load('columns'), load('values')
+    if dense:
+        R, M = numpy.zeros(shape, dtype=values.dtype), numpy.zeros(shape)
+        R[rows, columns], M[rows, columns] = values, 1.
+        return (R, M)
+    R = csr_matrix((values, columns, load('indptr')), shape=shape, copy=False)
+    return (R, IndexMask(shape, rows, columns, is_sorted=True))
+
+
+''' Loading through the cache. '''
+def load_cached(name, sources, construct, dense=True, parameters={}, hash_contents=False, folder=None):
+    ''' Return the dataset (R, M), from the cache if it was stored from the
+        same :sources files, and else from construct() (storing it). Return
+        dense matrices, or (dense=False) a csr_matrix and an IndexMask. '''
+    folder_dataset = dataset_folder(name, sources, parameters, folder)
+    signatures = [file_signature(fname, hash_contents) for fname in sources]
+    description = read_description(folder_dataset)
+    if description is None or description['signatures'] != signatures or description['version'] != CACHE_VERSION:
+        R, M = construct()
+        store_dataset(folder_dataset, R, M, signatures)
+    return read_dataset(folder_dataset, dense=dense)
+
+def clear_cache(folder=None):
+    ''' Remove all stored datasets. '''
+    shutil.rmtree(folder_cache if folder is None else folder, ignore_errors=True)
@@ -4,7 +4,9 @@ Methods for loading in the drug sensitivity datasets.
 Rows are cell lines, drugs are columns.
 
 Initially unobserved values are nan. We replace them by 0, and set those mask
-entries to 0.
+entries to 0. The datasets are loaded through the dataset cache (see
+data/dataset_cache.py), so we only parse each file once, and later loads
+memory-map the stored (R, M).
 
 SUMMARY: n_cl, n_drugs, n_entries, fraction_obs
 GDSC:    707,  139,     79262,     0.806549103009
@@ -13,9 +15,14 @@ CCLE IC: 504,  24,      11670,     0.964781746032
 CCLE EC: 502,  24,      7622,      0.6326361221779548
 
 '''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.data.dataset_cache import load_cached
+
 import numpy
-import itertools
-import os
 
 folder_data = os.path.dirname(__file__)+"/"
 
@@ -36,20 +43,29 @@ MIN = 3 # minimum number of observed drugs per cell line
 
 def load_data_create_mask(location):
     ''' Load in .txt file, and set mask entries for nan to 0. '''
-    R = numpy.loadtxt(location, dtype=float, delimiter=DELIM)
-    I,J = R.shape
-    M = numpy.ones((I,J))
-    for i,j in itertools.product(range(I),range(J)):
-        if numpy.isnan(R[i,j]):
-            R[i,j], M[i,j] = 0., 0.            
+    return load_cached(name='drug_sensitivity', sources=[location],
+                       construct=lambda: construct_data_create_mask(location))
+
+def construct_data_create_mask(location):
+    ''' Parse the .txt file, and set mask entries for nan to 0. We parse the 
+        whole file as one array of numbers (including nan), and then reshape it. '''
+    data = open(location, 'r').read()
+    J = data[:data.find('\n')].count(DELIM) + 1
+    R = numpy.fromstring(data.replace(DELIM, ' '), dtype=float, sep=' ').reshape(-1, J)
+    unobserved = numpy.isnan(R)
+    R[unobserved] = 0.
+    M = (~unobserved).astype(float)
     return (R, M)
 
+def filter_cell_lines(R, M, min_no_entries):
+    ''' Remove the cell lines (rows) with fewer than :min_no_entries observed entries. '''
+    keep = M.sum(axis=1) >= min_no_entries
+    return R[keep,:], M[keep,:]
+
 def load_gdsc_ic50(location=file_gdsc_ic50):
     ''' Return (R_gdsc, M_gdsc). Filter out cell lines with fewer than :MIN_GDSC observed entries. '''
     R, M = load_data_create_mask(location)
-    sum_per_cell_line = M.sum(axis=1)
-    indices_to_keep = [i for i in range(R.shape[0]) if sum_per_cell_line[i] >= MIN]
-    return R[indices_to_keep,:], M[indices_to_keep,:]
+    return filter_cell_lines(R, M, MIN)
 
 def load_ctrp_ec50(location=file_ctrp_ec50):
     ''' Return (R_ctrp, M_ctrp). '''
@@ -62,9 +78,7 @@ def load_ccle_ic50(location=file_ccle_ic50):
 def load_ccle_ec50(location=file_ccle_ec50):
     ''' Return (R_ccle_ec50, M_ccle_ec50). '''
     R, M = load_data_create_mask(location)
-    sum_per_cell_line = M.sum(axis=1)
-    indices_to_keep = [i for i in range(R.shape[0]) if sum_per_cell_line[i] >= MIN]
-    return R[indices_to_keep,:], M[indices_to_keep,:]
+    return filter_cell_lines(R, M, MIN)
 
 def load_gdsc_ic50_integer(location=file_gdsc_ic50):
     ''' As load_gdsc_ic50(), but cast all floats to integers. '''
@@ -4,19 +4,39 @@ Methods for loading in the Jester joke dataset.
 Rows are users, columns are jokes. Ratings are in the range [-10,10] originally
 (99 means no rating), but we add 10 and cast them as integers.
 
+We read the ratings directly from the bundled zip archives, which each hold
+one spreadsheet (.xls, read with xlrd, or .csv). We stream the users in chunks
+of CHUNK_ROWS, parse each chunk as one numeric array, and only keep the indices
+and values of the observed ratings of each chunk, so apart from the spreadsheet
+itself the memory needed is that of the observed entries.
+
+The datasets are loaded through the dataset cache (see data/dataset_cache.py),
+so we only parse the files once, and later loads memory-map the stored (R, M).
+
 SUMMARY: n_users, n_jokes, n_entries, fraction_obs
 Jester:  73421,   100,     4136360,   0.5633756009860938
 '''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.mask import IndexMask
+from BMF_Priors.data.dataset_cache import load_cached
+
+from scipy.sparse import csr_matrix
 import numpy
 import itertools
 import tables
-import os
+import xlrd
+import zipfile
 
 folder_data = os.path.dirname(__file__)+"/"
 
-file_jester_1 = folder_data+'jester-data-1.csv'
-file_jester_2 = folder_data+'jester-data-2.csv'
-file_jester_3 = folder_data+'jester-data-3.csv'
+file_jester_1 = folder_data+'jester-data-1.zip'
+file_jester_2 = folder_data+'jester-data-2.zip'
+file_jester_3 = folder_data+'jester-data-3.zip'
+files_jester = [file_jester_1, file_jester_2, file_jester_3]
 
 file_binary_R = folder_data+'binary_R.h5'
 file_binary_M = folder_data+'binary_M.h5'
@@ -24,21 +44,68 @@ file_binary_R_int = folder_data+'binary_R_int.h5'
 file_binary_M_int = folder_data+'binary_M_int.h5'
 
 DELIM = ','
+NO_RATING = 99
+CHUNK_ROWS = 5000
 
-def load_jester_data():
-    ''' Return (R, M), with the 3 Jester files concatenated. Rows are users, columns are jokes. '''
-    R1 = numpy.loadtxt(file_jester_1, delimiter=DELIM, dtype=str)[:,1:]
-    R2 = numpy.loadtxt(file_jester_2, delimiter=DELIM, dtype=str)[:,1:]
-    R3 = numpy.loadtxt(file_jester_3, delimiter=DELIM, dtype=str)[:,1:]
-    R = numpy.concatenate((R1, R2, R3), axis=0)
-    M = numpy.zeros(R.shape)
-    I, J = R.shape    
-    for i,j in itertools.product(range(I),range(J)):
-        rating = float(R[i,j].split('"')[1])
-        R[i,j] = rating
-        M[i,j] = 1. if rating != 99 else 0.
-    R = numpy.array(R, dtype=float)
-    return (R, M)
+def read_chunks_csv(f, chunk_rows=CHUNK_ROWS):
+    ''' Yield the rows of the open .csv file (with quoted values) as numeric 
+        arrays of :chunk_rows rows. '''
+    while True:
+        lines = list(itertools.islice(f, chunk_rows))
+        if not lines:
+            return
+        values = numpy.fromstring(''.join(lines).replace('"', ' ').replace(DELIM, ' '), dtype=float, sep=' ')
+        yield values.reshape(len(lines), -1)
+
+def read_chunks_xls(contents, chunk_rows=CHUNK_ROWS):
+    ''' Yield the rows of the first sheet of the .xls spreadsheet (given as a
+        string) as numeric arrays of :chunk_rows rows. '''
+    sheet = xlrd.open_workbook(file_contents=contents, on_demand=True).sheet_by_index(0)
+    for start in range(0, sheet.nrows, chunk_rows):
+        end = min(start + chunk_rows, sheet.nrows)
+        yield numpy.array([sheet.col_values(j, start, end) for j in range(sheet.ncols)], dtype=float).T
+
+def read_jester_chunks(fin, chunk_rows=CHUNK_ROWS):
+    ''' Yield the ratings in the Jester file - a zip archive of one .xls or
+        .csv spreadsheet, or the .csv itself - as arrays of :chunk_rows users
+        by jokes (dropping the first column, the number of jokes rated). '''
+    if fin.endswith('.zip'):
+        archive = zipfile.ZipFile(fin, 'r')
+        name = archive.namelist()[0]
+        if name.endswith('.xls'):
+            chunks = read_chunks_xls(archive.read(name), chunk_rows)
+        else:
+            chunks = read_chunks_csv(archive.open(name, 'r'), chunk_rows)
+    else:
+        chunks = read_chunks_csv(open(fin, 'r'), chunk_rows)
+    for chunk in chunks:
+        yield chunk[:,1:]
+
+def stream_jester_entries(files=files_jester, chunk_rows=CHUNK_ROWS):
+    ''' Yield the row indices, column indices, and values of the observed 
+        ratings (not NO_RATING) in the Jester files, concatenated, one chunk of
+        :chunk_rows users at a time, and the shape of the data so far. Entries
+        are in row-major order. '''
+    offset = 0
+    for fin in files:
+        for chunk in read_jester_chunks(fin, chunk_rows):
+            rows, columns = numpy.nonzero(chunk != NO_RATING)
+            yield (rows + offset, columns, chunk[rows, columns], (offset + chunk.shape[0], chunk.shape[1]))
+            offset += chunk.shape[0]
+
+def construct_jester_data(files=files_jester):
+    ''' Return (R, M) as a csr_matrix and IndexMask, parsed from the Jester files. '''
+    entries = list(stream_jester_entries(files))
+    rows, columns, ratings = [numpy.concatenate(arrays) for arrays in zip(*entries)[:3]]
+    I, J = entries[-1][3]
+    indptr = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(rows, minlength=I))])
+    return (csr_matrix((ratings, columns, indptr), shape=(I, J)), IndexMask((I, J), rows, columns, is_sorted=True))
+
+def load_jester_data(dense=True):
+    ''' Return (R, M), with the 3 Jester files concatenated. Rows are users, 
+        columns are jokes. Return dense matrices, or (dense=False) a 
+        csr_matrix and an IndexMask. '''
+    return load_cached(name='jester', sources=files_jester, construct=construct_jester_data, dense=dense)
     
 def load_jester_data_integer():
     ''' Return (R, M) for the Jester data, with values in [0,1,..,20]. Rows are users, columns are jokes. '''
@@ -66,19 +133,27 @@ def store_processed_jester():
     store_pytable(file_binary_R_int, R_int)
     store_pytable(file_binary_M_int, M_int)
     
+def read_pytable(filename):
+    ''' Return the dataset stored in the binary HDF5 file, and close it. '''
+    f = tables.open_file(filename, 'r')
+    try:
+        return f.root.all_data[:]
+    finally:
+        f.close()
+
 def load_processed_jester_data():
-    ''' Load the Jester datasets, from the HDF5 PyTables binary files. '''
-    hdf5_R = tables.open_file(file_binary_R)
-    hdf5_M = tables.open_file(file_binary_M)
-    R, M = hdf5_R.root.all_data[:], hdf5_M.root.all_data[:]
-    return (R, M)
+    ''' Load the Jester datasets, from the HDF5 PyTables binary files
+        (through the dataset cache, so we only read them once). '''
+    files = [file_binary_R, file_binary_M]
+    return load_cached(name='jester_processed', sources=files,
+                       construct=lambda: tuple(read_pytable(filename) for filename in files))
 
 def load_processed_jester_data_integer():
-    ''' Load the Jester (integer) datasets, from the HDF5 PyTables binary files. '''
-    hdf5_R_int = tables.open_file(file_binary_R_int)
-    hdf5_M_int = tables.open_file(file_binary_M_int)
-    R_int, M_int = hdf5_R_int.root.all_data[:], hdf5_M_int.root.all_data[:]
-    return (R_int, M_int)
+    ''' Load the Jester (integer) datasets, from the HDF5 PyTables binary files
+        (through the dataset cache, so we only read them once). '''
+    files = [file_binary_R_int, file_binary_M_int]
+    return load_cached(name='jester_processed_integer', sources=files,
+                       construct=lambda: tuple(read_pytable(filename) for filename in files))
     
     
 '''    
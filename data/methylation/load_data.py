@@ -5,14 +5,22 @@ Rows are genes, columns are samples (patients). We filter out the 160 cancer
 driver genes.
 
 There are no unobserved values. For the integer version, we multiply all values
-by then and then cast values as an int.
+by then and then cast values as an int. The datasets are loaded through the
+dataset cache (see data/dataset_cache.py), so we only parse each file once,
+and later loads memory-map the stored (R, M).
 
 SUMMARY: n_genes, n_samples, n_entries, fraction_obs
 PM:      160,     254,       40640,     1.0
 GM:      160,     254,       40640,     1.0
 '''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.data.dataset_cache import load_cached
+
 import numpy
-import os
 
 folder_data = os.path.dirname(__file__)+"/"
 
@@ -23,25 +31,32 @@ file_driver_genes = folder_data+'intogen-BRCA-drivers-data.geneid'
 DELIM = '\t'
 
 def load_dataset_raw(filename):
-    ''' Return a tuple (values,genes,samples) - numpy array, row names, column names. '''
-    data = numpy.array([line.split('\n')[0].split(DELIM) for line in open(filename,'r').readlines()],dtype=str)
-    sample_names = data[0,1:]
-    gene_names = data[1:,0]
-    values = numpy.array(data[1:,1:],dtype=float)
-    return (values, gene_names, sample_names)
+    ''' Return a tuple (values,genes,samples) - numpy array, row names, column names. 
+        We split off the gene name of each line, and parse all values at once. '''
+    lines = [line for line in open(filename,'r').read().split('\n') if line]
+    sample_names = numpy.array(lines[0].split(DELIM)[1:], dtype=str)
+    gene_names, rows = zip(*[line.split(DELIM, 1) for line in lines[1:]])
+    values = numpy.fromstring(' '.join(rows).replace(DELIM, ' '), dtype=float, sep=' ').reshape(len(rows), -1)
+    return (values, numpy.array(gene_names, dtype=str), sample_names)
     
 def load_dataset_filter_genes(filename_data, filename_genes):
     ''' Load the dataset, selecting only the appropriate genes. Return (R, M). ''' 
+    return load_cached(name='methylation', sources=[filename_data, filename_genes],
+                       construct=lambda: construct_dataset_filter_genes(filename_data, filename_genes))
+
+def construct_dataset_filter_genes(filename_data, filename_genes):
+    ''' Parse the dataset, selecting only the appropriate genes. Return (R, M). ''' 
     (R, gene_names, sample_names) = load_dataset_raw(filename_data)
-    driver_gene_names = [line.split("\n")[0] for line in open(file_driver_genes,'r').readlines()]
-    gene_names = list(gene_names)
+    driver_gene_names = [line.split("\n")[0] for line in open(filename_genes,'r').readlines()]
+    # Index of the first row of each gene
+    gene_indices = { gene:i for i,gene in reversed(list(enumerate(gene_names))) }
     
-    genes_in_overlap = [gene for gene in driver_gene_names if gene in gene_names]
-    genes_not_in_overlap = [gene for gene in driver_gene_names if not gene in gene_names]
+    genes_in_overlap = [gene for gene in driver_gene_names if gene in gene_indices]
+    genes_not_in_overlap = [gene for gene in driver_gene_names if not gene in gene_indices]
     print "Selecting %s driver genes. %s driver genes are not in the methylation data." % \
         (len(genes_in_overlap),len(genes_not_in_overlap))
     
-    driver_gene_indices = [gene_names.index(gene) for gene in genes_in_overlap]
+    driver_gene_indices = [gene_indices[gene] for gene in genes_in_overlap]
     R = R[driver_gene_indices,:]
     M = numpy.ones(R.shape)
     return (R, M)
@@ -1,7 +1,18 @@
 '''
 Methods for loading in the MovieLens datasets, which we construct from the raw
-data. We could also store the numpy arrays and load those, but that is only
-slightly faster (for MovieLens 1M, 1 minute vs 1:40 minutes).
+data. We parse the whole file at once with numpy, map the user and movie ids
+to row and column indices (in the order of the ids, like numpy.unique with
+return_inverse, but with a lookup table over the ids rather than sorting), and
+filter the rows and columns on their number of ratings using the indices of
+the ratings only. This takes O(ratings + largest id) time and memory (under a
+second for MovieLens 1M), and also works for the larger 10M and 20M files
+(load_movielens_ratings).
+
+The datasets are returned either as dense (R, M), or (dense=False) as a
+scipy.sparse.csr_matrix of the ratings and an IndexMask (see
+code/cross_validation/mask.py) of the observed entries. They are loaded through
+the dataset cache (see data/dataset_cache.py), so we only parse each file once,
+and later loads memory-map the stored ratings and indices.
 
 Rows are users, columns are movies. Ratings are 0-5 (0 means no rating).
 
@@ -18,9 +29,16 @@ SUMMARY: n_users, n_movies, n_entries, fraction_obs
 1M:      6040     3503      999917     0.047259255548224514
 '''
 
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.mask import IndexMask
+from BMF_Priors.data.dataset_cache import load_cached
+
+from scipy.sparse import csr_matrix
 import numpy
 import tables
-import os
 
 folder_data = os.path.dirname(__file__)+"/"
 
@@ -40,35 +58,60 @@ DELIM_1M = '::'
 
 MIN_NO_ENTRIES = 3
 
-def construct_dataset_from_raw(fin, delim):
-    ''' Return (R, M), which we construct from a file with one rating per line,
-        of the form: user_id<delim>movie_id<delim>rating<delim>timestamp\n '''
-    lines = [line.split('\n')[0].split(delim) for line in open(fin, 'r').readlines()]
-    user_ids, movie_ids, ratings, timestamps = zip(*lines)
-    user_ids = numpy.array(user_ids, dtype=int)
-    movie_ids = numpy.array(movie_ids, dtype=int)
-    ratings = numpy.array(ratings, dtype=int)
-    
-    # Construct the matrix
-    unique_user_ids, unique_movie_ids = sorted(set(user_ids)), sorted(set(movie_ids))
-    n_users, n_movies = len(unique_user_ids), len(unique_movie_ids)
-    R, M = numpy.zeros((n_users, n_movies)), numpy.zeros((n_users, n_movies))
-    for c, (user_id, movie_id, rating) in enumerate(zip(user_ids, movie_ids, ratings)):
-        i, j = unique_user_ids.index(user_id), unique_movie_ids.index(movie_id)
-        R[i,j], M[i,j] = rating, 1.
-        if c % 10000 == 0:
-            print "Constructing dataset... Done %s lines." % c
-    print "Constructing dataset... Finished!"
+def read_ratings(fin, delim, skip_header=False):
+    ''' Return arrays (user_ids, movie_ids, ratings) from a file with one 
+        rating per line, of the form: user_id<delim>movie_id<delim>rating<delim>timestamp\n '''
+    data = open(fin, 'r').read()
+    if skip_header:
+        data = data[data.index('\n')+1:]
+    # Parsing integers is much faster, so only parse floats if there are decimal ratings
+    dtype = float if '.' in data else numpy.int64
+    values = numpy.fromstring(data.replace(delim, ' '), dtype=dtype, sep=' ').reshape(-1, 4)
+    return (values[:,0].astype(numpy.int64), values[:,1].astype(numpy.int64), values[:,2].astype(float))
+
+def renumber(ids):
+    ''' Return the index of each of the (nonnegative integer) :ids in their 
+        sorted distinct values, and the number of distinct values. '''
+    present = numpy.zeros(ids.max()+1, dtype=bool)
+    present[ids] = True
+    new_indices = numpy.cumsum(present, dtype=numpy.int64) - 1
+    return new_indices[ids], new_indices[-1]+1
+
+def filter_indices(indices, min_no_entries):
+    ''' Remove the entries whose index in :indices occurs less than 
+        :min_no_entries times, and renumber the remaining indices from 0 
+        (keeping their order). Return a boolean array of the entries we keep,
+        the new :indices of those entries, and the number of distinct indices. '''
+    keep = numpy.bincount(indices)[indices] >= min_no_entries
+    new_indices, n = renumber(indices[keep])
+    return keep, new_indices, n
+
+def construct_dataset_from_raw(fin, delim, dense=True, skip_header=False):
+    ''' Return (R, M), which we construct from a file with one rating per line
+        (see read_ratings), as dense matrices or (dense=False) as a csr_matrix
+        and an IndexMask. '''
+    user_ids, movie_ids, ratings = read_ratings(fin, delim, skip_header=skip_header)
+    (rows, I), (columns, J) = renumber(user_ids), renumber(movie_ids)
+    shape = (I, J)
     
     # Filter out any rows or columns with less than MIN_NO_ENTRIES  
-    print "Before filtering, shape is (%s, %s)." % (R.shape)
-    R, M = filter_rows(R, M, MIN_NO_ENTRIES) 
-    print "After row filtering, shape is (%s, %s)." % (R.shape)
-    R, M = filter_columns(R, M, MIN_NO_ENTRIES)
-    print "After column filtering, shape is (%s, %s)." % (R.shape)
-    R, M = filter_rows(R, M, MIN_NO_ENTRIES) 
-    print "After second row filtering, shape is (%s, %s)." % (R.shape)
-    return (R, M)
+    print "Before filtering, shape is (%s, %s)." % shape
+    keep, rows, I = filter_indices(rows, MIN_NO_ENTRIES) 
+    columns, ratings, shape = columns[keep], ratings[keep], (I, shape[1])
+    print "After row filtering, shape is (%s, %s)." % shape
+    keep, columns, J = filter_indices(columns, MIN_NO_ENTRIES) 
+    rows, ratings, shape = rows[keep], ratings[keep], (shape[0], J)
+    print "After column filtering, shape is (%s, %s)." % shape
+    keep, rows, I = filter_indices(rows, MIN_NO_ENTRIES) 
+    columns, ratings, shape = columns[keep], ratings[keep], (I, shape[1])
+    print "After second row filtering, shape is (%s, %s)." % shape
+    
+    # Construct the matrix, with the entries in row-major order
+    order = numpy.argsort(rows * shape[1] + columns)
+    rows, columns, ratings = rows[order], columns[order], ratings[order]
+    indptr = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(rows, minlength=shape[0]))])
+    R, M = csr_matrix((ratings, columns, indptr), shape=shape), IndexMask(shape, rows, columns)
+    return (R.toarray(), M.toarray()) if dense else (R, M)
 
 def filter_rows(R, M, min_no_entries):
     I, J = R.shape
@@ -80,15 +123,25 @@ def filter_columns(R, M, min_no_entries):
     R_new, M_new = filter_rows(R.T, M.T, min_no_entries)
     return R_new.T, M_new.T
 
-def load_movielens_100K():
+def load_movielens_cached(name, fin, delim, dense=True, skip_header=False):
+    ''' Return (R, M) of the ratings file through the dataset cache. '''
+    return load_cached(
+        name=name, sources=[fin], dense=dense, parameters={ 'delim':delim, 'skip_header':skip_header, 'min_no_entries':MIN_NO_ENTRIES },
+        construct=lambda: construct_dataset_from_raw(fin=fin, delim=delim, dense=False, skip_header=skip_header))
+
+def load_movielens_100K(dense=True):
     ''' Process and store files for MovieLens 100K. '''
-    R, M = construct_dataset_from_raw(fin=fin_100K, delim=DELIM_100K)  
-    return (R, M)
+    return load_movielens_cached('movielens_100K', fin=fin_100K, delim=DELIM_100K, dense=dense)
     
-def load_movielens_1M():
+def load_movielens_1M(dense=True):
     ''' Process and store files for MovieLens 1M. '''
-    R, M = construct_dataset_from_raw(fin=fin_1M, delim=DELIM_1M)  
-    return (R, M)
+    return load_movielens_cached('movielens_1M', fin=fin_1M, delim=DELIM_1M, dense=dense)
+
+def load_movielens_ratings(fin, delim, skip_header=False):
+    ''' Return the sparse (R, M) of another MovieLens ratings file, e.g. 
+        ml-10M100K/ratings.dat (delim '::') or ml-20m/ratings.csv (delim ',',
+        with a header), which are too large for dense matrices. '''
+    return load_movielens_cached('movielens', fin=fin, delim=delim, dense=False, skip_header=skip_header)
 
 def store_processed_movielens():
     ''' Construct the datasets, and efficiently store them as binary HDF5 PyTables. '''
@@ -109,19 +162,27 @@ def store_processed_movielens():
     store_pytable(file_binary_R_1M, R_1M)
     store_pytable(file_binary_M_1M, M_1M)
 
+def read_pytable(filename):
+    ''' Return the dataset stored in the binary HDF5 file, and close it. '''
+    f = tables.open_file(filename, 'r')
+    try:
+        return f.root.all_data[:]
+    finally:
+        f.close()
+
 def load_processed_movielens_100K():
-    ''' Load the MovieLens 100K datasets, from the HDF5 PyTables binary files. '''
-    hdf5_R_100K = tables.open_file(file_binary_R_100K)
-    hdf5_M_100K = tables.open_file(file_binary_M_100K)
-    R_100K, M_100K = hdf5_R_100K.root.all_data[:], hdf5_M_100K.root.all_data[:]
-    return (R_100K, M_100K)
+    ''' Load the MovieLens 100K datasets, from the HDF5 PyTables binary files
+        (through the dataset cache, so we only read them once). '''
+    files = [file_binary_R_100K, file_binary_M_100K]
+    return load_cached(name='movielens_100K_processed', sources=files,
+                       construct=lambda: tuple(read_pytable(filename) for filename in files))
 
 def load_processed_movielens_1M():
-    ''' Load the MovieLens 1M datasets, from the HDF5 PyTables binary files. '''
-    hdf5_R_1M = tables.open_file(file_binary_R_1M)
-    hdf5_M_1M = tables.open_file(file_binary_M_1M)
-    R_1M, M_1M = hdf5_R_1M.root.all_data[:], hdf5_M_1M.root.all_data[:]
-    return (R_1M, M_1M)
+    ''' Load the MovieLens 1M datasets, from the HDF5 PyTables binary files
+        (through the dataset cache, so we only read them once). '''
+    files = [file_binary_R_1M, file_binary_M_1M]
+    return load_cached(name='movielens_1M_processed', sources=files,
+                       construct=lambda: tuple(read_pytable(filename) for filename in files))
 
 
 #R_100K, M_100K = load_movielens_100K()
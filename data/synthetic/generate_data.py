@@ -0,0 +1,269 @@
+'''
+Methods for generating synthetic datasets from the generative process of each
+of the BMF models, so that we can benchmark them on datasets of any size.
+
+For the model, we draw U and V (and the hyperparameters with priors) from its
+priors, with the defaults of the model for the hyperparameters we are not
+given, and then the observed entries of R from its likelihood:
+- Gaussian models: Rij ~ N(Ui*Vj, tau^-1), with tau ~ Gamma(alpha, beta);
+- Poisson models:  Rij ~ Poisson(Ui*Vj).
+The L21 and volume priors cannot be sampled from, so like the models'
+initialise('random') we draw from a simple proposal instead: U_ik ~ N(0,1) for
+the volume prior, and U_ik ~ TN(0,1) for the nonnegative volume and L21 priors.
+The baselines have no generative process; use the Gaussian + Gaussian model's
+data for those.
+
+The mask is generated row by row, observing entry (i,j) with probability
+:fraction (missingness='random'), or (missingness='power_law') with
+probability fraction * ai * bj, capped at 1, where the row and column weights
+ai, bj are proportional to their popularity rank ^ -:exponent (in a random
+order), normalised to mean 1 - giving the heavy-tailed numbers of ratings per
+user and item of MovieLens. Because of the cap the observed fraction is then
+slightly lower than :fraction. Rows and columns without entries get one entry.
+
+We only ever compute the observed entries, in blocks of about BLOCK_ENTRIES
+entries of R, and copy each block into arrays preallocated for the expected 
+number of entries (doubling them if they run out), so we never hold all the
+entries twice. The dataset is returned as:
+- R -- a scipy.sparse.csr_matrix of the observed values (including zeros);
+- M -- an IndexMask (see code/cross_validation/mask.py) of the observed entries.
+to_dense(R, M) returns the dense (R, M) that the models take.
+
+USAGE
+    U, V, tau = draw_factors(model, I, J, K, hyperparameters={})
+    R, M = generate_dataset(model, I, J, K, fraction, missingness='random', exponent=0.5, hyperparameters={})
+where model is the model's class or class name.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.mask import IndexMask
+from BMF_Priors.code.models.Gibbs.distributions.normal_inverse_wishart import normal_inverse_wishart_draw
+
+from scipy.sparse import csr_matrix
+from scipy.stats import truncnorm
+import importlib
+import numpy
+
+# Mapping from the model class names to their module, and whether their likelihood is Gaussian or Poisson
+MODELS = {
+    'BMF_Gaussian_Gaussian':                          ('bmf_gaussian_gaussian', 'gaussian'),
+    'BMF_Gaussian_Gaussian_univariate':               ('bmf_gaussian_gaussian_univariate', 'gaussian'),
+    'BMF_Gaussian_Gaussian_Wishart':                  ('bmf_gaussian_gaussian_wishart', 'gaussian'),
+    'BMF_Gaussian_Gaussian_ARD':                      ('bmf_gaussian_gaussian_ard', 'gaussian'),
+    'BMF_Gaussian_Laplace':                           ('bmf_gaussian_laplace', 'gaussian'),
+    'BMF_Gaussian_Laplace_IG':                        ('bmf_gaussian_laplace_inversegaussian', 'gaussian'),
+    'BMF_Gaussian_L21':                               ('bmf_gaussian_l21', 'gaussian'),
+    'BMF_Gaussian_Gaussian_VolumePrior':              ('bmf_gaussian_gaussian_volumeprior', 'gaussian'),
+    'BMF_Gaussian_Gaussian_VolumePrior_nonnegative':  ('bmf_gaussian_gaussian_volumeprior_nonnegative', 'gaussian'),
+    'BMF_Gaussian_Exponential':                       ('bmf_gaussian_exponential', 'gaussian'),
+    'BMF_Gaussian_Exponential_ARD':                   ('bmf_gaussian_exponential_ard', 'gaussian'),
+    'BMF_Gaussian_Gaussian_Exponential':              ('bmf_gaussian_gaussian_exponential', 'gaussian'),
+    'BMF_Gaussian_TruncatedNormal':                   ('bmf_gaussian_truncatednormal', 'gaussian'),
+    'BMF_Gaussian_TruncatedNormal_Hierarchical':      ('bmf_gaussian_truncatednormal_hierarchical', 'gaussian'),
+    'BMF_Gaussian_HalfNormal':                        ('bmf_gaussian_halfnormal', 'gaussian'),
+    'BMF_Poisson_Gamma':                              ('bmf_poisson_gamma', 'poisson'),
+    'BMF_Poisson_Gamma_Gamma':                        ('bmf_poisson_gamma_gamma', 'poisson'),
+    'BMF_Poisson_Gamma_Dirichlet':                    ('bmf_poisson_gamma_dirichlet', 'poisson'),
+}
+OPTIONS_MISSINGNESS = ['random', 'power_law']
+
+# Number of entries of R (observed or not) we consider at a time
+BLOCK_ENTRIES = 2*10**6
+
+
+''' Priors, drawing all I x K values at once. '''
+def draw_gaussian(I, K, lamb):
+    ''' Uik ~ N(0, lamb^-1), with lamb a scalar or a vector of length K. '''
+    return numpy.random.normal(0., 1./numpy.sqrt(lamb), size=(I,K))
+
+def draw_exponential(I, K, lamb):
+    ''' Uik ~ Exp(lamb), with lamb a scalar or a vector of length K. '''
+    return numpy.random.exponential(1./numpy.asarray(lamb, dtype=float), size=(I,K))
+
+def draw_truncated_normal(I, K, mu, tau):
+    ''' Uik ~ TN(mu, tau^-1), with mu and tau scalars or I x K matrices.
+        Like truncated_normal_vector_draw(), invalid draws (for extreme mu and
+        tau) are set to 0. '''
+    mu, sigma = mu * numpy.ones((I,K)), 1./numpy.sqrt(tau) * numpy.ones((I,K))
+    U = truncnorm.rvs(a=-mu/sigma, b=numpy.inf, loc=mu, scale=sigma, size=(I,K))
+    U[~numpy.isfinite(U) | (U < 0.)] = 0.
+    return U
+
+def draw_half_normal(I, K, sigma):
+    ''' Uik ~ HN(sigma). '''
+    return numpy.abs(numpy.random.normal(0., sigma, size=(I,K)))
+
+def draw_laplace(I, K, eta):
+    ''' Uik ~ L(0, eta), with eta a scalar or an I x K matrix. '''
+    return numpy.random.laplace(0., eta, size=(I,K))
+
+def draw_gamma(I, K, a, b):
+    ''' Uik ~ Gamma(a, b), with b a scalar or a vector of length I. '''
+    return numpy.random.gamma(a, 1./numpy.reshape(b, (-1,1)), size=(I,K))
+
+def draw_gaussian_wishart(I, K, mu0, beta0, v0, W0):
+    ''' muU, sigmaU ~ NIW(mu0, beta0, v0, W0), and Ui ~ N(muU, sigmaU). '''
+    muU, sigmaU = normal_inverse_wishart_draw(mu0=mu0, beta0=beta0, v0=v0, W0=W0)
+    return numpy.random.multivariate_normal(muU, sigmaU, size=I)
+
+
+''' Drawing the factor matrices. '''
+def model_name(model):
+    ''' Return the class name of the model, given as class or name. '''
+    name = model if isinstance(model, str) else model.__name__
+    assert name in MODELS, "No generative process for model %s. Should be one of %s." % (name, sorted(MODELS.keys()))
+    return name
+
+def model_hyperparameters(name, K, hyperparameters):
+    ''' Return the hyperparameters, with the defaults of the model (and those
+        that depend on K) for the ones not given. '''
+    module = importlib.import_module('BMF_Priors.code.models.%s' % MODELS[name][0])
+    defaults = dict(module.DEFAULT_HYPERPARAMETERS)
+    if name == 'BMF_Gaussian_Gaussian_Wishart':
+        defaults['v0'] = K
+    if name == 'BMF_Gaussian_Laplace_IG':
+        defaults['a'], defaults['b'] = 1./K, float(K)
+    return dict(defaults, **hyperparameters)
+
+def draw_factors(model, I, J, K, hyperparameters={}):
+    ''' Return (U, V, tau), drawn from the priors of the model. tau is None
+        for the Poisson models. '''
+    name = model_name(model)
+    hp = model_hyperparameters(name, K, hyperparameters)
+    if name in ['BMF_Gaussian_Gaussian', 'BMF_Gaussian_Gaussian_univariate']:
+        U, V = draw_gaussian(I, K, hp['lamb']), draw_gaussian(J, K, hp['lamb'])
+    elif name == 'BMF_Gaussian_Gaussian_Wishart':
+        mu0 = hp['mu0'] * numpy.ones(K) if numpy.shape(hp['mu0']) == () else hp['mu0']
+        W0 = hp['W0'] * numpy.eye(K) if numpy.shape(hp['W0']) == () else hp['W0']
+        U = draw_gaussian_wishart(I, K, mu0=mu0, beta0=hp['beta0'], v0=hp['v0'], W0=W0)
+        V = draw_gaussian_wishart(J, K, mu0=mu0, beta0=hp['beta0'], v0=hp['v0'], W0=W0)
+    elif name in ['BMF_Gaussian_Gaussian_ARD', 'BMF_Gaussian_Exponential_ARD']:
+        lamb = numpy.random.gamma(hp['alpha0'], 1./hp['beta0'], size=K)
+        draw = draw_gaussian if name == 'BMF_Gaussian_Gaussian_ARD' else draw_exponential
+        U, V = draw(I, K, lamb), draw(J, K, lamb)
+    elif name == 'BMF_Gaussian_Laplace':
+        U, V = draw_laplace(I, K, hp['eta']), draw_laplace(J, K, hp['eta'])
+    elif name == 'BMF_Gaussian_Laplace_IG':
+        mu, tau = numpy.sqrt(hp['b']/float(hp['a'])), hp['b']
+        U = draw_laplace(I, K, numpy.random.wald(mu, tau, size=(I,K)))
+        V = draw_laplace(J, K, numpy.random.wald(mu, tau, size=(J,K)))
+    elif name == 'BMF_Gaussian_L21':
+        U, V = draw_truncated_normal(I, K, 0., 1.), draw_truncated_normal(J, K, 0., 1.)
+    elif name == 'BMF_Gaussian_Gaussian_VolumePrior_nonnegative':
+        U, V = draw_truncated_normal(I, K, 0., 1.), draw_gaussian(J, K, hp['lamb'])
+    elif name == 'BMF_Gaussian_Gaussian_VolumePrior':
+        U, V = draw_gaussian(I, K, 1.), draw_gaussian(J, K, hp['lamb'])
+    elif name == 'BMF_Gaussian_Exponential':
+        U, V = draw_exponential(I, K, hp['lamb']), draw_exponential(J, K, hp['lamb'])
+    elif name == 'BMF_Gaussian_Gaussian_Exponential':
+        U, V = draw_exponential(I, K, hp['lamb']), draw_gaussian(J, K, hp['lamb'])
+    elif name == 'BMF_Gaussian_TruncatedNormal':
+        U = draw_truncated_normal(I, K, hp['muUV'], hp['tauUV'])
+        V = draw_truncated_normal(J, K, hp['muUV'], hp['tauUV'])
+    elif name == 'BMF_Gaussian_TruncatedNormal_Hierarchical':
+        U, V = [
+            draw_truncated_normal(n, K,
+                mu=numpy.random.normal(hp['mu_mu'], 1./numpy.sqrt(hp['tau_mu']), size=(n,K)),
+                tau=numpy.random.gamma(hp['a'], 1./hp['b'], size=(n,K)))
+            for n in [I, J]
+        ]
+    elif name == 'BMF_Gaussian_HalfNormal':
+        U, V = draw_half_normal(I, K, hp['sigma']), draw_half_normal(J, K, hp['sigma'])
+    elif name == 'BMF_Poisson_Gamma':
+        U, V = draw_gamma(I, K, hp['a'], hp['b']), draw_gamma(J, K, hp['a'], hp['b'])
+    elif name == 'BMF_Poisson_Gamma_Gamma':
+        hU = numpy.random.gamma(hp['ap'], hp['bp']/float(hp['ap']), size=I)
+        hV = numpy.random.gamma(hp['ap'], hp['bp']/float(hp['ap']), size=J)
+        U, V = draw_gamma(I, K, hp['a'], hU), draw_gamma(J, K, hp['a'], hV)
+    elif name == 'BMF_Poisson_Gamma_Dirichlet':
+        alpha = hp['alpha'] * numpy.ones(K) if numpy.shape(hp['alpha']) == () else hp['alpha']
+        U, V = numpy.random.dirichlet(alpha, size=I), draw_gamma(J, K, hp['a'], hp['b'])
+
+    tau = numpy.random.gamma(hp['alpha'], 1./hp['beta']) if MODELS[name][1] == 'gaussian' else None
+    return (U, V, tau)
+
+
+''' Generating the mask and observed entries. '''
+def power_law_weights(n, exponent):
+    ''' Return weights proportional to rank ^ -exponent, in a random order,
+        normalised to mean 1. '''
+    weights = numpy.random.permutation(numpy.arange(1, n+1) ** -float(exponent))
+    return weights / weights.mean()
+
+def draw_observations(U, V, tau, indices_row, indices_column):
+    ''' Return the values of R at the given entries, drawn from the Gaussian
+        likelihood with precision tau, or the Poisson if tau is None. '''
+    R_true = numpy.einsum('nk,nk->n', U[indices_row], V[indices_column])
+    if tau is None:
+        return numpy.random.poisson(R_true).astype(float)
+    return R_true + numpy.random.normal(0., 1./numpy.sqrt(tau), size=len(R_true))
+
+def generate_entries(U, V, tau, fraction, missingness='random', exponent=0.5):
+    ''' Generate the observed entries, in blocks of rows. Yield tuples
+        (indices_row, indices_column, values) per block. '''
+    assert missingness in OPTIONS_MISSINGNESS, \
+        "Unknown missingness option: %s. Should be one of %s." % (missingness, OPTIONS_MISSINGNESS)
+    (I,J) = U.shape[0], V.shape[0]
+    if missingness == 'random':
+        weights_row, weights_column = numpy.ones(I), numpy.ones(J)
+    else:
+        weights_row, weights_column = power_law_weights(I, exponent), power_law_weights(J, exponent)
+    p_column = weights_column / weights_column.sum()
+
+    rows_block = max(1, BLOCK_ENTRIES / J)
+    for i_start in range(0, I, rows_block):
+        i_end = min(I, i_start + rows_block)
+        probabilities = fraction if missingness == 'random' else \
+            numpy.minimum(1., fraction * numpy.outer(weights_row[i_start:i_end], weights_column))
+        observed = numpy.random.rand(i_end - i_start, J) < probabilities
+
+        # Give the rows without entries one, with the same column popularity
+        empty = numpy.flatnonzero(~observed.any(axis=1))
+        observed[empty, numpy.random.choice(J, size=len(empty), p=p_column)] = True
+
+        indices_row, indices_column = numpy.nonzero(observed)
+        indices_row += i_start
+        yield (indices_row, indices_column, draw_observations(U, V, tau, indices_row, indices_column))
+
+def collect_entries(blocks, capacity):
+    ''' Return (indices_row, indices_column, values) of all the :blocks, copied
+        into arrays of size :capacity, which are doubled if they run out. '''
+    arrays, size = [numpy.empty(capacity, dtype=int), numpy.empty(capacity, dtype=int), numpy.empty(capacity)], 0
+    for block in blocks:
+        n = len(block[0])
+        if size + n > len(arrays[0]):
+            arrays = [numpy.resize(array, max(2*len(array), size+n)) for array in arrays]
+        for array, block_array in zip(arrays, block):
+            array[size:size+n] = block_array
+        size += n
+    return tuple(array[:size] for array in arrays)
+
+def generate_dataset(model, I, J, K, fraction, missingness='random', exponent=0.5, hyperparameters={}):
+    ''' Return (R, M), with R a csr_matrix of the observed entries drawn from
+        the model's generative process, and M the IndexMask of those entries. '''
+    U, V, tau = draw_factors(model, I, J, K, hyperparameters)
+    blocks = generate_entries(U, V, tau, fraction, missingness, exponent)
+    indices_row, indices_column, values = collect_entries(blocks, capacity=int(fraction*I*J) + I)
+
+    # Give the columns without entries one, in a random row
+    empty = numpy.flatnonzero(numpy.bincount(indices_column, minlength=J) == 0)
+    if len(empty) > 0:
+        rows_empty = numpy.random.randint(I, size=len(empty))
+        indices_row = numpy.concatenate([indices_row, rows_empty])
+        indices_column = numpy.concatenate([indices_column, empty])
+        values = numpy.concatenate([values, draw_observations(U, V, tau, rows_empty, empty)])
+        order = numpy.lexsort((indices_column, indices_row))
+        indices_row, indices_column, values = indices_row[order], indices_column[order], values[order]
+
+    # Build the csr matrix directly, so that zero values are kept as entries
+    indptr = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(indices_row, minlength=I))])
+    R = csr_matrix((values, indices_column, indptr), shape=(I,J))
+    M = IndexMask((I,J), indices_row, indices_column)
+    return (R, M)
+
+def to_dense(R, M):
+    ''' Return the dense (R, M) of the dataset, for the models. '''
+    return (R.toarray(), M.toarray())
@@ -1,10 +1,23 @@
 '''
 General methods for running the convergence experiments.
+
+Besides the average convergence curves (measure_convergence_time), we measure
+the time to accuracy of a model: the number of iterations and wall time each
+repeat needs to reach a training MSE within :tolerance (e.g. 0.05 = 5%) of
+either the :target MSE, or (if no target is given) the final MSE of that
+repeat. With a target we can also stop each repeat as soon as it is reached
+(early_stop=True), rather than running all iterations.
 '''
 
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.experiments.experiment_runner import run_experiment_tasks, is_error
+
 import numpy
 
-def measure_convergence_time(repeats, model_class, settings, fout_performances=None, fout_times=None):
+def measure_convergence_time(repeats, model_class, settings, fout_performances=None, fout_times=None, P=1, seed=None):
     ''' Run the convergence experiment :repeats times. 
         Return (performances, times), giving average performances (MSE) and 
         timestamps across the 10 runs. Also store them in :fout_performances 
@@ -15,19 +28,25 @@ def measure_convergence_time(repeats, model_class, settings, fout_performances=N
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'K', 'hyperparameters', 'init', 'iterations'}.
         - fout_performances, fout_times -- strings giving location of output files.
+        - P -- number of processes to run the repeats on (see experiment_runner.py).
+        - seed -- optionally a seed, to make the runs reproducible.
     '''
     # Run the method :repeats times
-    times_repeats = []
-    performances_repeats = []
-    for i in range(repeats):
-        print "Convergence experiment. Repeat %s." % (i+1)
-        R, M, K, hyperparameters = settings['R'], settings['M'], settings['K'], settings['hyperparameters']
-        init, iterations = settings['init'], settings['iterations']
-        BMF = model_class(R,M,K,hyperparameters) 
-        BMF.initialise(init)
-        BMF.run(iterations)
-        times, performances = BMF.all_times, BMF.all_performances
-        times_repeats.append(times), performances_repeats.append(performances['MSE'])
+    R, M, K, hyperparameters = settings['R'], settings['M'], settings['K'], settings['hyperparameters']
+    init, iterations = settings['init'], settings['iterations']
+    tasks = [
+        {
+            'message': "Convergence experiment. Repeat %s." % (i+1),
+            'method': model_class, 'R': R, 'M': M,
+            'parameters': {'K':K, 'hyperparameters':hyperparameters},
+            'train_config': {'init':init, 'iterations':iterations},
+            'output': 'convergence',
+        }
+        for i in range(repeats)
+    ]
+    outputs = run_experiment_tasks(tasks, P=P, seed=seed)
+    times_repeats = [times for (times,_) in outputs]
+    performances_repeats = [performances for (_,performances) in outputs]
         
     # Compute averages and store in files
     times_average = list(numpy.average(times_repeats, axis=0))
@@ -35,4 +54,82 @@ def measure_convergence_time(repeats, model_class, settings, fout_performances=N
     if fout_performances and fout_times:
         open(fout_performances,'w').write("%s" % performances_average)
         open(fout_times,'w').write("%s" % times_average)
-    return (performances_average, times_average)
\ No newline at end of file
+    return (performances_average, times_average)
+
+
+def time_to_accuracy(performances, times, tolerance=0.05, target=None):
+    ''' Return (iterations, time) until the MSEs :performances are first within
+        :tolerance of the :target (or final) MSE, or (None, None) if never. '''
+    threshold = (performances[-1] if target is None else target) * (1. + tolerance)
+    reached = numpy.flatnonzero(numpy.array(performances) <= threshold)
+    if len(reached) == 0:
+        return (None, None)
+    return (reached[0] + 1, times[reached[0]])
+
+def measure_time_to_accuracy(repeats, model_class, settings, tolerance=0.05, target=None, early_stop=False,
+                             check_every=10, P=1, seed=None):
+    ''' Run the model :repeats times, and return a dictionary with the time to
+        accuracy of each repeat, {'iterations', 'times'} (lists, with None for
+        the repeats that did not reach it), and their averages over the repeats 
+        that did, {'average_iterations', 'average_time'}, and 'reached', the 
+        number of those repeats. 
+        
+        If any of the repeats fail, we instead return {'error', 'failed'}, 
+        with the error of the first failed repeat, and the number that failed.
+        
+        Arguments are as for measure_convergence_time(), and:
+        - tolerance, target -- see time_to_accuracy().
+        - early_stop -- if True, stop each repeat once it is within :tolerance
+          of the :target, checking every :check_every iterations.
+    '''
+    assert not early_stop or target is not None, "Can only stop early with a target MSE."
+    R, M, K, hyperparameters = settings['R'], settings['M'], settings['K'], settings['hyperparameters']
+    init, iterations = settings['init'], settings['iterations']
+    tasks = [
+        {
+            'message': "Time to accuracy of %s. Repeat %s." % (model_class.__name__, i+1),
+            'method': model_class, 'R': R, 'M': M,
+            'parameters': {'K':K, 'hyperparameters':hyperparameters},
+            'train_config': {'init':init, 'iterations':iterations},
+            'output': 'convergence',
+            'target': target * (1. + tolerance) if early_stop else None,
+            'check_every': check_every,
+        }
+        for i in range(repeats)
+    ]
+    outputs = run_experiment_tasks(tasks, P=P, seed=seed, errors='return')
+    errors = [output['error'] for output in outputs if is_error(output)]
+    if errors:
+        return { 'error': errors[0], 'failed': len(errors) }
+    iterations_repeats, times_repeats = zip(*[
+        time_to_accuracy(performances, times, tolerance=tolerance, target=target) for (times,performances) in outputs])
+    reached = [n for n,iterations_repeat in enumerate(iterations_repeats) if iterations_repeat is not None]
+    return {
+        'iterations': list(iterations_repeats),
+        'times': list(times_repeats),
+        'average_iterations': numpy.average([iterations_repeats[n] for n in reached]) if reached else None,
+        'average_time': numpy.average([times_repeats[n] for n in reached]) if reached else None,
+        'reached': len(reached),
+    }
+
+def compare_time_to_accuracy(repeats, models, settings, tolerance=0.05, target=None, early_stop=False,
+                             check_every=10, fout=None, P=1, seed=None):
+    ''' Measure the time to accuracy of each model in :models, a list of tuples
+        (model_class, hyperparameters), with the other :settings shared. Return
+        a dictionary from the model names to the output of 
+        measure_time_to_accuracy(), and also store it in :fout if given. We 
+        rewrite :fout after each model, so that a crash keeps the results so far. '''
+    results = {}
+    for model_class, hyperparameters in models:
+        result = measure_time_to_accuracy(
+            repeats=repeats, model_class=model_class, settings=dict(settings, hyperparameters=hyperparameters),
+            tolerance=tolerance, target=target, early_stop=early_stop, check_every=check_every, P=P, seed=seed)
+        results[model_class.__name__] = result
+        if 'error' in result:
+            print "%s: %s of %s repeats failed. %s" % (model_class.__name__, result['failed'], repeats, result['error'])
+        else:
+            print "%s: %s iterations, %s seconds (%s of %s repeats reached the accuracy)." % (
+                model_class.__name__, result['average_iterations'], result['average_time'], result['reached'], repeats)
+        if fout:
+            open(fout,'w').write("%s" % results)
+    return results
\ No newline at end of file
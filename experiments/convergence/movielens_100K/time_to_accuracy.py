@@ -0,0 +1,71 @@
+'''
+Measure the time to accuracy on the MovieLens 100K dataset of all BMF models:
+the iterations and wall time needed to get within 5% of the final training MSE
+(or, if target is set, within 5% of that MSE - stopping each repeat once it
+gets there).
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.bmf_gaussian_exponential import BMF_Gaussian_Exponential
+from BMF_Priors.code.models.bmf_gaussian_exponential_ard import BMF_Gaussian_Exponential_ARD
+from BMF_Priors.code.models.bmf_gaussian_gaussian import BMF_Gaussian_Gaussian
+from BMF_Priors.code.models.bmf_gaussian_gaussian_ard import BMF_Gaussian_Gaussian_ARD
+from BMF_Priors.code.models.bmf_gaussian_gaussian_exponential import BMF_Gaussian_Gaussian_Exponential
+from BMF_Priors.code.models.bmf_gaussian_gaussian_univariate import BMF_Gaussian_Gaussian_univariate
+from BMF_Priors.code.models.bmf_gaussian_gaussian_volumeprior import BMF_Gaussian_Gaussian_VolumePrior
+from BMF_Priors.code.models.bmf_gaussian_gaussian_volumeprior_nonnegative import BMF_Gaussian_Gaussian_VolumePrior_nonnegative
+from BMF_Priors.code.models.bmf_gaussian_gaussian_wishart import BMF_Gaussian_Gaussian_Wishart
+from BMF_Priors.code.models.bmf_gaussian_halfnormal import BMF_Gaussian_HalfNormal
+from BMF_Priors.code.models.bmf_gaussian_l21 import BMF_Gaussian_L21
+from BMF_Priors.code.models.bmf_gaussian_laplace import BMF_Gaussian_Laplace
+from BMF_Priors.code.models.bmf_gaussian_laplace_inversegaussian import BMF_Gaussian_Laplace_IG
+from BMF_Priors.code.models.bmf_gaussian_truncatednormal import BMF_Gaussian_TruncatedNormal
+from BMF_Priors.code.models.bmf_gaussian_truncatednormal_hierarchical import BMF_Gaussian_TruncatedNormal_Hierarchical
+from BMF_Priors.code.models.bmf_poisson_gamma import BMF_Poisson_Gamma
+from BMF_Priors.code.models.bmf_poisson_gamma_dirichlet import BMF_Poisson_Gamma_Dirichlet
+from BMF_Priors.code.models.bmf_poisson_gamma_gamma import BMF_Poisson_Gamma_Gamma
+from BMF_Priors.data.movielens.load_data import load_movielens_100K
+from BMF_Priors.experiments.convergence.convergence_experiment import compare_time_to_accuracy
+
+import math
+
+
+''' Run the experiment. '''
+R, M = load_movielens_100K()
+K = 20
+models = [
+    (BMF_Gaussian_Gaussian, { 'alpha':1., 'beta':1., 'lamb':0.1 }),
+    (BMF_Gaussian_Gaussian_univariate, { 'alpha':1., 'beta':1., 'lamb':0.1 }),
+    (BMF_Gaussian_Gaussian_Wishart, { 'alpha':1., 'beta':1., 'mu0':0., 'beta0':1., 'v0':K, 'W0':1. }),
+    (BMF_Gaussian_Gaussian_ARD, { 'alpha':1., 'beta':1., 'alpha0':1., 'beta0':1. }),
+    (BMF_Gaussian_Laplace, { 'alpha':1., 'beta':1., 'eta':math.sqrt(10.) }),
+    (BMF_Gaussian_Laplace_IG, { 'alpha':1., 'beta':1. }),
+    (BMF_Gaussian_L21, { 'alpha':1., 'beta':1., 'lamb':0.1 }),
+    (BMF_Gaussian_Gaussian_VolumePrior, { 'alpha':1., 'beta':1., 'lamb':0.1, 'gamma':10**-50 }),
+    (BMF_Gaussian_Gaussian_VolumePrior_nonnegative, { 'alpha':1., 'beta':1., 'lamb':0.1, 'gamma':10**-50 }),
+    (BMF_Gaussian_Exponential, { 'alpha':1., 'beta':1., 'lamb':0.1 }),
+    (BMF_Gaussian_Exponential_ARD, { 'alpha':1., 'beta':1., 'alpha0':1., 'beta0':1. }),
+    (BMF_Gaussian_Gaussian_Exponential, { 'alpha':1., 'beta':1., 'lamb':0.1 }),
+    (BMF_Gaussian_TruncatedNormal, { 'alpha':1., 'beta':1., 'muUV':0., 'tauUV':0.1 }),
+    (BMF_Gaussian_TruncatedNormal_Hierarchical, { 'alpha':1., 'beta':1., 'mu_mu':0.1, 'tau_mu':0.1, 'a':1., 'b':1. }),
+    (BMF_Gaussian_HalfNormal, { 'alpha':1., 'beta':1., 'sigma':10. }),
+    (BMF_Poisson_Gamma, { 'a':1., 'b':1. }),
+    (BMF_Poisson_Gamma_Gamma, { 'a':1., 'ap':1., 'bp':1. }),
+    (BMF_Poisson_Gamma_Dirichlet, { 'alpha':1., 'a':1., 'b':1. }),
+]
+settings = {
+    'R': R,
+    'M': M,
+    'K': K,
+    'init': 'random',
+    'iterations': 200,
+}
+tolerance, target = 0.05, None
+fout = './results/time_to_accuracy.txt'
+repeats = 10
+results = compare_time_to_accuracy(
+    repeats, models, settings, tolerance=tolerance, target=target, early_stop=(target is not None),
+    fout=fout, P=4, seed=0)
@@ -0,0 +1,180 @@
+'''
+Shared runner for the experiments. The experiments expand their loops over
+settings and repeats into a list of independent tasks, each training a model,
+which we run either sequentially or on a pool of P worker processes, and
+return the outputs in the same order.
+
+Each task is a dictionary with:
+- 'method' -- the BMF class.
+- 'R', 'M' -- the data, and the mask of the training entries.
+- 'parameters' -- arguments for the constructor, {'K', 'hyperparameters'}.
+- 'train_config' -- arguments for train(), {'init', 'iterations'}.
+- 'output' -- what to return:
+    'performances' -> the performance dict on the entries in 'M_test',
+                      using 'predict_config' {'burn_in', 'thinning'};
+    'convergence'  -> the tuple (all_times, all_performances['MSE']). If the
+                      task has a 'target' MSE, we stop the run once the
+                      training MSE reaches it, checking every 'check_every'
+                      (default 10) iterations;
+    'expectation'  -> the tuple (expU, expV), using 'predict_config'.
+- optionally 'M_test', 'predict_config', 'message' (printed when the task
+  starts), and 'cache' (a ResultCache, used for the 'performances' tasks).
+
+If :seed is given, task n seeds numpy's random number generator with the n-th
+value drawn from numpy.random.RandomState(seed), so that the results do not
+depend on P or on the order in which the tasks run. Otherwise the workers are
+reseeded when they start, so that they do not share the random state of the
+parent process.
+With P > 1, we publish the distinct numpy matrices (R, M, M_test) once, as
+memory-mapped files (see code/cross_validation/shared_data.py), instead of
+pickling them into every task.
+
+If a task raises an exception, its output is an error record {'error',
+'traceback'} (see is_error()) instead, so that the other tasks still run. Once
+all tasks are done, run_experiment_tasks() raises an error listing the failed
+tasks, unless it is given errors='return', in which case the error records are
+returned in place of their outputs.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.result_cache import run_model_cached
+from BMF_Priors.code.cross_validation.shared_data import publish_arrays, load_arrays, remove_arrays
+
+from multiprocessing import Pool
+import numpy
+import traceback
+
+MATRICES = ['R', 'M', 'M_test']
+
+# The matrices published by run_experiment_tasks, loaded once by each worker
+worker_data = {}
+
+def initialise_worker(folder):
+    worker_data.update(load_arrays(folder))
+    numpy.random.seed()
+
+
+def performance_task(message, model_class, R, M_train, M_test, K, hyperparameters, settings, cache=None):
+    ''' Return the task for training the model on M_train, and measuring the
+        performances on M_test, with the init, iterations, burn_in and
+        thinning in :settings. '''
+    return {
+        'message': message,
+        'method': model_class,
+        'R': R,
+        'M': M_train,
+        'M_test': M_test,
+        'parameters': {'K':K, 'hyperparameters':hyperparameters},
+        'train_config': {'init':settings['init'], 'iterations':settings['iterations']},
+        'predict_config': {'burn_in':settings['burn_in'], 'thinning':settings['thinning']},
+        'output': 'performances',
+        'cache': cache,
+    }
+
+def performances_per_setting(outputs, no_settings, metrics):
+    ''' Given the performance dicts of the tasks, with the same number of
+        repeats for each of the :no_settings settings in order, return a
+        dictionary from the metrics to a list (per setting) of lists (per repeat). '''
+    no_repeats = len(outputs) / no_settings
+    return {
+        metric: [
+            [performance[metric] for performance in outputs[s*no_repeats:(s+1)*no_repeats]]
+            for s in range(no_settings)
+        ]
+        for metric in metrics
+    }
+
+
+def is_error(output):
+    ''' Return True if the output of a task is an error record. '''
+    return isinstance(output, dict) and 'error' in output and 'traceback' in output
+
+def run_task(task):
+    ''' Run the task, and return its output (see above), or an error record
+        if it raises an exception. '''
+    try:
+        return run_task_output(task)
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+        print "Task failed: %s. %s" % (task.get('message') or task['method'].__name__, error)
+        return { 'error': error, 'traceback': traceback.format_exc() }
+
+def run_task_output(task):
+    ''' Run the task, and return its output (see above). '''
+    if task.get('message'):
+        print task['message']
+    R, M, M_test = [worker_data[task[name]] if isinstance(task.get(name), str) else task.get(name) for name in MATRICES]
+    method, parameters, train_config = task['method'], task['parameters'], task['train_config']
+    predict_config, seed = task.get('predict_config', {}), task.get('seed')
+    if task['output'] == 'performances':
+        return run_model_cached(task.get('cache'),method,R,M,M_test,parameters,train_config,predict_config,seed)
+
+    if seed is not None:
+        numpy.random.seed(seed)
+    model = method(R,M,**parameters)
+    if task['output'] == 'convergence' and task.get('target') is not None:
+        train_until_target(model, task['target'], task.get('check_every', 10), **train_config)
+    else:
+        model.train(**train_config)
+    if task['output'] == 'convergence':
+        return (model.all_times, model.all_performances['MSE'])
+    assert task['output'] == 'expectation', "Unknown output for task: %s." % task['output']
+    return model.approx_expectation_UV(**predict_config)
+
+
+def train_until_target(model, target, check_every, init, iterations):
+    ''' Initialise and run the model for at most :iterations iterations, in
+        chunks of :check_every, and stop once its training MSE is at most :target. '''
+    model.initialise(init=init)
+    model.run(min(check_every, iterations))
+    while len(model.all_performances['MSE']) < iterations and min(model.all_performances['MSE']) > target:
+        model.continue_run(min(check_every, iterations - len(model.all_performances['MSE'])))
+
+
+def run_experiment_tasks(tasks, P=1, seed=None, errors='raise'):
+    ''' Run the tasks on :P processes, and return the list of their outputs. 
+        If any tasks failed, raise an error once all tasks are done, or, with
+        errors='return', return their error records as their outputs. '''
+    assert errors in ['raise', 'return'], "Unknown option for errors: %s." % errors
+    if seed is not None:
+        seeds = numpy.random.RandomState(seed).randint(2**31-1, size=len(tasks))
+        tasks = [dict(task, seed=int(task_seed)) for task,task_seed in zip(tasks,seeds)]
+    outputs = run_tasks(tasks, P)
+    failed = [(task, output) for task,output in zip(tasks,outputs) if is_error(output)]
+    if failed and errors == 'raise':
+        raise RuntimeError("%s of %s tasks failed:\n%s" % (len(failed), len(tasks), "\n".join(
+            "%s: %s" % (task.get('message') or task['method'].__name__, output['traceback']) for task,output in failed)))
+    return outputs
+
+def run_tasks(tasks, P):
+    ''' Run the tasks on :P processes, and return the list of their outputs. '''
+    if P == 1:
+        return [run_task(task) for task in tasks]
+
+    # Publish each distinct matrix once, and refer to it by name in the tasks
+    arrays, names, tasks_published = {}, {}, []
+    for task in tasks:
+        task = dict(task)
+        for name in MATRICES:
+            if isinstance(task.get(name), numpy.ndarray):
+                if id(task[name]) not in names:
+                    names[id(task[name])] = 'matrix%s' % len(names)
+                    arrays[names[id(task[name])]] = task[name]
+                task[name] = names[id(task[name])]
+        tasks_published.append(task)
+    folder = publish_arrays(arrays)
+
+    pool = Pool(P, initializer=initialise_worker, initargs=(folder,))
+    try:
+        outputs = pool.map(run_task, tasks_published, chunksize=1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        remove_arrays(folder)
+    return outputs
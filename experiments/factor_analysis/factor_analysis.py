@@ -6,9 +6,11 @@ import sys, os
 project_location = os.path.dirname(__file__)+"/../../../"
 sys.path.append(project_location)
 
+from BMF_Priors.experiments.experiment_runner import run_experiment_tasks
+
 import numpy
 
-def run_model_store_matrices(n_repeats, model_class, settings, fout_U=None, fout_V=None):
+def run_model_store_matrices(n_repeats, model_class, settings, fout_U=None, fout_V=None, P=1, seed=None):
     ''' Run the factor analysis experiment.
         Run the model, :n_repeats times, and return a list of the expU and expV
         matrices: (all_expU, all_expV).
@@ -19,6 +21,8 @@ def run_model_store_matrices(n_repeats, model_class, settings, fout_U=None, fout
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'K', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout_U, fout_V -- strings giving locations of output files.
+        - P -- number of processes to run the repeats on (see experiment_runner.py).
+        - seed -- optionally a seed, to make the runs reproducible.
     '''
     # Extract the settings
     R, M, K, hyperparameters = settings['R'], settings['M'], settings['K'], settings['hyperparameters']
@@ -27,13 +31,19 @@ def run_model_store_matrices(n_repeats, model_class, settings, fout_U=None, fout
     I, J = R.shape[0], R.shape[1]
     
     # For each repeat, approximate U,V and store them
+    tasks = [
+        {
+            'message': "Repeat %s." % (r+1),
+            'method': model_class, 'R': R, 'M': M,
+            'parameters': {'K':K, 'hyperparameters':hyperparameters},
+            'train_config': {'init':init, 'iterations':iterations},
+            'predict_config': {'burn_in':burn_in, 'thinning':thinning},
+            'output': 'expectation',
+        }
+        for r in range(n_repeats)
+    ]
     all_expU, all_expV = numpy.zeros((n_repeats,I,K)), numpy.zeros((n_repeats,J,K))
-    for r in range(n_repeats):
-        print "Repeat %s." % (r+1)
-        BMF = model_class(R, M, K, hyperparameters) 
-        BMF.initialise(init)
-        BMF.run(iterations)
-        expU, expV = BMF.approx_expectation_UV(burn_in=burn_in, thinning=thinning)
+    for r, (expU, expV) in enumerate(run_experiment_tasks(tasks, P=P, seed=seed)):
         all_expU[r,:,:], all_expV[r,:,:] = expU, expV
         
     if fout_U and fout_V:
@@ -6,15 +6,17 @@ import sys, os
 project_location = os.path.dirname(__file__)+"/../../../"
 sys.path.append(project_location)
 
-from BMF_Priors.code.cross_validation.mask import compute_folds_attempts
+from BMF_Priors.code.cross_validation.mask import compute_folds_constructive
 from BMF_Priors.code.models.bmf_gaussian_gaussian_wishart import BMF_Gaussian_Gaussian_Wishart
+from BMF_Priors.experiments.experiment_runner import performance_task
+from BMF_Priors.experiments.experiment_runner import performances_per_setting
+from BMF_Priors.experiments.experiment_runner import run_experiment_tasks
 
 import numpy
 
-ATTEMPTS_GENERATE_FOLDS = 100
 METRICS = ['MSE', 'R^2', 'Rp']
 
-def measure_model_selection(n_folds, values_K, model_class, settings, fout=None):
+def measure_model_selection(n_folds, values_K, model_class, settings, fout=None, cache=None, P=1, seed=None):
     ''' Run the model selection experiment.
         For each K in :values_K, run :n_folds cross-validation and measure the
         performances.
@@ -30,38 +32,32 @@ def measure_model_selection(n_folds, values_K, model_class, settings, fout=None)
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout -- string giving location of output file.
+        - cache -- optionally a ResultCache, to skip the runs that were done before.
+        - P -- number of processes to run the folds on (see experiment_runner.py).
+        - seed -- optionally a seed, to make the runs reproducible.
     '''
     # Extract the settings
     R, M, hyperparameters = settings['R'], settings['M'], settings['hyperparameters']
-    init, iterations = settings['init'], settings['iterations']
-    burn_in, thinning = settings['burn_in'], settings['thinning']
         
-    # Generate the folds
+    # Generate the folds, the same for all values
     I, J = M.shape
-    all_Ms_training_and_test = [
-        compute_folds_attempts(I=I,J=J,no_folds=n_folds,attempts=ATTEMPTS_GENERATE_FOLDS,M=M)
+    Ms_train, Ms_test = compute_folds_constructive(I=I,J=J,no_folds=n_folds,M=M)
+    
+    # For each value of K, run the model on each fold and measure performances.
+    # If GGW model, override v0 value to K.
+    hyperparameters_K = {
+        K: dict(hyperparameters, v0=K) if model_class == BMF_Gaussian_Gaussian_Wishart else hyperparameters
+        for K in values_K
+    }
+    tasks = [
+        performance_task(
+            "Model selection experiment. Fold %s for K=%s." % (i+1, K), 
+            model_class, R, M_train, M_test, K, hyperparameters_K[K], settings, cache)
         for K in values_K
+        for i, (M_train, M_test) in enumerate(zip(Ms_train, Ms_test))
     ]
-    all_performances = { metric:[] for metric in METRICS }
-    for K, (Ms_train, Ms_test) in zip(values_K, all_Ms_training_and_test):
-        # For each value of K, run the model on each fold and measure performances
-        print "Model selection experiment. K=%s." % (K)
-        performances = { metric:[] for metric in METRICS }
-    
-        # If GGW model, override v0 value to K
-        if model_class == BMF_Gaussian_Gaussian_Wishart:
-            hyperparameters['v0'] = K    
-    
-        for i, (M_train, M_test) in enumerate(zip(Ms_train, Ms_test)):
-            print "Fold %s for K=%s." % (i+1, K)
-            BMF = model_class(R, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
-            for metric in METRICS:
-                performances[metric].append(performance[metric])
-        for metric in METRICS:
-            all_performances[metric].append(performances[metric])
+    all_performances = performances_per_setting(
+        run_experiment_tasks(tasks, P=P, seed=seed), len(values_K), METRICS)
     average_performances = { 
         metric : [numpy.mean(performances) for performances in all_performances[metric] ] 
         for metric in METRICS }
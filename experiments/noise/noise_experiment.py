@@ -8,6 +8,9 @@ sys.path.append(project_location)
 
 from BMF_Priors.code.cross_validation.mask import try_generate_M_rows
 from BMF_Priors.code.cross_validation.mask import try_generate_M_columns
+from BMF_Priors.experiments.experiment_runner import performance_task
+from BMF_Priors.experiments.experiment_runner import performances_per_setting
+from BMF_Priors.experiments.experiment_runner import run_experiment_tasks
 
 import numpy
 
@@ -15,7 +18,7 @@ ATTEMPTS_GENERATE_FOLDS = 100
 METRICS = ['MSE', 'R^2', 'Rp']
 FRACTION_TRAIN = 0.9
 
-def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows, model_class, settings, fout=None):
+def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows, model_class, settings, fout=None, cache=None, P=1, seed=None):
     ''' Run the noise experiment.
         For each noise-to-signal ratio in :noise_to_signal_ratios, run the noise
         test :n_repeats times. We use the R in :Rs_noise, which has added Gaussian 
@@ -38,13 +41,14 @@ def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows,
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'M', 'K', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout -- string giving location of output file.
+        - cache -- optionally a ResultCache, to skip the runs that were done before.
+        - P -- number of processes to run the repeats on (see experiment_runner.py).
+        - seed -- optionally a seed, to make the runs reproducible.
     '''
     assert len(Rs_noise) == len(noise_to_signal_ratios), "Rs_noise should be of the same length as noise_to_signal_ratios!"
     
     # Extract the settings
     M, K, hyperparameters = settings['M'], settings['K'], settings['hyperparameters']
-    init, iterations = settings['init'], settings['iterations']
-    burn_in, thinning = settings['burn_in'], settings['thinning']
         
     # Generate the folds
     generate_M = try_generate_M_rows if stratify_rows else try_generate_M_columns
@@ -60,23 +64,18 @@ def noise_experiment(n_repeats, Rs_noise, noise_to_signal_ratios, stratify_rows,
         for NSR in noise_to_signal_ratios
     ]
         
-    all_performances = { metric:[] for metric in METRICS }
-    for R_noise, NSR, Ms_train_and_test in zip(Rs_noise, noise_to_signal_ratios, all_Ms_training_and_test):
-        # For each noise-to-signal ratio, run the model on each fold and measure performances
+    # For each noise-to-signal ratio, run the model on each fold and measure performances
+    for R_noise, NSR in zip(Rs_noise, noise_to_signal_ratios):
         print "Noise experiment. Noise-to-signal ratio=%s. Variance R with noise=%s." % (NSR, R_noise.var())
-        performances = { metric:[] for metric in METRICS }
-    
-        for i, (M_train, M_test) in enumerate(Ms_train_and_test):
-            print "Repeat %s for NSR=%s." % (i+1, NSR)
-            
-            BMF = model_class(R_noise, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
-            for metric in METRICS:
-                performances[metric].append(performance[metric])
-        for metric in METRICS:
-            all_performances[metric].append(performances[metric])
+    tasks = [
+        performance_task(
+            "Noise experiment. Repeat %s for NSR=%s." % (i+1, NSR), 
+            model_class, R_noise, M_train, M_test, K, hyperparameters, settings, cache)
+        for R_noise, NSR, Ms_train_and_test in zip(Rs_noise, noise_to_signal_ratios, all_Ms_training_and_test)
+        for i, (M_train, M_test) in enumerate(Ms_train_and_test)
+    ]
+    all_performances = performances_per_setting(
+        run_experiment_tasks(tasks, P=P, seed=seed), len(noise_to_signal_ratios), METRICS)
     average_performances = { 
         metric : [numpy.mean(performances) for performances in all_performances[metric] ] 
         for metric in METRICS }
@@ -7,18 +7,21 @@ import sys, os
 project_location = os.path.dirname(__file__)+"/../../../../../"
 sys.path.append(project_location)
 
-from BMF_Priors.code.cross_validation.mask import compute_folds_attempts
+from BMF_Priors.code.cross_validation.mask import compute_folds_constructive
 from BMF_Priors.code.models.bmf_gaussian_gaussian_volumeprior import BMF_Gaussian_Gaussian_VolumePrior
 from BMF_Priors.data.drug_sensitivity.load_data import load_gdsc_ic50_integer
 
+from BMF_Priors.experiments.experiment_runner import performance_task
+from BMF_Priors.experiments.experiment_runner import performances_per_setting
+from BMF_Priors.experiments.experiment_runner import run_experiment_tasks
+
 import numpy
 import itertools
 import matplotlib.pyplot as plt
 
-ATTEMPTS_GENERATE_FOLDS = 1000
 METRICS = ['MSE', 'R^2', 'Rp']
 
-def explore_gamma(n_folds, values_gamma_K, model_class, settings, fout=None):
+def explore_gamma(n_folds, values_gamma_K, model_class, settings, fout=None, cache=None, P=1, seed=None):
     ''' Try different values for gamma.
         Return (performances), giving average performances (MSE) for the gamma
         values in :n_folds cross-validation. Also store them if :fout is not None.
@@ -29,36 +32,28 @@ def explore_gamma(n_folds, values_gamma_K, model_class, settings, fout=None):
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'K', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout_performances, fout_times -- strings giving location of output files.
+        - cache -- optionally a ResultCache, to skip the runs that were done before.
+        - P -- number of processes to run the folds on (see experiment_runner.py).
+        - seed -- optionally a seed, to make the runs reproducible.
     '''
     # Extract the settings
     R, M, hyperparameters = settings['R'], settings['M'], settings['hyperparameters']
-    init, iterations = settings['init'], settings['iterations']
-    burn_in, thinning = settings['burn_in'], settings['thinning']
     
-    # Generate the folds
+    # Generate the folds, the same for all values
     I, J = M.shape
-    all_Ms_training_and_test = [
-        compute_folds_attempts(I=I,J=J,no_folds=n_folds,attempts=ATTEMPTS_GENERATE_FOLDS,M=M)
-        for (gamma,K) in values_gamma_K
-    ]
-    all_performances = { metric:[] for metric in METRICS }
+    Ms_train, Ms_test = compute_folds_constructive(I=I,J=J,no_folds=n_folds,M=M)
 
-    # Run the cross-validations
-    for (gamma, K), (Ms_train, Ms_test) in zip(values_gamma_K, all_Ms_training_and_test):
-        # For each value of K, run the model on each fold and measure performances
-        hyperparameters['gamma'] = gamma
-        print "Parameter search experiment. gamma=%s, K=%s." % (gamma, K)
-        performances = { metric:[] for metric in METRICS }
-        for i, (M_train, M_test) in enumerate(zip(Ms_train, Ms_test)):
-            print "Fold %s for gamma=%s, K=%s." % (i+1, gamma, K)
-            BMF = model_class(R, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
-            for metric in METRICS:
-                performances[metric].append(performance[metric])
-        for metric in METRICS:
-            all_performances[metric].append(performances[metric])
+    # Run the cross-validations: for each value of gamma and K, run the model on
+    # each fold and measure performances
+    tasks = [
+        performance_task(
+            "Parameter search experiment. Fold %s for gamma=%s, K=%s." % (i+1, gamma, K), 
+            model_class, R, M_train, M_test, K, dict(hyperparameters, gamma=gamma), settings, cache)
+        for (gamma, K) in values_gamma_K
+        for i, (M_train, M_test) in enumerate(zip(Ms_train, Ms_test))
+    ]
+    all_performances = performances_per_setting(
+        run_experiment_tasks(tasks, P=P, seed=seed), len(values_gamma_K), METRICS)
     average_performances = { 
         metric : [numpy.mean(performances) for performances in all_performances[metric] ] 
         for metric in METRICS }
@@ -0,0 +1,235 @@
+'''
+Micro-benchmarks of the samplers in code/models/Gibbs/distributions/, whose
+cost dominates the updates of several models.
+
+Each case draws from one sampler in one parameter regime - the body and tails
+of the truncated normal, small and large K for the multivariate normal and
+Normal-Inverse Wishart, and single (scalar) draws against batched ones. For each
+case we record:
+- 'draws_per_second' -- the throughput, calling the sampler repeatedly for at
+  least :min_time seconds;
+- 'ks_statistic', 'ks_pvalue' -- a Kolmogorov-Smirnov test of :ks_draws draws
+  against the exact distribution (using scipy). For the multivariate samplers
+  we test a one-dimensional statistic with a known distribution: a random
+  projection of the draws, standardised to N(0,1), for the multivariate
+  normal; and Sigma_00 ~ IG((v0-K+1)/2, W0_00/2) and the standardised
+  (mu_0 - mu0_0) * sqrt(beta0 / Sigma_00) ~ N(0,1) for the NIW.
+- 'passed' -- whether the p-value is above :alpha.
+scipy's truncnorm is inaccurate far into the tail (a > ~8), so we compute the
+truncated normal's cdf from the log survival function of the normal instead.
+
+The records are stored as JSON in :fout, and compare_to_baseline() flags the
+cases that fail the KS test, or whose throughput dropped by more than
+:threshold (e.g. 0.2 = 20%) compared to a stored results file. Running this 
+script with the argument --store-baseline stores the records as that baseline
+file instead.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.distributions import rtnorm
+from BMF_Priors.code.models.Gibbs.distributions.gamma import gamma_draw, gamma_vector_draw
+from BMF_Priors.code.models.Gibbs.distributions.half_normal import half_normal_draw
+from BMF_Priors.code.models.Gibbs.distributions.inverse_gaussian import inverse_gaussian_draw
+from BMF_Priors.code.models.Gibbs.distributions.multivariate_normal import multivariate_normal_draw
+from BMF_Priors.code.models.Gibbs.distributions.multivariate_normal import multivariate_normal_vector_draw
+from BMF_Priors.code.models.Gibbs.distributions.normal import normal_draw, normal_vector_draw
+from BMF_Priors.code.models.Gibbs.distributions.normal_inverse_wishart import normal_inverse_wishart_draw
+from BMF_Priors.code.models.Gibbs.distributions.truncated_normal import truncated_normal_draw
+from BMF_Priors.code.models.Gibbs.distributions.truncated_normal_vector import truncated_normal_vector_draw
+
+from scipy.stats import norm, gamma, halfnorm, invgauss, invgamma, kstest
+import json
+import numpy
+import time
+
+BATCH = 1000
+
+
+''' Reference distributions. '''
+def truncated_normal_cdf(mu, tau):
+    ''' Return the cdf of TN(mu, tau^-1) truncated to [0, inf), accurate in the tails. '''
+    sigma = 1. / numpy.sqrt(tau)
+    logsf_zero = norm.logsf(-mu / sigma)
+    return lambda x: -numpy.expm1(norm.logsf((x - mu) / sigma) - logsf_zero)
+
+def random_covariance(K):
+    ''' Return a random well-conditioned K x K covariance matrix. '''
+    A = numpy.random.normal(size=(K,K))
+    return numpy.dot(A, A.T) / K + numpy.eye(K)
+
+
+''' Benchmark cases. '''
+def truncated_normal_cases():
+    ''' The truncated normal samplers in the body, at the boundary, and in the
+        (far) tail of the normal. '''
+    cases = []
+    for regime, mu, tau in [('body', 1., 1.), ('boundary', 0., 1.), ('tail', -5., 1.), ('far tail', -40., 1.)]:
+        sigma, reference = 1. / numpy.sqrt(tau), truncated_normal_cdf(mu, tau)
+        cases += [{
+            'sampler': 'truncated_normal_draw', 'regime': '%s, scalar' % regime, 'draws_per_call': 1,
+            'draw': lambda mu=mu, tau=tau: truncated_normal_draw(mu, tau), 'reference': reference,
+        }, {
+            'sampler': 'truncated_normal_vector_draw', 'regime': '%s, batched' % regime, 'draws_per_call': BATCH,
+            'draw': lambda mu=mu, tau=tau: truncated_normal_vector_draw(mu * numpy.ones(BATCH), tau * numpy.ones(BATCH)),
+            'reference': reference,
+        }, {
+            'sampler': 'rtnorm', 'regime': '%s, scalar' % regime, 'draws_per_call': 1,
+            'draw': lambda mu=mu, sigma=sigma: rtnorm.rtnorm(a=0., b=numpy.inf, mu=mu, sigma=sigma), 'reference': reference,
+        }, {
+            'sampler': 'rtnorm', 'regime': '%s, batched' % regime, 'draws_per_call': BATCH,
+            'draw': lambda mu=mu, sigma=sigma: rtnorm.rtnorm(a=0., b=numpy.inf, mu=mu, sigma=sigma, size=BATCH),
+            'reference': reference,
+        }]
+    return cases
+
+def univariate_cases():
+    ''' The other univariate samplers, scalar and batched where available. '''
+    mu, tau, alpha, beta, sigma = 1., 4., 2., 3., 10.
+    return [{
+        'sampler': 'normal_draw', 'regime': 'scalar', 'draws_per_call': 1,
+        'draw': lambda: normal_draw(mu, tau), 'reference': norm(loc=mu, scale=1./numpy.sqrt(tau)).cdf,
+    }, {
+        'sampler': 'normal_vector_draw', 'regime': 'batched', 'draws_per_call': BATCH,
+        'draw': lambda: normal_vector_draw(mu * numpy.ones(BATCH), tau), 'reference': norm(loc=mu, scale=1./numpy.sqrt(tau)).cdf,
+    }, {
+        'sampler': 'gamma_draw', 'regime': 'scalar', 'draws_per_call': 1,
+        'draw': lambda: gamma_draw(alpha, beta), 'reference': gamma(alpha, scale=1./beta).cdf,
+    }, {
+        'sampler': 'gamma_vector_draw', 'regime': 'batched', 'draws_per_call': BATCH,
+        'draw': lambda: gamma_vector_draw(alpha * numpy.ones(BATCH), beta), 'reference': gamma(alpha, scale=1./beta).cdf,
+    }, {
+        'sampler': 'half_normal_draw', 'regime': 'scalar', 'draws_per_call': 1,
+        'draw': lambda: half_normal_draw(sigma), 'reference': halfnorm(scale=sigma).cdf,
+    }] + [{
+        # IG(mu, tau) is scipy's invgauss(mu / tau, scale=tau)
+        'sampler': 'inverse_gaussian_draw', 'regime': 'scalar, mu=%s, tau=%s' % (mu_ig, tau_ig), 'draws_per_call': 1,
+        'draw': lambda mu_ig=mu_ig, tau_ig=tau_ig: inverse_gaussian_draw(mu_ig, tau_ig),
+        'reference': invgauss(mu_ig / tau_ig, scale=tau_ig).cdf,
+    } for (mu_ig, tau_ig) in [(1., 1.), (numpy.sqrt(400.), 20.)]]
+
+def multivariate_cases(Ks=[5, 50]):
+    ''' The multivariate normal and NIW samplers, for each K in :Ks. '''
+    cases = []
+    for K in Ks:
+        mu, sigma = numpy.random.normal(size=K), random_covariance(K)
+        precision = numpy.linalg.inv(sigma)
+        w = numpy.random.normal(size=K)
+        standardise = lambda x, mu=mu, w=w, sd=numpy.sqrt(numpy.dot(w, numpy.dot(sigma, w))): numpy.dot(x - mu, w) / sd
+        cases += [{
+            'sampler': 'multivariate_normal_draw', 'regime': 'K=%s, sigma' % K, 'draws_per_call': 1,
+            'draw': lambda mu=mu, sigma=sigma: multivariate_normal_draw(mu, sigma=sigma),
+            'statistic': standardise, 'reference': norm.cdf,
+        }, {
+            'sampler': 'multivariate_normal_draw', 'regime': 'K=%s, precision' % K, 'draws_per_call': 1,
+            'draw': lambda mu=mu, precision=precision: multivariate_normal_draw(mu, precision=precision),
+            'statistic': standardise, 'reference': norm.cdf,
+        }, {
+            'sampler': 'multivariate_normal_vector_draw', 'regime': 'K=%s, batched, shared precision' % K, 'draws_per_call': BATCH,
+            'draw': lambda mu=mu, precision=precision: multivariate_normal_vector_draw(numpy.tile(mu, (BATCH,1)), precision=precision),
+            'statistic': standardise, 'reference': norm.cdf,
+        }, {
+            'sampler': 'multivariate_normal_vector_draw', 'regime': 'K=%s, batched, precision per draw' % K, 'draws_per_call': 100,
+            'draw': lambda mu=mu, precisions=numpy.tile(precision, (100,1,1)): multivariate_normal_vector_draw(
+                numpy.tile(mu, (100,1)), precision=precisions),
+            'statistic': standardise, 'reference': norm.cdf,
+        }]
+
+        mu0, beta0, v0, W0 = numpy.zeros(K), 2., K + 2., random_covariance(K)
+        niw_draw = lambda mu0=mu0, beta0=beta0, v0=v0, W0=W0: normal_inverse_wishart_draw(mu0, beta0, v0, W0)
+        cases += [{
+            'sampler': 'normal_inverse_wishart_draw', 'regime': 'K=%s, Sigma_00' % K, 'draws_per_call': 1,
+            'draw': niw_draw, 'statistic': lambda (mu, sigma): sigma[0,0],
+            'reference': invgamma((v0 - K + 1) / 2., scale=W0[0,0] / 2.).cdf,
+        }, {
+            'sampler': 'normal_inverse_wishart_draw', 'regime': 'K=%s, mu_0' % K, 'draws_per_call': 1,
+            'draw': niw_draw, 'statistic': lambda (mu, sigma), mu0=mu0, beta0=beta0: (mu[0] - mu0[0]) * numpy.sqrt(beta0 / sigma[0,0]),
+            'reference': norm.cdf,
+        }]
+    return cases
+
+def all_cases():
+    ''' Return the list of all benchmark cases. '''
+    return truncated_normal_cases() + univariate_cases() + multivariate_cases()
+
+
+''' Running the benchmarks. '''
+def draws_statistic(case, output):
+    ''' Return the draws of one call of the case as a flat array, of the
+        statistic that we test if the case has one. '''
+    if 'statistic' not in case:
+        return numpy.ravel(output)
+    if case['draws_per_call'] == 1:
+        return numpy.array([case['statistic'](output)])
+    return numpy.ravel([case['statistic'](x) for x in output])
+
+def benchmark_case(case, min_time=0.2, ks_draws=2000, alpha=0.001):
+    ''' Time the sampler of the case and run the KS test, and return its record. '''
+    draw, draws_per_call = case['draw'], case['draws_per_call']
+    calls, time_start = 0, time.time()
+    while calls == 0 or time.time() - time_start < min_time:
+        draw()
+        calls += 1
+    draws_per_second = calls * draws_per_call / (time.time() - time_start)
+
+    draws = []
+    while len(draws) * draws_per_call < ks_draws:
+        draws.append(draws_statistic(case, draw()))
+    ks_statistic, ks_pvalue = kstest(numpy.concatenate(draws)[:ks_draws], case['reference'])
+    return {
+        'sampler': case['sampler'], 'regime': case['regime'], 'draws_per_second': draws_per_second,
+        'ks_statistic': ks_statistic, 'ks_pvalue': ks_pvalue, 'passed': bool(ks_pvalue > alpha),
+    }
+
+def run_benchmarks(cases=None, min_time=0.2, ks_draws=2000, alpha=0.001, seed=0, fout=None):
+    ''' Run the benchmark cases (by default all), and return the list of
+        records. Also store them in :fout if given. '''
+    numpy.random.seed(seed)
+    cases = all_cases() if cases is None else cases
+    records = []
+    for case in cases:
+        record = benchmark_case(case, min_time=min_time, ks_draws=ks_draws, alpha=alpha)
+        print "%s (%s): %.0f draws per second. KS p-value: %.3g%s." % (
+            record['sampler'], record['regime'], record['draws_per_second'], record['ks_pvalue'],
+            "" if record['passed'] else " - FAILED")
+        records.append(record)
+    if fout:
+        json.dump(records, open(fout,'w'), indent=1, sort_keys=True)
+    return records
+
+
+''' Comparing to a baseline '''
+def compare_to_baseline(records, fin_baseline, threshold=0.2):
+    ''' Compare the records to those stored in :fin_baseline, and return a
+        list of messages for the cases that fail the KS test, or whose
+        throughput dropped by more than :threshold. '''
+    key = lambda record: (record['sampler'], record['regime'])
+    baseline = { key(record):record for record in json.load(open(fin_baseline,'r')) }
+    regressions = []
+    for record in records:
+        if not record['passed']:
+            regressions.append("%s fails the KS test: p-value %s." % (key(record), record['ks_pvalue']))
+        previous = baseline.get(key(record))
+        if previous is not None and record['draws_per_second'] < (1. - threshold) * previous['draws_per_second']:
+            regressions.append("%s: draws_per_second dropped from %s to %s." % (
+                key(record), previous['draws_per_second'], record['draws_per_second']))
+    return regressions
+
+
+if __name__ == '__main__':
+    ''' Run the benchmarks, and store them as the baseline (with the argument
+        --store-baseline), or compare them to the baseline if it exists. '''
+    fout, fin_baseline = './distributions_benchmark.json', './distributions_benchmark_baseline.json'
+    store_baseline = '--store-baseline' in sys.argv[1:]
+    records = run_benchmarks(fout=fin_baseline if store_baseline else fout)
+    if store_baseline:
+        print "Stored the baseline in %s." % fin_baseline
+    elif os.path.exists(fin_baseline):
+        regressions = compare_to_baseline(records, fin_baseline, threshold=0.2)
+        print "%s regressions compared to the baseline." % len(regressions)
+        for message in regressions:
+            print "REGRESSION: %s" % message
+    else:
+        print "No baseline in %s to compare to, run with --store-baseline to store one." % fin_baseline
@@ -0,0 +1,192 @@
+'''
+Benchmark suite measuring how the runtime and memory of each model scale with
+the number of rows I, columns J, factors K, and the fraction of observed
+entries.
+
+For each model and each setting (I, J, K, fraction) in the grid, we generate a
+synthetic dataset from the model's own generative process (see
+data/synthetic/generate_data.py), observing a random :fraction of the entries
+(at least one per row and column). The baselines get the data of the Gaussian +
+Gaussian model, and the non-probabilistic MF needs positive data, so it gets
+the absolute values of that data. We then run :warm_iterations
+iterations, and time another :iterations. The time per update step comes from
+a separate run of :iterations with profiling enabled (see
+code/models/Gibbs/profiling.py), so that the overhead of profiling does not
+count towards time_per_iteration or the memory.
+
+Each setting runs in a new process, so that the peak memory (the maximum
+resident set size of that process) is its own. For each we record:
+    {'model', 'I', 'J', 'K', 'fraction', 'time_per_iteration',
+     'peak_memory_mb', 'peak_memory_run_mb', 'steps', 'structures_mb'}
+where steps maps the update steps to their time per iteration, peak_memory_run_mb
+is the peak RSS while initialising and running the model, and structures_mb
+maps the stages 'initialise' and 'run' to the footprint in MB of each structure
+of the model (R, M, cache, all_U, Z, etc) after that stage (see
+code/models/Gibbs/memory.py). If a model fails on a setting, we record 'error'
+instead of the measurements.
+
+The results are stored as JSON in :fout, and compare_to_baseline() flags the
+settings that are more than :threshold (e.g. 0.2 = 20%) slower, or use more
+memory, than in a stored results file. Running this script with the argument
+--store-baseline stores the results as that baseline file instead.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.baseline_average_column import ColumnAverage
+from BMF_Priors.code.models.baseline_average_row import RowAverage
+from BMF_Priors.code.models.baseline_mf_nonprobabilistic import MF_Nonprobabilistic
+from BMF_Priors.code.models.bmf_gaussian_exponential import BMF_Gaussian_Exponential
+from BMF_Priors.code.models.bmf_gaussian_exponential_ard import BMF_Gaussian_Exponential_ARD
+from BMF_Priors.code.models.bmf_gaussian_gaussian import BMF_Gaussian_Gaussian
+from BMF_Priors.code.models.bmf_gaussian_gaussian_ard import BMF_Gaussian_Gaussian_ARD
+from BMF_Priors.code.models.bmf_gaussian_gaussian_exponential import BMF_Gaussian_Gaussian_Exponential
+from BMF_Priors.code.models.bmf_gaussian_gaussian_univariate import BMF_Gaussian_Gaussian_univariate
+from BMF_Priors.code.models.bmf_gaussian_gaussian_volumeprior import BMF_Gaussian_Gaussian_VolumePrior
+from BMF_Priors.code.models.bmf_gaussian_gaussian_volumeprior_nonnegative import BMF_Gaussian_Gaussian_VolumePrior_nonnegative
+from BMF_Priors.code.models.bmf_gaussian_gaussian_wishart import BMF_Gaussian_Gaussian_Wishart
+from BMF_Priors.code.models.bmf_gaussian_halfnormal import BMF_Gaussian_HalfNormal
+from BMF_Priors.code.models.bmf_gaussian_l21 import BMF_Gaussian_L21
+from BMF_Priors.code.models.bmf_gaussian_laplace import BMF_Gaussian_Laplace
+from BMF_Priors.code.models.bmf_gaussian_laplace_inversegaussian import BMF_Gaussian_Laplace_IG
+from BMF_Priors.code.models.bmf_gaussian_truncatednormal import BMF_Gaussian_TruncatedNormal
+from BMF_Priors.code.models.bmf_gaussian_truncatednormal_hierarchical import BMF_Gaussian_TruncatedNormal_Hierarchical
+from BMF_Priors.code.models.bmf_poisson_gamma import BMF_Poisson_Gamma
+from BMF_Priors.code.models.bmf_poisson_gamma_dirichlet import BMF_Poisson_Gamma_Dirichlet
+from BMF_Priors.code.models.bmf_poisson_gamma_gamma import BMF_Poisson_Gamma_Gamma
+from BMF_Priors.data.synthetic.generate_data import generate_dataset, to_dense
+
+from multiprocessing import Pool
+import itertools
+import json
+import numpy
+import resource
+import time
+
+BASELINES = [RowAverage, ColumnAverage, MF_Nonprobabilistic]
+GAUSSIAN_MODELS = [
+    BMF_Gaussian_Gaussian, BMF_Gaussian_Gaussian_univariate, BMF_Gaussian_Gaussian_Wishart,
+    BMF_Gaussian_Gaussian_ARD, BMF_Gaussian_Laplace, BMF_Gaussian_Laplace_IG, BMF_Gaussian_L21,
+    BMF_Gaussian_Gaussian_VolumePrior, BMF_Gaussian_Gaussian_VolumePrior_nonnegative,
+    BMF_Gaussian_Exponential, BMF_Gaussian_Exponential_ARD, BMF_Gaussian_Gaussian_Exponential,
+    BMF_Gaussian_TruncatedNormal, BMF_Gaussian_TruncatedNormal_Hierarchical, BMF_Gaussian_HalfNormal,
+]
+POISSON_MODELS = [BMF_Poisson_Gamma, BMF_Poisson_Gamma_Gamma, BMF_Poisson_Gamma_Dirichlet]
+ALL_MODELS = BASELINES + GAUSSIAN_MODELS + POISSON_MODELS
+
+DEFAULT_GRID = {
+    'I': [100, 500],
+    'J': [80, 400],
+    'K': [5, 20],
+    'fraction': [0.1, 0.5],
+}
+
+
+''' Generating the data '''
+def generate_data(model_class, I, J, K, fraction):
+    ''' Return the dense (R, M), drawn from the generative process of the
+        model (for the baselines, of the Gaussian + Gaussian model). '''
+    generative_class = BMF_Gaussian_Gaussian if model_class in BASELINES else model_class
+    R, M = to_dense(*generate_dataset(generative_class, I, J, K, fraction))
+    if model_class == MF_Nonprobabilistic:
+        R = numpy.abs(R)
+    return (R, M)
+
+
+''' Running the benchmarks '''
+def benchmark_setting((model_class, I, J, K, fraction, iterations, warm_iterations)):
+    ''' Run the model on a generated dataset, and return its record. This
+        should be run in a new process, for the peak memory to be its own. '''
+    record = { 'model':model_class.__name__, 'I':I, 'J':J, 'K':K, 'fraction':fraction }
+    try:
+        R, M = generate_data(model_class, I, J, K, fraction)
+        model = model_class(R, M, K, {})
+        model.enable_memory_accounting()
+        model.initialise('random')
+        model.record_memory('initialise')
+        model.run(warm_iterations)
+        time_start = time.time()
+        model.run(iterations)
+        # The non-probabilistic MF can stop early, once it has converged
+        iterations_run = len(model.all_times)
+        record['time_per_iteration'] = (time.time() - time_start) / float(iterations_run)
+        model.record_memory('run')
+        memory = model.disable_memory_accounting()
+        record['peak_memory_run_mb'] = memory['peak_rss_mb']
+        record['structures_mb'] = { stage['stage']:stage['structures_mb'] for stage in memory['stages'] }
+        
+        # Time the update steps in a separate, profiled, run
+        model.enable_profiling()
+        model.run(iterations)
+        iterations_profiled = len(model.all_times)
+        record['steps'] = {
+            step:totals['time'] / float(iterations_profiled) for step,totals in model.profiler.summary().iteritems() }
+        model.disable_profiling()
+    except Exception as e:
+        record['error'] = "%s" % e
+    record['peak_memory_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    return record
+
+def run_benchmarks(model_classes=ALL_MODELS, grid=DEFAULT_GRID, iterations=10, warm_iterations=2, fout=None):
+    ''' Run the benchmark for each model and setting in the :grid (a
+        dictionary from 'I', 'J', 'K', 'fraction' to lists of values), and
+        return the list of records. Also store them in :fout if given. '''
+    settings = [
+        (model_class, I, J, K, fraction, iterations, warm_iterations)
+        for model_class in model_classes
+        for (I, J, K, fraction) in itertools.product(grid['I'], grid['J'], grid['K'], grid['fraction'])
+    ]
+    # Use a new process for each setting, one at a time so that they do not compete
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        records = pool.map(benchmark_setting, settings, chunksize=1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if fout:
+        json.dump(records, open(fout,'w'), indent=1, sort_keys=True)
+    return records
+
+
+''' Comparing to a baseline '''
+def compare_to_baseline(records, fin_baseline, threshold=0.2):
+    ''' Compare the records to those stored in :fin_baseline, and return a
+        list of messages for the settings whose time per iteration or peak
+        memory increased by more than :threshold, or that now fail. '''
+    key = lambda record: (record['model'], record['I'], record['J'], record['K'], record['fraction'])
+    baseline = { key(record):record for record in json.load(open(fin_baseline,'r')) }
+    regressions = []
+    for record in records:
+        previous = baseline.get(key(record))
+        if previous is None or 'error' in previous:
+            continue
+        if 'error' in record:
+            regressions.append("%s now fails: %s." % (key(record), record['error']))
+            continue
+        for measure in ['time_per_iteration', 'peak_memory_mb']:
+            if record[measure] > (1. + threshold) * previous[measure]:
+                regressions.append("%s: %s increased from %s to %s." % (
+                    key(record), measure, previous[measure], record[measure]))
+    return regressions
+
+
+if __name__ == '__main__':
+    ''' Run the benchmarks, and store them as the baseline (with the argument
+        --store-baseline), or compare them to the baseline if it exists. '''
+    fout, fin_baseline = './scaling_benchmark.json', './scaling_benchmark_baseline.json'
+    store_baseline = '--store-baseline' in sys.argv[1:]
+    records = run_benchmarks(fout=fin_baseline if store_baseline else fout)
+    if store_baseline:
+        print "Stored the baseline in %s." % fin_baseline
+    elif os.path.exists(fin_baseline):
+        regressions = compare_to_baseline(records, fin_baseline, threshold=0.2)
+        print "%s regressions compared to the baseline." % len(regressions)
+        for message in regressions:
+            print "REGRESSION: %s" % message
+    else:
+        print "No baseline in %s to compare to, run with --store-baseline to store one." % fin_baseline
@@ -8,13 +8,16 @@ sys.path.append(project_location)
 
 from BMF_Priors.code.cross_validation.mask import try_generate_M_rows
 from BMF_Priors.code.cross_validation.mask import try_generate_M_columns
+from BMF_Priors.experiments.experiment_runner import performance_task
+from BMF_Priors.experiments.experiment_runner import performances_per_setting
+from BMF_Priors.experiments.experiment_runner import run_experiment_tasks
 
 import numpy
 
 ATTEMPTS_GENERATE_FOLDS = 100
 METRICS = ['MSE', 'R^2', 'Rp']
 
-def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class, settings, fout=None):
+def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class, settings, fout=None, cache=None, P=1, seed=None):
     ''' Run the sparsity experiment.
         For each fraction in :fractions_unknown, run the sparsity test :n_repeats
         times. We split the data randomly into :fractions_unknown missing values
@@ -35,11 +38,12 @@ def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class
         - model_class -- the BMF class we should use.
         - settings -- dictionary {'R', 'M', 'K', 'hyperparameters', 'init', 'iterations', 'burn_in', 'thinning'}.
         - fout -- string giving location of output file.
+        - cache -- optionally a ResultCache, to skip the runs that were done before.
+        - P -- number of processes to run the repeats on (see experiment_runner.py).
+        - seed -- optionally a seed, to make the runs reproducible.
     '''
     # Extract the settings
     R, M, K, hyperparameters = settings['R'], settings['M'], settings['K'], settings['hyperparameters']
-    init, iterations = settings['init'], settings['iterations']
-    burn_in, thinning = settings['burn_in'], settings['thinning']
         
     # Generate the folds
     generate_M = try_generate_M_rows if stratify_rows else try_generate_M_columns
@@ -51,22 +55,17 @@ def sparsity_experiment(n_repeats, fractions_unknown, stratify_rows, model_class
         ]
         for fraction in fractions_unknown
     ]
-    all_performances = { metric:[] for metric in METRICS }
-    for fraction, Ms_train_and_test in zip(fractions_unknown, all_Ms_training_and_test):
-        # For each fraction, run the model on each fold and measure performances
-        print "Sparsity experiment. Fraction=%s." % (fraction)
-        performances = { metric:[] for metric in METRICS }
     
-        for i, (M_train, M_test) in enumerate(Ms_train_and_test):
-            print "Repeat %s for fraction=%s." % (i+1, fraction)
-            BMF = model_class(R, M_train, K, hyperparameters) 
-            BMF.initialise(init)
-            BMF.run(iterations)
-            performance = BMF.predict(M_pred=M_test, burn_in=burn_in, thinning=thinning)
-            for metric in METRICS:
-                performances[metric].append(performance[metric])
-        for metric in METRICS:
-            all_performances[metric].append(performances[metric])
+    # For each fraction, run the model on each fold and measure performances
+    tasks = [
+        performance_task(
+            "Sparsity experiment. Repeat %s for fraction=%s." % (i+1, fraction), 
+            model_class, R, M_train, M_test, K, hyperparameters, settings, cache)
+        for fraction, Ms_train_and_test in zip(fractions_unknown, all_Ms_training_and_test)
+        for i, (M_train, M_test) in enumerate(Ms_train_and_test)
+    ]
+    all_performances = performances_per_setting(
+        run_experiment_tasks(tasks, P=P, seed=seed), len(fractions_unknown), METRICS)
     average_performances = { 
         metric : [numpy.mean(performances) for performances in all_performances[metric] ] 
         for metric in METRICS }
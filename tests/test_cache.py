@@ -0,0 +1,86 @@
+'''
+Tests that the updates give the same draws with the cache of the data
+invariants (code/models/Gibbs/cache.py) as without it.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.cache import compute_cache
+from BMF_Priors.code.models.Gibbs import updates
+
+import numpy
+import pytest
+
+I, J, K = 12, 9, 3
+
+
+def generate_data(zero_unobserved):
+    ''' Return (R, M, U, V), with R nonzero at the unobserved entries unless :zero_unobserved. '''
+    numpy.random.seed(0)
+    M = (numpy.random.rand(I,J) < 0.6).astype(float)
+    M[:,0], M[0,:] = 1., 1.
+    R = numpy.random.poisson(3., size=(I,J)).astype(float)
+    if zero_unobserved:
+        R *= M
+    U, V = numpy.random.rand(I,K), numpy.random.rand(J,K)
+    return (R, M, U, V)
+
+def draw_twice(update, cache, **kwargs):
+    ''' Return the draws of :update with and without the cache, from the same seed. '''
+    numpy.random.seed(1)
+    with_cache = update(cache=cache, **{name:numpy.copy(value) for name,value in kwargs.iteritems()})
+    numpy.random.seed(1)
+    without_cache = update(**{name:numpy.copy(value) for name,value in kwargs.iteritems()})
+    return (with_cache, without_cache)
+
+
+@pytest.mark.parametrize('zero_unobserved', [True, False])
+def test_cache_contents(zero_unobserved):
+    ''' The cache should describe R and M, without copying the rows of R. '''
+    R, M, _, _ = generate_data(zero_unobserved)
+    cache = compute_cache(R, M)
+    for (name, R_orientation, M_orientation) in [('rows', R, M), ('columns', R.T, M.T)]:
+        cache_orientation = cache[name]
+        assert numpy.array_equal(cache_orientation['R'], R_orientation)
+        assert numpy.array_equal(cache_orientation['M'], M_orientation)
+        assert numpy.array_equal(cache_orientation['MR'], M_orientation * R_orientation)
+        for i in range(R_orientation.shape[0]):
+            observed = numpy.flatnonzero(M_orientation[i])
+            assert numpy.array_equal(cache_orientation['observed'][i], observed)
+            assert numpy.array_equal(cache_orientation['R_observed'][i], R_orientation[i,observed])
+    assert cache['rows']['R'] is R and (cache['rows']['MR'] is R) == zero_unobserved
+    assert numpy.array_equal(numpy.array(numpy.nonzero(M)), [cache['Omega_rows'], cache['Omega_columns']])
+    assert cache['size_Omega'] == M.sum()
+
+@pytest.mark.parametrize('zero_unobserved', [True, False])
+def test_updates_gaussian(zero_unobserved):
+    ''' The Gaussian updates of U, V, and tau should not depend on the cache. '''
+    R, M, U, V = generate_data(zero_unobserved)
+    cache = compute_cache(R, M)
+    draws = [
+        draw_twice(updates.update_U_gaussian_gaussian_multivariate, cache['rows'], lamb=0.1, R=R, M=M, V=V, tau=2.),
+        draw_twice(updates.update_V_gaussian_gaussian_multivariate, cache['columns'], lamb=0.1, R=R, M=M, U=U, tau=2.),
+        draw_twice(updates.update_U_gaussian_gaussian_univariate, cache['rows'], lamb=0.1, R=R, M=M, U=U, V=V, tau=2.),
+        draw_twice(updates.update_V_gaussian_gaussian_univariate, cache['columns'], lamb=0.1, R=R, M=M, U=U, V=V, tau=2.),
+        draw_twice(updates.update_U_gaussian_exponential, cache['rows'], lamb=0.1, R=R, M=M, U=U, V=V, tau=2.),
+        draw_twice(updates.update_V_gaussian_truncatednormal, cache['columns'], muV=0., tauV=1., R=R, M=M, U=U, V=V, tau=2.),
+        draw_twice(updates.update_tau_gaussian, cache, alpha=1., beta=1., R=R, M=M, U=U, V=V),
+    ]
+    for with_cache, without_cache in draws:
+        assert numpy.allclose(with_cache, without_cache)
+
+def test_updates_poisson():
+    ''' The Poisson updates of Z, U and V should not depend on the cache. '''
+    R, M, U, V = generate_data(zero_unobserved=True)
+    cache = compute_cache(R, M)
+    Z = numpy.zeros((I,J,K))
+    Z_cache, Z_no_cache = draw_twice(updates.update_Z_poisson, cache, R=R, M=M, Z=Z, U=U, V=V)
+    assert numpy.array_equal(Z_cache, Z_no_cache)
+    assert numpy.array_equal(Z_cache.sum(axis=2), R)
+    for with_cache, without_cache in [
+        draw_twice(updates.update_U_poisson_gamma, cache['rows'], a=1., b=1., M=M, V=V, Z=Z_cache),
+        draw_twice(updates.update_V_poisson_gamma, cache['columns'], a=1., b=1., M=M, U=U, Z=Z_cache),
+    ]:
+        assert numpy.allclose(with_cache, without_cache)
@@ -0,0 +1,63 @@
+'''
+Tests for the binary dataset cache of data/dataset_cache.py.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.data.dataset_cache import load_cached
+
+import numpy
+import pytest
+
+
+def make_dataset(fraction):
+    ''' Return a dense (R, M) with roughly :fraction of the entries observed. '''
+    numpy.random.seed(0)
+    M = (numpy.random.rand(20,15) < fraction).astype(float)
+    return (M * numpy.random.rand(20,15), M)
+
+def load(tmpdir, source, dataset, constructed, dense=True):
+    ''' Load :dataset through the cache in :tmpdir, appending to :constructed
+        each time it is constructed. '''
+    def construct():
+        constructed.append(True)
+        return tuple(numpy.copy(matrix) for matrix in dataset)
+    return load_cached(name='test', sources=[str(source)], construct=construct, dense=dense, folder=str(tmpdir.join('cache')))
+
+
+@pytest.mark.parametrize('fraction', [0.1, 0.8])
+def test_load_cached(tmpdir, fraction):
+    ''' We should construct the dataset once, and return it in both forms from
+        the stored files, for sparse and dense storage. '''
+    source, constructed = tmpdir.join('source.txt'), []
+    source.write('data')
+    R, M = dataset = make_dataset(fraction)
+    for dense in [True, False, True]:
+        R_loaded, M_loaded = load(tmpdir, source, dataset, constructed, dense=dense)
+        assert numpy.array_equal(R_loaded if dense else R_loaded.toarray(), R)
+        assert numpy.array_equal(M_loaded if dense else M_loaded.toarray(), M)
+    assert len(constructed) == 1
+
+def test_load_cached_copy_on_write(tmpdir):
+    ''' Dense datasets should be memory-mapped, and writing to them should not
+        change the stored files. '''
+    source, constructed = tmpdir.join('source.txt'), []
+    source.write('data')
+    R, M = dataset = make_dataset(0.8)
+    R_loaded, M_loaded = load(tmpdir, source, dataset, constructed)
+    assert isinstance(R_loaded, numpy.memmap) and isinstance(M_loaded, numpy.memmap)
+    R_loaded[:] = -1.
+    assert numpy.array_equal(load(tmpdir, source, dataset, constructed)[0], R)
+
+def test_load_cached_source_changed(tmpdir):
+    ''' If a source file changes, we should construct the dataset again. '''
+    source, constructed = tmpdir.join('source.txt'), []
+    source.write('data')
+    dataset = make_dataset(0.8)
+    load(tmpdir, source, dataset, constructed)
+    source.write('changed data')
+    load(tmpdir, source, dataset, constructed)
+    load(tmpdir, source, dataset, constructed)
+    assert len(constructed) == 2
@@ -0,0 +1,73 @@
+'''
+Moment checks for the multivariate normal and Normal-Inverse Wishart draws of
+code/models/Gibbs/distributions/. We compare the sample mean and covariance of
+N draws to the true ones, allowing for a few standard errors.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.models.Gibbs.distributions.multivariate_normal import multivariate_normal_draw
+from BMF_Priors.code.models.Gibbs.distributions.multivariate_normal import multivariate_normal_information_draw
+from BMF_Priors.code.models.Gibbs.distributions.multivariate_normal import multivariate_normal_vector_draw
+from BMF_Priors.code.models.Gibbs.distributions.normal_inverse_wishart import normal_inverse_wishart_draw
+from BMF_Priors.code.models.Gibbs.distributions.normal_inverse_wishart import normal_inverse_wishart_mean
+
+import numpy
+
+N = 20000
+K = 3
+mu = numpy.array([1., -2., 0.5])
+sigma = numpy.array([[2., 0.5, 0.3], [0.5, 1., -0.2], [0.3, -0.2, 0.5]])
+precision = numpy.linalg.inv(sigma)
+
+
+def check_moments(draws, mu, sigma):
+    ''' Assert that the sample mean and covariance of the N x K :draws match
+        :mu and :sigma, within 5 standard errors. '''
+    std = numpy.sqrt(numpy.diag(sigma))
+    assert (numpy.abs(draws.mean(axis=0) - mu) < 5 * std / numpy.sqrt(len(draws))).all()
+    # The standard error of the sample covariance sigma_kl is sqrt((sigma_kk sigma_ll + sigma_kl^2) / N)
+    tolerance = 5 * numpy.sqrt((numpy.outer(std**2, std**2) + sigma**2) / len(draws))
+    assert (numpy.abs(numpy.cov(draws.T) - sigma) < tolerance).all()
+
+
+def test_multivariate_normal_draw():
+    ''' Draws with sigma or the precision should have mean mu and covariance sigma. '''
+    numpy.random.seed(0)
+    check_moments(numpy.array([multivariate_normal_draw(mu, sigma=sigma) for n in range(N)]), mu, sigma)
+    check_moments(numpy.array([multivariate_normal_draw(mu, precision=precision) for n in range(N)]), mu, sigma)
+
+def test_multivariate_normal_information_draw():
+    ''' Draws with h = precision mu should have mean mu and covariance sigma. '''
+    numpy.random.seed(0)
+    h = numpy.dot(precision, mu)
+    check_moments(numpy.array([multivariate_normal_information_draw(h, precision) for n in range(N)]), mu, sigma)
+
+def test_multivariate_normal_vector_draw():
+    ''' Vector draws with a shared or per-draw sigma or precision should have
+        covariance sigma around their own means. '''
+    numpy.random.seed(0)
+    mus = numpy.random.normal(size=(N,K))
+    sigmas, precisions = numpy.tile(sigma, (N,1,1)), numpy.tile(precision, (N,1,1))
+    for arguments in [{'sigma':sigma}, {'precision':precision}, {'sigma':sigmas}, {'precision':precisions}]:
+        draws = multivariate_normal_vector_draw(mus, **arguments)
+        check_moments(draws - mus, numpy.zeros(K), sigma)
+
+def test_normal_inverse_wishart_draw():
+    ''' Sigma should have mean W0 / (v0 - K - 1), and mu mean mu0 and covariance
+        E[Sigma] / beta0. '''
+    numpy.random.seed(0)
+    mu0, beta0, v0, W0 = mu, 2., K + 20, sigma * 10.
+    draws = [normal_inverse_wishart_draw(mu0=mu0, beta0=beta0, v0=v0, W0=W0) for n in range(N)]
+    mus, sigmas = numpy.array([mu_n for mu_n,_ in draws]), numpy.array([sigma_n for _,sigma_n in draws])
+    _, sigma_mean = normal_inverse_wishart_mean(mu0=mu0, beta0=beta0, v0=v0, W0=W0)
+    assert numpy.allclose(sigma_mean, W0 / (v0 - K - 1))
+
+    # Var(Sigma_kl) = ((v-K+1) W_kl^2 + (v-K-1) W_kk W_ll) / ((v-K)(v-K-1)^2(v-K-3))
+    variance = ((v0-K+1) * W0**2 + (v0-K-1) * numpy.outer(numpy.diag(W0), numpy.diag(W0))) / \
+        ((v0-K) * (v0-K-1)**2 * (v0-K-3))
+    assert (numpy.abs(sigmas.mean(axis=0) - sigma_mean) < 5 * numpy.sqrt(variance / N)).all()
+    assert all(numpy.allclose(sigma_n, sigma_n.T) and (numpy.linalg.eigvalsh(sigma_n) > 0).all() for sigma_n in sigmas[:100])
+    check_moments(mus, mu0, sigma_mean / beta0)
@@ -0,0 +1,47 @@
+'''
+Tests for the synthetic datasets of data/synthetic/generate_data.py.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.data.synthetic.generate_data import generate_dataset, collect_entries, to_dense
+
+import numpy
+
+
+def test_observed_fraction_random():
+    ''' With random missingness, the observed fraction should be close to :fraction. '''
+    numpy.random.seed(0)
+    I, J, fraction = 2000, 500, 0.1
+    R, M = generate_dataset('BMF_Gaussian_Gaussian', I, J, 5, fraction, missingness='random')
+    observed = R.nnz / float(I*J)
+    assert abs(observed - fraction) < 0.02 * fraction, "Observed fraction %s, expected %s." % (observed, fraction)
+
+def test_observed_fraction_power_law():
+    ''' With power law missingness, the observed fraction should be slightly
+        lower than :fraction (because of the cap on the probabilities). '''
+    numpy.random.seed(0)
+    I, J, fraction = 2000, 500, 0.1
+    R, M = generate_dataset('BMF_Poisson_Gamma', I, J, 5, fraction, missingness='power_law')
+    observed = R.nnz / float(I*J)
+    assert 0.85 * fraction < observed < 1.02 * fraction, "Observed fraction %s, expected %s." % (observed, fraction)
+
+def test_all_rows_columns_observed():
+    ''' Each row and column should have an entry, even for a tiny fraction. '''
+    numpy.random.seed(0)
+    R, M = generate_dataset('BMF_Gaussian_Gaussian', 300, 200, 5, 0.001)
+    R_dense, M_dense = to_dense(R, M)
+    assert (M_dense.sum(axis=0) > 0).all() and (M_dense.sum(axis=1) > 0).all()
+    assert R.nnz == M_dense.sum()
+    assert numpy.array_equal(numpy.nonzero(M_dense), M.nonzero())
+
+def test_collect_entries():
+    ''' Collecting the blocks should give their concatenation, also if the
+        arrays need to grow. '''
+    blocks = [(numpy.arange(n), numpy.arange(n)+1, numpy.arange(n)*0.5) for n in [3, 0, 10, 2]]
+    expected = [numpy.concatenate(arrays) for arrays in zip(*blocks)]
+    for capacity in [1, 15, 100]:
+        for array, expected_array in zip(collect_entries(iter(blocks), capacity), expected):
+            assert numpy.array_equal(array, expected_array)
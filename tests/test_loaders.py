@@ -0,0 +1,76 @@
+'''
+Tests that the dataset loaders of data/ give the same (R, M) as the original
+line-by-line parsing, both when constructing the datasets and when loading
+them from the dataset cache.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+import BMF_Priors.data.dataset_cache as dataset_cache
+import BMF_Priors.data.movielens.load_data as movielens
+import BMF_Priors.data.drug_sensitivity.load_data as drug_sensitivity
+
+import numpy
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(tmpdir, monkeypatch):
+    ''' Store the datasets in a temporary cache folder. '''
+    monkeypatch.setattr(dataset_cache, 'folder_cache', str(tmpdir))
+
+
+def check_equal(dataset, expected):
+    ''' Assert that the dense (R, M) of :dataset are exactly :expected. '''
+    for matrix, expected_matrix in zip(dataset, expected):
+        matrix = matrix.toarray() if hasattr(matrix, 'toarray') else numpy.asarray(matrix)
+        assert matrix.shape == expected_matrix.shape
+        assert numpy.array_equal(matrix, expected_matrix)
+
+def movielens_reference(fin, delim):
+    ''' Return (R, M) of the ratings file, constructed line by line. '''
+    lines = [line.rstrip('\n').split(delim) for line in open(fin, 'r').readlines()]
+    user_ids, movie_ids, ratings = [numpy.array(values, dtype=int) for values in zip(*lines)[:3]]
+    user_indices = { user_id: i for i, user_id in enumerate(sorted(set(user_ids))) }
+    movie_indices = { movie_id: j for j, movie_id in enumerate(sorted(set(movie_ids))) }
+    R, M = numpy.zeros((len(user_indices), len(movie_indices))), numpy.zeros((len(user_indices), len(movie_indices)))
+    for user_id, movie_id, rating in zip(user_ids, movie_ids, ratings):
+        i, j = user_indices[user_id], movie_indices[movie_id]
+        R[i,j], M[i,j] = rating, 1.
+    R, M = movielens.filter_rows(R, M, movielens.MIN_NO_ENTRIES)
+    R, M = movielens.filter_columns(R, M, movielens.MIN_NO_ENTRIES)
+    return movielens.filter_rows(R, M, movielens.MIN_NO_ENTRIES)
+
+def drug_sensitivity_reference(location, min_no_entries=None):
+    ''' Return (R, M) of the drug sensitivity file, parsed with numpy.loadtxt. '''
+    R = numpy.loadtxt(location, dtype=float, delimiter=drug_sensitivity.DELIM)
+    M = (~numpy.isnan(R)).astype(float)
+    R[numpy.isnan(R)] = 0.
+    if min_no_entries is not None:
+        keep = [i for i in range(R.shape[0]) if M[i].sum() >= min_no_entries]
+        R, M = R[keep,:], M[keep,:]
+    return (R, M)
+
+
+def test_movielens_100K():
+    ''' MovieLens 100K should match the original construction, dense or sparse,
+        and again when loaded from the cache. '''
+    R, M = expected = movielens_reference(movielens.fin_100K, movielens.DELIM_100K)
+    assert R.shape == (943, 1473) and M.sum() == 99723
+    check_equal(movielens.load_movielens_100K(dense=True), expected)
+    check_equal(movielens.load_movielens_100K(dense=False), expected)
+    check_equal(movielens.load_movielens_100K(dense=True), expected)
+
+@pytest.mark.parametrize('load, location, min_no_entries', [
+    (drug_sensitivity.load_gdsc_ic50, drug_sensitivity.file_gdsc_ic50, drug_sensitivity.MIN),
+    (drug_sensitivity.load_ccle_ic50, drug_sensitivity.file_ccle_ic50, None),
+    (drug_sensitivity.load_ccle_ec50, drug_sensitivity.file_ccle_ec50, drug_sensitivity.MIN),
+])
+def test_drug_sensitivity(load, location, min_no_entries):
+    ''' The drug sensitivity datasets should match numpy.loadtxt, also when
+        loaded from the cache. '''
+    expected = drug_sensitivity_reference(location, min_no_entries)
+    check_equal(load(), expected)
+    check_equal(load(), expected)
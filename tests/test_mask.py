@@ -0,0 +1,110 @@
+'''
+Tests for the IndexMask and the fold methods of code/cross_validation/mask.py.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.mask import IndexMask
+from BMF_Priors.code.cross_validation.mask import compute_folds_constructive
+from BMF_Priors.code.cross_validation.mask import compute_folds_stratify_rows_constructive
+from BMF_Priors.code.cross_validation.mask import compute_folds_stratify_columns_constructive
+from BMF_Priors.code.cross_validation.mask import folds_from_masks, masks_from_folds
+from BMF_Priors.code.cross_validation.mask import generate_M_rows, generate_M_columns
+
+import numpy
+import pytest
+
+FOLD_METHODS = [
+    compute_folds_constructive,
+    compute_folds_stratify_rows_constructive,
+    compute_folds_stratify_columns_constructive,
+]
+
+
+def random_mask(I, J, fraction, seed=0):
+    ''' Return a dense mask with roughly :fraction of the entries observed. '''
+    numpy.random.seed(seed)
+    return (numpy.random.rand(I,J) < fraction).astype(float)
+
+
+def test_index_mask_dense():
+    ''' An IndexMask should behave like its dense mask, whatever the order of its indices. '''
+    M = random_mask(15, 10, 0.4)
+    indices_row, indices_column = numpy.nonzero(M)
+    permutation = numpy.random.permutation(len(indices_row))
+    M_index = IndexMask(M.shape, indices_row[permutation], indices_column[permutation])
+    assert numpy.array_equal(M_index.toarray(), M)
+    assert numpy.array_equal(numpy.array(M_index), M)
+    assert numpy.array_equal(numpy.array(M_index.nonzero()), numpy.array(numpy.nonzero(M)))
+    assert numpy.array_equal(numpy.array(numpy.nonzero(M_index)), numpy.array(numpy.nonzero(M)))
+    assert M_index.sum() == M.sum()
+    assert numpy.array_equal(M_index.sum(axis=0), M.sum(axis=0))
+    assert numpy.array_equal(M_index.sum(axis=1), M.sum(axis=1))
+    assert numpy.array_equal(M_index.T.toarray(), M.T)
+    assert numpy.array_equal(numpy.array(M_index.T.nonzero()), numpy.array(numpy.nonzero(M.T)))
+
+def test_index_mask_sorted():
+    ''' With is_sorted, the IndexMask should keep the given arrays. '''
+    M = random_mask(6, 5, 0.5)
+    indices_row, indices_column = numpy.nonzero(M)
+    M_index = IndexMask(M.shape, indices_row, indices_column, is_sorted=True)
+    assert M_index.indices_row is indices_row and M_index.indices_column is indices_column
+    assert numpy.array_equal(M_index.toarray(), M)
+
+def test_folds_from_masks():
+    ''' folds_from_masks() should invert masks_from_folds(). '''
+    M = random_mask(20, 12, 0.5)
+    indices_row, indices_column = numpy.nonzero(M)
+    folds = numpy.random.randint(-1, 4, size=len(indices_row))
+    folds[:4] = numpy.arange(4)
+    _, Ms_test = masks_from_folds(M, indices_row, indices_column, folds)
+    assert numpy.array_equal(folds_from_masks(M, Ms_test), folds)
+
+@pytest.mark.parametrize('fold_method', FOLD_METHODS)
+@pytest.mark.parametrize('fraction', [0.05, 0.3, 1.])
+def test_fold_coverage(fold_method, fraction):
+    ''' The test folds should be disjoint, together cover all entries except
+        at most one per row and column, and have roughly the same size. Each
+        training fold should be the rest of M, with every row and column observed. '''
+    I, J, no_folds = 40, 30, 5
+    M = random_mask(I, J, fraction, seed=1)
+    M[numpy.arange(I), numpy.arange(I) % J] = 1.
+    M[numpy.arange(J) % I, numpy.arange(J)] = 1.
+    numpy.random.seed(2)
+    Ms_train, Ms_test = fold_method(I=I, J=J, no_folds=no_folds, M=M)
+    assert len(Ms_train) == no_folds and len(Ms_test) == no_folds
+
+    M_tests = [M_test.toarray() for M_test in Ms_test]
+    M_tests_sum = sum(M_tests)
+    assert M_tests_sum.max() <= 1. and (M_tests_sum <= M).all()
+    assert M.sum() - M_tests_sum.sum() <= I + J
+    sizes = [M_test.sum() for M_test in M_tests]
+    assert min(sizes) > 0 and max(sizes) - min(sizes) <= 0.25 * max(sizes) + I + J
+    for M_train, M_test in zip(Ms_train, M_tests):
+        M_train = M_train.toarray()
+        assert numpy.array_equal(M_train + M_test, M)
+        assert (M_train.sum(axis=0) > 0).all() and (M_train.sum(axis=1) > 0).all()
+
+@pytest.mark.parametrize('fold_method', FOLD_METHODS)
+def test_folds_too_few_entries(fold_method):
+    ''' With fewer entries than folds left after the reservation, we should fail. '''
+    for M in [numpy.eye(6), numpy.eye(6) + numpy.eye(6, k=1)]:
+        with pytest.raises(AssertionError):
+            fold_method(I=6, J=6, no_folds=10, M=M)
+
+@pytest.mark.parametrize('full', [True, False])
+def test_generate_M_rows_columns(full):
+    ''' M_train and M_test should split M, with one reserved entry per row (or
+        column) and int(I*J*(1-fraction)) more in M_train. '''
+    I, J, fraction = 40, 30, 0.8
+    M = numpy.ones((I,J)) if full else random_mask(I, J, 0.5, seed=1)
+    M[numpy.arange(I), numpy.arange(I) % J] = 1.
+    M[numpy.arange(J) % I, numpy.arange(J)] = 1.
+    numpy.random.seed(2)
+    for generate, axis, no_reserved in [(generate_M_rows, 1, I), (generate_M_columns, 0, J)]:
+        M_train, M_test = [mask.toarray() for mask in generate(I=I, J=J, fraction=fraction, M=M)]
+        assert numpy.array_equal(M_train + M_test, M)
+        assert (M_train.sum(axis=axis) > 0).all()
+        assert M_train.sum() == min(no_reserved + int(I*J*(1-fraction)), M.sum())
@@ -0,0 +1,76 @@
+'''
+Tests for the ResultCache of code/cross_validation/result_cache.py: the keys
+of the tasks should be stable, and only depend on what identifies the task.
+'''
+
+import sys, os
+project_location = os.path.dirname(__file__)+"/../../"
+sys.path.append(project_location)
+
+from BMF_Priors.code.cross_validation.mask import IndexMask
+from BMF_Priors.code.cross_validation.result_cache import ResultCache, run_model_cached
+from BMF_Priors.code.models.bmf_gaussian_gaussian import BMF_Gaussian_Gaussian
+
+import numpy
+
+I, J = 6, 5
+R = numpy.arange(I*J, dtype=float).reshape(I,J) / 10.
+M_train = numpy.array([[(i + j) % 3 != 0 for j in range(J)] for i in range(I)], dtype=float)
+M_test = 1. - M_train
+PARAMETERS = { 'K': 2, 'hyperparameters': { 'alpha': 1., 'beta': 1., 'lamb': 0.1 } }
+TRAIN_CONFIG = { 'init': 'random', 'iterations': 5 }
+PREDICT_CONFIG = { 'burn_in': 2, 'thinning': 1 }
+
+# The key of the task above, with seed 0; if this changes, all cached results are lost
+KEY = 'c7fbb7f06b8716fc62a0b216c018b3847121cdf2'
+
+
+def key(cache, **changes):
+    ''' Return the key of the task above, with the given arguments changed. '''
+    arguments = dict(method=BMF_Gaussian_Gaussian, R=R, train=M_train, test=M_test, parameters=PARAMETERS,
+                     train_config=TRAIN_CONFIG, predict_config=PREDICT_CONFIG, seed=0)
+    arguments.update(changes)
+    return cache.key(**arguments)
+
+
+def test_key_stable(tmpdir):
+    ''' The key should not change between runs or versions. '''
+    assert key(ResultCache(str(tmpdir))) == KEY
+
+def test_key_same_task(tmpdir):
+    ''' The key should not depend on how the task is given. '''
+    cache = ResultCache(str(tmpdir))
+    M_train_index, M_test_index = [IndexMask((I,J), *numpy.nonzero(M)) for M in [M_train, M_test]]
+    parameters_reordered = { 'hyperparameters': { 'lamb': 0.1, 'beta': 1., 'alpha': 1. }, 'K': 2 }
+    assert key(cache, train=M_train_index, test=M_test_index) == KEY
+    assert key(cache, parameters=parameters_reordered) == KEY
+    assert key(cache, R=R.tolist()) == KEY
+    assert key(cache, R=numpy.asfortranarray(R)) == KEY
+
+def test_key_different_task(tmpdir):
+    ''' Changing anything that identifies the task should change the key. '''
+    cache = ResultCache(str(tmpdir))
+    R_changed = R.copy()
+    R_changed[0,0] += 1.
+    changes = [
+        { 'R': R_changed },
+        { 'train': M_test, 'test': M_train },
+        { 'parameters': dict(PARAMETERS, K=3) },
+        { 'train_config': dict(TRAIN_CONFIG, iterations=6) },
+        { 'predict_config': dict(PREDICT_CONFIG, burn_in=3) },
+        { 'seed': 1 },
+        { 'seed': None },
+    ]
+    keys = [key(cache, **change) for change in changes]
+    assert KEY not in keys and len(set(keys)) == len(keys)
+
+def test_run_model_cached(tmpdir):
+    ''' The second run should return the stored performances, and store the posterior if asked. '''
+    cache = ResultCache(str(tmpdir), store_posterior=True)
+    run = lambda: run_model_cached(cache, BMF_Gaussian_Gaussian, R, M_train, M_test, PARAMETERS, TRAIN_CONFIG, PREDICT_CONFIG, seed=0)
+    performances = run()
+    assert cache.get(KEY) == performances
+    U, V = cache.get_posterior(KEY)
+    assert U.shape == (I, 2) and V.shape == (J, 2)
+    cache.put(KEY, { 'MSE': -1. })
+    assert run() == { 'MSE': -1. }